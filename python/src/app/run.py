@@ -1,5 +1,6 @@
-import json, http.client, asyncio
+import json, http.client, asyncio, argparse
 from utils_test_manager import TestRunManager
+from utils_sweep import SweepRunner
 
 def run_chat():
   headers = {
@@ -36,7 +37,14 @@ def run_chat():
 
 if __name__ == "__main__":
     # run_chat()
-
-    test_runner = TestRunManager()
-    asyncio.run(test_runner.run_multiple_test_cases())
+    parser = argparse.ArgumentParser(description="MCP Tool Router test runner")
+    parser.add_argument("--sweep", action="store_true", help="Replay the [Sweep] configuration grid against cached candidates instead of a test run")
+    parser.add_argument("--refresh-candidates", action="store_true", help="Retrieve the sweep candidates again instead of using the cache file")
+    args = parser.parse_args()
+
+    if args.sweep:
+        asyncio.run(SweepRunner().run_sweep(refresh=args.refresh_candidates))
+    else:
+        test_runner = TestRunManager()
+        asyncio.run(test_runner.run_multiple_test_cases())
     
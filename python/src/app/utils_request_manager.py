@@ -9,9 +9,12 @@ class RequestHandler:
             'content-type': 'application/json'
         }       
 
-    def route_request(self, query: str, url: str, top_k: int = 10) -> str:
+    def route_request(self, query: str, url: str, top_k: int = 10, context: dict = None) -> str:
         self.conn = http.client.HTTPConnection("localhost", 8000)
-        payload = json.dumps({'query': query, 'top_k': top_k})
+        body = {'query': query, 'top_k': top_k}
+        if context is not None:
+            body['context'] = context
+        payload = json.dumps(body)
 
         try:
             self.conn.request("PUT", url, payload, self.headers)
@@ -0,0 +1,171 @@
+import configparser, itertools, json, os, time
+from datetime import datetime
+from typing import List, Dict, Any
+import numpy as np
+from utils_metrics import MetricsCalculator
+from utils_request_manager import RequestHandler
+from tabulate import tabulate
+
+
+class SweepRunner:
+    """
+    Offline configuration sweeps. Candidates are retrieved from the router once per test case and swept depth and cached to disk,
+    then any grid of thresholds, cut-offs and context boosts is replayed against the cache without calling the services.
+    Every swept setting maps to a config key: minimum_reranker_score and context_server_boost to MINIMUM_RERANKER_SCORE and
+    CONTEXT_SERVER_BOOST in the server's [ToolRouter] section, tools_to_return to TOOLS_TO_RETURN in [TestRun].
+    """
+
+    def __init__(self, request_handler=None):
+        """Initialize the SweepRunner with the app configuration."""
+        self.request_handler = request_handler if request_handler is not None else RequestHandler()
+        self.config = configparser.ConfigParser()
+        self.config.read('python/src/app/data/config.ini')
+        self.metrics_calculator = MetricsCalculator(self.config)
+
+        self.candidate_cache_file = self.config.get('Sweep', 'CANDIDATE_CACHE_FILE', fallback='python/src/app/data/sweep_candidates.json')
+        self.results_file = self.config.get('Sweep', 'SWEEP_RESULTS_FILE', fallback='python/src/app/data/sweep_results.json')
+
+    def _grid_values(self, key: str, fallback: str) -> List[float]:
+        """Read a comma-separated list of numbers from the [Sweep] section."""
+        return [float(v) for v in self.config.get('Sweep', key, fallback=fallback).split(',') if v.strip()]
+
+    def retrieve_candidates(self, depths: List[int], refresh: bool = False) -> List[Dict[str, Any]]:
+        """
+        Retrieve the scored candidates for every test case at every depth, or load them from the cache file.
+        The router searches and reranks top_k candidates, so each depth is retrieved on its own rather than cut
+        from a deeper retrieval, which would rerank a different candidate pool than live routing.
+        Args:
+            depths (List[int]): The candidate depths, i.e. the swept tools_to_return values.
+            refresh (bool): Retrieve again even if the cache file exists.
+        Returns:
+            List[Dict[str, Any]]: One entry per test case with its question, expected tools and candidates by depth.
+        """
+        test_case_file = self.config.get('TestRun', 'TEST_CASE_FILE', fallback='python/src/app/data/test_cases_simple_100_M365.json')
+        use_structured_context = self.config.getboolean('TestRun', 'USE_STRUCTURED_CONTEXT', fallback=False)
+        if not refresh and os.path.exists(self.candidate_cache_file):
+            with open(self.candidate_cache_file, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+            if cache.get('test_case_file') == test_case_file and cache.get('depths') == depths and cache.get('use_structured_context') == use_structured_context:
+                print(f"Loaded candidates for {len(cache['cases'])} test cases from {self.candidate_cache_file}")
+                return cache['cases']
+
+        with open(test_case_file, 'r', encoding='utf-8') as file:
+            raw_tests = json.load(file)
+
+        cases = []
+        start_time = time.time()
+        for index, test in enumerate(raw_tests, start=1):
+            current_application = test['expected_tools'][0].split('.')[0]
+            candidates_by_depth = {}
+            for depth in depths:
+                if use_structured_context:
+                    response = self.request_handler.route_request(query=test['question'], url="/get_candidates/", top_k=depth, context={"current_application": current_application})
+                else:
+                    response = self.request_handler.route_request(query=f"Current application: {current_application}. {test['question']}", url="/get_candidates/", top_k=depth)
+                candidates = json.loads(response).get('candidates') if response else None
+                if candidates is None:
+                    break
+                candidates_by_depth[str(depth)] = candidates
+            if len(candidates_by_depth) < len(depths):
+                print(f"Error: No candidates received for test case #{index}: {test['question']}")
+                continue
+            cases.append({
+                "question": test['question'],
+                "current_application": current_application,
+                "expected_tools": test['expected_tools'],
+                "candidates": candidates_by_depth
+            })
+
+        with open(self.candidate_cache_file, 'w', encoding='utf-8') as f:
+            json.dump({
+                "created_at": datetime.now().isoformat(),
+                "test_case_file": test_case_file,
+                "depths": depths,
+                "use_structured_context": use_structured_context,
+                "cases": cases
+            }, f, ensure_ascii=False)
+        print(f"Retrieved candidates for {len(cases)} test cases in {round(time.time() - start_time, 2)} seconds. Saved to {self.candidate_cache_file}")
+        return cases
+
+    def select_tools(self, case: Dict[str, Any], settings: Dict[str, float]) -> List[Dict[str, Any]]:
+        """
+        Replay the router's selection for one test case under the given settings, on the candidates retrieved at tools_to_return.
+        Args:
+            case (Dict[str, Any]): A cached test case with candidates by depth.
+            settings (Dict[str, float]): minimum_reranker_score, tools_to_return and context_server_boost.
+        Returns:
+            List[Dict[str, Any]]: The selected tools in rank order.
+        """
+        selected = []
+        for candidate in case['candidates'][str(int(settings['tools_to_return']))]:
+            reranker_score = candidate.get('reranker_score') or 0.0
+            if candidate.get('server', '').lower() == case['current_application'].lower():
+                reranker_score += settings['context_server_boost']
+            if reranker_score < settings['minimum_reranker_score']:
+                continue
+            selected.append({"server": candidate['server'], "name": candidate['name'], "desc": candidate.get('description', ''), "score": reranker_score})
+        selected.sort(key=lambda tool: tool['score'], reverse=True)
+        return selected[:int(settings['tools_to_return'])]
+
+    async def evaluate(self, cases: List[Dict[str, Any]], settings: Dict[str, float]) -> Dict[str, float]:
+        """
+        Compute the batch metrics for one setting over every cached test case.
+        Redundancy is left out, because it needs an embedding call per test case.
+        """
+        precision, recall, average_precision, ndcg, returned = [], [], [], [], []
+        matches, top_1, top_3 = 0, 0, 0
+        for case in cases:
+            selected = self.select_tools(case, settings)
+            expected = case['expected_tools']
+            names = [f"{tool['server']}.{tool['name']}" for tool in selected]
+            precision.append(await self.metrics_calculator.precision_at_k(selected, expected, 10))
+            recall.append(await self.metrics_calculator.recall_at_k(selected, expected, 10))
+            average_precision.append(await self.metrics_calculator.average_precision(selected, expected, 10))
+            ndcg.append(await self.metrics_calculator.net_discounted_gain_at_k(selected, expected, len(selected)))
+            returned.append(len(selected))
+            matches += any(name in expected for name in names)
+            top_1 += any(name in expected for name in names[:1])
+            top_3 += any(name in expected for name in names[:3])
+        count = len(cases) or 1
+        return {
+            **settings,
+            "precision_at_k": float(np.mean(precision)) if precision else 0.0,
+            "recall_at_k": float(np.mean(recall)) if recall else 0.0,
+            "average_precision": float(np.mean(average_precision)) if average_precision else 0.0,
+            "ndcg_at_k": float(np.mean(ndcg)) if ndcg else 0.0,
+            "match_rate": matches / count,
+            "top_1_rate": top_1 / count,
+            "top_3_rate": top_3 / count,
+            "mean_tools_returned": float(np.mean(returned)) if returned else 0.0
+        }
+
+    async def run_sweep(self, refresh: bool = False) -> List[Dict[str, float]]:
+        """
+        Retrieve or load the candidates, replay the grid from the [Sweep] section and print the best settings.
+        Args:
+            refresh (bool): Retrieve candidates again even if the cache file exists.
+        Returns:
+            List[Dict[str, float]]: Metrics per setting, best nDCG first.
+        """
+        grid = {
+            "minimum_reranker_score": self._grid_values('MINIMUM_RERANKER_SCORES', '0.5,1.0,1.1,1.5,2.0'),
+            "tools_to_return": self._grid_values('TOOLS_TO_RETURN', '3,5,10'),
+            "context_server_boost": self._grid_values('CONTEXT_SERVER_BOOSTS', '0.0,0.3')
+        }
+        cases = self.retrieve_candidates(sorted({int(depth) for depth in grid["tools_to_return"]}), refresh=refresh)
+
+        start_time = time.time()
+        results = []
+        for values in itertools.product(*grid.values()):
+            results.append(await self.evaluate(cases, dict(zip(grid.keys(), values))))
+        results.sort(key=lambda r: (r['ndcg_at_k'], r['recall_at_k']), reverse=True)
+
+        with open(self.results_file, 'w', encoding='utf-8') as f:
+            json.dump({"created_at": datetime.now().isoformat(), "test_cases": len(cases), "grid": grid, "results": results}, f, indent=4)
+
+        print("\n====CONFIGURATION SWEEP====")
+        print(f"Replayed {len(results)} settings over {len(cases)} test cases in {round(time.time() - start_time, 2)} seconds")
+        print(f"Results saved to: {self.results_file}\n")
+        columns = list(grid.keys()) + ["ndcg_at_k", "recall_at_k", "precision_at_k", "match_rate", "top_1_rate", "mean_tools_returned"]
+        print(tabulate([[f"{r[c]:.3g}" for c in columns] for r in results[:10]], headers=columns, tablefmt="github"))
+        return results
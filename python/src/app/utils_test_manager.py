@@ -53,12 +53,22 @@ class TestRunManager:
         print(f"Running test case #{index}: {test_case.question}")
 
         # Adding app criteria to the query as an example of user context. Assuming server name and app name are the same.
-        query = f"Current application: {test_case.expected_tools[0].split('.')[0]}. {test_case.question}"
-        results_json = self.request_handler.route_request(
-            query=query,
-            url="/get_mcp_tools/",
-            top_k=self.config.getint('TestRun', 'TOOLS_TO_RETURN', fallback=10)
-        )
+        current_application = test_case.expected_tools[0].split('.')[0]
+        query = f"Current application: {current_application}. {test_case.question}"
+        if self.config.getboolean('TestRun', 'USE_STRUCTURED_CONTEXT', fallback=False):
+            # Send the app as structured context, so the router embeds only the question
+            results_json = self.request_handler.route_request(
+                query=test_case.question,
+                url="/get_mcp_tools/",
+                top_k=self.config.getint('TestRun', 'TOOLS_TO_RETURN', fallback=10),
+                context={"current_application": current_application}
+            )
+        else:
+            results_json = self.request_handler.route_request(
+                query=query,
+                url="/get_mcp_tools/",
+                top_k=self.config.getint('TestRun', 'TOOLS_TO_RETURN', fallback=10)
+            )
 
         if results_json is not None and results_json != "":
             results_json = json.loads(results_json)
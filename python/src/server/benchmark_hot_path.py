@@ -0,0 +1,267 @@
+import os, sys, json, time, asyncio, logging, argparse, platform, random
+import numpy as np
+from datetime import datetime
+from typing import List, Dict, Any, Callable, Awaitable
+from starlette.requests import Request
+from utils_resilience import CircuitBreaker
+from utils_local_index import LocalToolIndex
+from utils_compact import compact_tools
+from utils_azure_search import AzureSearchManager, create_registry_documents
+import run
+
+DEFAULT_BASELINE_FILE = "python/src/server/data/benchmark_baseline.json"
+
+
+class FakeSearchClient():
+    """Stands in for the Azure SearchClient, returning canned result documents without any network call."""
+
+    def __init__(self, results: List[Dict[str, Any]]):
+        self.results = results
+
+    def search(self, **kwargs) -> List[Dict[str, Any]]:
+        return self.results[:kwargs.get('top', len(self.results))]
+
+
+class FakeAzureSearchManager(AzureSearchManager):
+    """AzureSearchManager with its Azure clients replaced by canned responses. The request-building code is the real one."""
+
+    def __init__(self, results: List[Dict[str, Any]], dimensions: int = 1536):
+        self.type = "remote"
+        self.azure_embedding_dimensions = dimensions
+        self.embedding_provider = None
+        self.embedding_flight = None
+        self.embedding_breaker = CircuitBreaker("embedding")
+        self.background_embedding_breaker = CircuitBreaker("embedding_background")
+        self.search_breaker = CircuitBreaker("azure_search")
+        self.azure_search_client = FakeSearchClient(results)
+        self.query_vector = np.random.default_rng(0).standard_normal(dimensions).astype(np.float32).tolist()
+
+    async def create_text_embedding(self, text, timeout: float = None) -> List[float]:
+        return self.query_vector
+
+
+def load_payloads(registry_path: str, test_case_path: str, result_count: int = 50) -> Dict[str, Any]:
+    """
+    Build realistic payloads from the bundled data files.
+    Args:
+        registry_path (str): The MCP server registry.
+        test_case_path (str): A test case file, for query texts.
+        result_count (int): The number of search results per query, as returned for MAX_TOOLS_TO_RETURN-sized requests.
+    Returns:
+        Dict[str, Any]: Tool documents, search results with reranker scores, queries and allowed tool ids.
+    """
+    with open(registry_path, 'r', encoding='utf-8') as f:
+        documents = [doc for server in json.load(f).get("servers", []) for doc in create_registry_documents(server)]
+    with open(test_case_path, 'r', encoding='utf-8') as f:
+        queries = [f"Current application: {test['expected_tools'][0].split('.')[0]}. {test['question']}" for test in json.load(f) if test.get('expected_tools')]
+
+    rng = random.Random(0)
+    for i, doc in enumerate(documents):
+        doc["id"] = f"tool-{i:05d}"
+    sample = rng.sample(documents, min(result_count, len(documents)))
+    results = [{
+        "id": doc["id"],
+        "server": doc["server"],
+        "toolset": doc["toolset"],
+        "name": doc["name"],
+        "description": doc["description"],
+        "@search.score": rng.uniform(0.01, 0.05),
+        "@search.reranker_score": rng.uniform(0.5, 3.5)
+    } for doc in sample]
+    return {
+        "documents": documents,
+        "results": results,
+        "queries": queries,
+        "allowed_tools": [doc["id"] for doc in documents[:100]],
+        "servers": list(dict.fromkeys(doc["server"] for doc in sample))[:3]
+    }
+
+
+def make_request(body: Dict[str, Any]) -> Request:
+    """Build a Starlette request carrying a JSON body, as the endpoints receive it."""
+    payload = json.dumps(body).encode('utf-8')
+
+    async def receive():
+        return {"type": "http.request", "body": payload, "more_body": False}
+    return Request({"type": "http", "method": "PUT", "path": "/get_mcp_tools/", "headers": [(b"authorization", b"Bearer None")]}, receive)
+
+
+async def measure(func: Callable[[], Awaitable[Any]], iterations: int, warmup: int = 20) -> Dict[str, float]:
+    """
+    Time an async callable.
+    Args:
+        func (Callable[[], Awaitable[Any]]): The code under test.
+        iterations (int): Timed calls.
+        warmup (int): Untimed calls made first.
+    Returns:
+        Dict[str, float]: Latency statistics in microseconds.
+    """
+    for _ in range(warmup):
+        await func()
+    timings = np.zeros(iterations)
+    for i in range(iterations):
+        start_time = time.perf_counter()
+        await func()
+        timings[i] = time.perf_counter() - start_time
+    timings *= 1e6
+    return {
+        "iterations": iterations,
+        "mean_us": float(timings.mean()),
+        "p50_us": float(np.percentile(timings, 50)),
+        "p95_us": float(np.percentile(timings, 95)),
+        "min_us": float(timings.min())
+    }
+
+
+async def run_benchmarks(payloads: Dict[str, Any], iterations: int = 500, selected: List[str] = None) -> Dict[str, Dict[str, float]]:
+    """
+    Run the hot path benchmarks against fake backends.
+    Args:
+        payloads (Dict[str, Any]): Payloads from load_payloads.
+        iterations (int): Timed calls per benchmark.
+        selected (List[str]): Optional benchmark names to run. Runs all by default.
+    Returns:
+        Dict[str, Dict[str, float]]: Statistics per benchmark.
+    """
+    results = payloads["results"]
+    queries = payloads["queries"]
+    manager = FakeAzureSearchManager(results)
+    router = run.ToolRouter(azure_search_manager=manager)
+    router.semantic_cache = None
+    router.latency_budget_ms = 0
+    router.context_server_boost = 0.3
+
+    # Local index of the full registry with random vectors, for the search and compaction paths
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((len(payloads["documents"]), manager.azure_embedding_dimensions)).astype(np.float32)
+    local_index = LocalToolIndex.from_arrays({
+        "ids": [doc["id"] for doc in payloads["documents"]],
+        "servers": [doc["server"] for doc in payloads["documents"]],
+        "toolsets": [doc["toolset"] for doc in payloads["documents"]],
+        "names": [doc["name"] for doc in payloads["documents"]],
+        "descriptions": [doc["description"] for doc in payloads["documents"]]
+    }, LocalToolIndex._normalize_rows(vectors))
+    router.local_index = local_index
+    scores = [r["@search.reranker_score"] for r in results]
+    tools = run.create_tools_from_results(results, score_field='@search.reranker_score')
+    tool_vectors = {tool.id: local_index.vectors[local_index.id_to_row[tool.id]] for tool in tools}
+    counter = iter(range(10 ** 9))
+
+    def next_query() -> str:
+        return queries[next(counter) % len(queries)]
+
+    async def route():
+        await router.route(query=next_query(), top_k=10)
+
+    async def route_with_context():
+        await router.route(query=next_query(), top_k=10, context={"current_application": results[0]["server"], "allowed_servers": payloads["servers"]})
+
+    async def tool_construction():
+        run.create_tools_from_results(results, score_field='@search.reranker_score')
+
+    async def normalize_scores():
+        await router.normalize_NNB_scores(scores)
+
+    async def build_filter():
+        manager.build_search_filter(allowed_tools=payloads["allowed_tools"], servers=payloads["servers"])
+
+    async def perform_search():
+        await manager.perform_azure_search(search_text=next_query(), top_k=50, allowed_tools=payloads["allowed_tools"], vector=manager.query_vector)
+
+    async def local_search():
+        local_index.search(manager.query_vector, top_k=10)
+
+    async def compact_response():
+        compact_tools(tools[:10], max_tokens=400, description_mode="short", vectors=tool_vectors, duplicate_threshold=0.97)
+
+    request_body = {"query": queries[0], "top_k": 10, "allowed_tools": [], "routing_mode": "flat"}
+
+    async def endpoint_get_mcp_tools():
+        await run.get_mcp_tools(make_request(request_body))
+
+    benchmarks = {
+        "route": route,
+        "route_with_context": route_with_context,
+        "tool_construction": tool_construction,
+        "normalize_NNB_scores": normalize_scores,
+        "build_search_filter": build_filter,
+        "perform_azure_search": perform_search,
+        "local_index_search": local_search,
+        "compact_tools": compact_response,
+        "endpoint_get_mcp_tools": endpoint_get_mcp_tools
+    }
+    run.router_instance = router
+    stats = {}
+    for name, func in benchmarks.items():
+        if selected and name not in selected:
+            continue
+        stats[name] = await measure(func, iterations)
+        logging.info(f"{name}: p50 {stats[name]['p50_us']:.1f} us, p95 {stats[name]['p95_us']:.1f} us")
+    return stats
+
+
+def compare_to_baseline(stats: Dict[str, Dict[str, float]], baseline: Dict[str, Any], tolerance: float = 0.25) -> List[Dict[str, Any]]:
+    """
+    Compare median latencies against a stored baseline.
+    Args:
+        stats (Dict[str, Dict[str, float]]): Current statistics per benchmark.
+        baseline (Dict[str, Any]): A results file written by an earlier run.
+        tolerance (float): The allowed slowdown, e.g. 0.25 for 25%.
+    Returns:
+        List[Dict[str, Any]]: One comparison per benchmark present in both, flagged when it regressed.
+    """
+    comparisons = []
+    for name, current in stats.items():
+        previous = baseline.get("benchmarks", {}).get(name)
+        if previous is None:
+            continue
+        ratio = current["p50_us"] / previous["p50_us"] if previous["p50_us"] else 1.0
+        comparisons.append({
+            "benchmark": name,
+            "baseline_p50_us": previous["p50_us"],
+            "p50_us": current["p50_us"],
+            "ratio": ratio,
+            "regressed": ratio > 1 + tolerance
+        })
+    return comparisons
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the routing hot path, run against fake backends")
+    parser.add_argument("--registry", default="python/src/server/data/mcp_servers.json")
+    parser.add_argument("--test-cases", default="python/src/app/data/test_cases_complex_175.json")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--only", nargs="*", help="Benchmark names to run")
+    parser.add_argument("--output", help="File to write the results JSON to")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_FILE, help="Stored results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p50 slowdown before a benchmark counts as regressed")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    stats = asyncio.run(run_benchmarks(load_payloads(args.registry, args.test_cases), iterations=args.iterations, selected=args.only))
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "iterations": args.iterations,
+        "benchmarks": stats
+    }
+
+    regressions = []
+    if not args.save_baseline and args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            report["comparison"] = compare_to_baseline(stats, json.load(f), args.tolerance)
+        regressions = [c["benchmark"] for c in report["comparison"] if c["regressed"]]
+
+    print(json.dumps(report, indent=4))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
+        logging.info(f"Saved baseline to '{args.baseline}'.")
+    if regressions:
+        sys.exit(f"Regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
@@ -0,0 +1,155 @@
+import os, sys, json, time, glob, asyncio, logging, argparse
+import numpy as np
+from typing import List, Dict, Any
+from utils_local_index import LocalToolIndex
+from utils_snapshot import read_snapshot
+
+
+def load_index(file_path: str) -> LocalToolIndex:
+    """Load a local tool index from a binary snapshot or a JSON index file."""
+    if file_path.endswith('.json'):
+        return LocalToolIndex.load_from_file(file_path)
+    return read_snapshot(file_path)
+
+
+def load_test_cases(file_paths: List[str]) -> List[Dict[str, Any]]:
+    """
+    Load the app's test cases and phrase each question the way the test runner sends it to the router.
+    Args:
+        file_paths (List[str]): Test case JSON files.
+    Returns:
+        List[Dict[str, Any]]: Test cases with the routed query and expected "Server.Tool" names.
+    """
+    test_cases = []
+    for file_path in file_paths:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for test in json.load(f):
+                if not test.get('expected_tools'):
+                    continue
+                test_cases.append({
+                    "suite": os.path.basename(file_path),
+                    "query": f"Current application: {test['expected_tools'][0].split('.')[0]}. {test['question']}",
+                    "expected_tools": test['expected_tools']
+                })
+    return test_cases
+
+
+async def embed_queries(queries: List[str], cache_path: str = None, max_concurrent_embeddings: int = 16) -> Dict[str, List[float]]:
+    """
+    Embed the benchmark queries, reusing embeddings saved by earlier runs so repeated sweeps do not call Azure OpenAI.
+    Args:
+        queries (List[str]): The queries.
+        cache_path (str): Optional JSON file of saved embeddings, updated with any new ones.
+        max_concurrent_embeddings (int): Embedding requests in flight at the same time, as for an index build.
+    Returns:
+        Dict[str, List[float]]: Embeddings by query. Queries that could not be embedded are left out.
+    """
+    embeddings = {}
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            embeddings = json.load(f)
+
+    missing = [q for q in dict.fromkeys(queries) if q not in embeddings]
+    if missing:
+        from utils_azure_search import AzureSearchManager
+        azure_search_manager = AzureSearchManager()
+        semaphore = asyncio.Semaphore(max(max_concurrent_embeddings, 1))
+        vectors = await asyncio.gather(*[azure_search_manager.create_background_embedding(q, semaphore) for q in missing])
+        azure_search_manager.close()
+        embeddings.update({q: v for q, v in zip(missing, vectors) if v is not None})
+        if cache_path:
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                json.dump(embeddings, f)
+    return embeddings
+
+
+def run_benchmark(index: LocalToolIndex, test_cases: List[Dict[str, Any]], embeddings: Dict[str, List[float]],
+                  prefix_dims_list: List[int], shortlist_sizes: List[int], top_k: int = 10) -> Dict[str, Any]:
+    """
+    Compare two-stage search against exact full-dimension search for every prefix and shortlist size.
+    Args:
+        index (LocalToolIndex): The local tool index.
+        test_cases (List[Dict[str, Any]]): Test cases from load_test_cases.
+        embeddings (Dict[str, List[float]]): Query embeddings.
+        prefix_dims_list (List[int]): Prefix dimensions to try.
+        shortlist_sizes (List[int]): Shortlist sizes to try.
+        top_k (int): The number of tools returned per query.
+    Returns:
+        Dict[str, Any]: The exact-search baseline and one result row per configuration.
+    """
+    test_cases = [test for test in test_cases if test["query"] in embeddings]
+    dimensions = index.vectors.shape[1]
+
+    def evaluate(exact: bool) -> Dict[str, Any]:
+        returned, latencies = [], []
+        for test in test_cases:
+            start_time = time.perf_counter()
+            tools = index.search(embeddings[test["query"]], top_k=top_k, exact=exact)
+            latencies.append(time.perf_counter() - start_time)
+            returned.append([tool.id for tool in tools])
+        names = {tool_id: f"{index.servers[row]}.{index.names[row]}" for tool_id, row in index.id_to_row.items()}
+        hits = [any(names[tool_id] in test["expected_tools"] for tool_id in ids) for test, ids in zip(test_cases, returned)]
+        return {"returned": returned, "hit_rate": float(np.mean(hits)) if hits else 0.0, "mean_latency_ms": float(np.mean(latencies) * 1000) if latencies else 0.0}
+
+    index.enable_two_stage(prefix_dims=0)
+    baseline = evaluate(exact=True)
+    results = []
+    for prefix_dims in prefix_dims_list:
+        for shortlist_size in shortlist_sizes:
+            index.enable_two_stage(prefix_dims=prefix_dims, shortlist_size=shortlist_size)
+            if index.prefix_vectors is None:
+                logging.warning(f"Skipping prefix of {prefix_dims} dimensions for a {dimensions}-dimension index.")
+                continue
+            two_stage = evaluate(exact=False)
+            overlap = [len(set(a) & set(b)) / len(b) if b else 1.0 for a, b in zip(two_stage["returned"], baseline["returned"])]
+            shortlist = min(max(shortlist_size, top_k), len(index))
+            results.append({
+                "prefix_dims": prefix_dims,
+                "shortlist_size": shortlist_size,
+                f"recall_at_{top_k}_vs_exact": float(np.mean(overlap)) if overlap else 0.0,
+                "hit_rate": two_stage["hit_rate"],
+                "hit_rate_change": two_stage["hit_rate"] - baseline["hit_rate"],
+                "mean_latency_ms": two_stage["mean_latency_ms"],
+                # Vector bytes read per unfiltered query, relative to the exact full-dimension scan
+                "bytes_scanned_ratio": (len(index) * prefix_dims + shortlist * dimensions) / (len(index) * dimensions)
+            })
+    index.enable_two_stage(prefix_dims=0)
+
+    return {
+        "tool_count": len(index),
+        "dimensions": dimensions,
+        "queries": len(test_cases),
+        "top_k": top_k,
+        "exact": {"hit_rate": baseline["hit_rate"], "mean_latency_ms": baseline["mean_latency_ms"]},
+        "two_stage": results
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the recall cost of two-stage prefix search on the bundled test suites")
+    parser.add_argument("--index", required=True, help="Binary snapshot or local tool index JSON")
+    parser.add_argument("--test-cases", nargs="*", default=sorted(glob.glob("python/src/app/data/test_cases_*.json")), help="Test case files")
+    parser.add_argument("--prefix-dims", default="64,128,256,512", help="Comma-separated prefix dimensions to try")
+    parser.add_argument("--shortlist", default="50,100,200", help="Comma-separated shortlist sizes to try")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--embeddings-cache", default="python/src/server/data/benchmark_query_embeddings.json", help="Saved query embeddings, reused across runs")
+    parser.add_argument("--output", help="Optional file to write the results JSON to")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    local_index = load_index(args.index)
+    if local_index is None:
+        sys.exit(f"Could not load '{args.index}'.")
+    test_cases = load_test_cases(args.test_cases)
+    embeddings = asyncio.run(embed_queries([test["query"] for test in test_cases], args.embeddings_cache))
+
+    results = run_benchmark(
+        local_index, test_cases, embeddings,
+        prefix_dims_list=[int(d) for d in args.prefix_dims.split(',') if d.strip()],
+        shortlist_sizes=[int(s) for s in args.shortlist.split(',') if s.strip()],
+        top_k=args.top_k
+    )
+    print(json.dumps(results, indent=4))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4)
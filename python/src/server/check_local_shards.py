@@ -0,0 +1,86 @@
+import os, sys, json, time, argparse, subprocess
+import httpx
+from typing import Dict, Any
+
+RUN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "run.py")
+
+
+def wait_until_ready(url: str, timeout: float) -> Dict[str, Any]:
+    """
+    Poll a server's readiness probe until it answers 200.
+    Args:
+        url (str): The server's base URL.
+        timeout (float): Seconds to wait.
+    Returns:
+        Dict[str, Any]: The last /readyz response, or an error description.
+    """
+    deadline = time.time() + timeout
+    last = {"status": "unreachable"}
+    while time.time() < deadline:
+        try:
+            response = httpx.get(f"{url}/readyz", timeout=2.0)
+            last = response.json()
+            if response.status_code == 200:
+                return last
+        except Exception as e:
+            last = {"status": "unreachable", "error": str(e)}
+        time.sleep(1.0)
+    return last
+
+
+def check_local_shards(local_shards: str, port: int, shard_base_port: int, query: str, timeout: float) -> bool:
+    """
+    Start a coordinator over local shard processes with --local-shards, wait until it reports ready,
+    route one query through it and check that every shard answered.
+    Args:
+        local_shards (str): '|'-separated server groups, one shard process each.
+        port (int): The coordinator's port.
+        shard_base_port (int): The first shard's port.
+        query (str): The query to route.
+        timeout (float): Seconds to wait for the coordinator to become ready.
+    Returns:
+        bool: True if the query was served by every shard.
+    """
+    url = f"http://127.0.0.1:{port}"
+    shard_count = len([group for group in local_shards.split('|') if group.strip()])
+    coordinator = subprocess.Popen([sys.executable, RUN_FILE, "--host", "127.0.0.1", "--port", str(port),
+                                    "--local-shards", local_shards, "--shard-base-port", str(shard_base_port)])
+    try:
+        readiness = wait_until_ready(url, timeout)
+        if readiness.get("status") != "ready":
+            print(f"FAIL: the coordinator was not ready after {timeout}s: {readiness}")
+            return False
+        print(f"Coordinator ready with {readiness.get('ready_shards')} of {shard_count} shards.")
+
+        response = httpx.put(f"{url}/get_mcp_tools/", json={"query": query, "top_k": 5}, timeout=30.0)
+        payload = response.json()
+        if response.status_code != 200 or not isinstance(payload, dict) or "kwargs" not in payload:
+            print(f"FAIL: /get_mcp_tools/ answered {response.status_code}: {payload}")
+            return False
+        shards = payload["kwargs"].get("shards", [])
+        print(json.dumps({"serving_mode": payload["kwargs"].get("serving_mode"), "partial": payload["kwargs"].get("partial"),
+                          "shards": shards, "tools": [f"{tool['server']}.{tool['name']}" for tool in payload.get("tools", [])]}, indent=4))
+        if payload["kwargs"].get("serving_mode") != "scatter_gather" or len(shards) != shard_count or any(shard["status"] != "ok" for shard in shards):
+            print("FAIL: not every shard answered.")
+            return False
+        print("OK")
+        return True
+    finally:
+        # The coordinator stops its shard processes on exit
+        coordinator.terminate()
+        try:
+            coordinator.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            coordinator.kill()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end check of a coordinator over local shard processes (run.py --local-shards)")
+    parser.add_argument("--local-shards", default="GitHub,Azure|VSCode,Notion", help="'|'-separated server groups, one shard process each")
+    parser.add_argument("--port", type=int, default=8100, help="Port of the coordinator")
+    parser.add_argument("--shard-base-port", type=int, default=8101, help="Port of the first shard process")
+    parser.add_argument("--query", default="Create a pull request on GitHub")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds to wait for the coordinator to become ready")
+    args = parser.parse_args()
+
+    sys.exit(0 if check_local_shards(args.local_shards, args.port, args.shard_base_port, args.query, args.timeout) else 1)
@@ -1,22 +1,60 @@
-import os, sys, logging, json, time, configparser, uuid
+import os, sys, logging, json, time, configparser, asyncio, argparse, atexit, hmac
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from dataclasses import asdict
 from datetime import datetime
 from utils_azure_search import AzureSearchManager
+from utils_cache import SemanticCache, SingleFlight
+from utils_local_index import LocalToolIndex
+from utils_snapshot import read_snapshot
+from utils_resilience import Deadline
+from utils_registry_watcher import RegistryWatcher
+from utils_compact import DESCRIPTION_MODES, compact_tools
+from utils_scatter_gather import ScatterGatherCoordinator, parse_shards, launch_local_shards
 from utils_objects import Server, Tool, ToolResults
-from typing import List, Dict, Any
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, AsyncIterator, Optional
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 import uvicorn
+import numpy as np
 
 
 # GLOBAL VARIABLES
-app = FastAPI()
 router_instance = None
 search_instance = None
+registry_watcher = None
+rebuild_task = None
+coordinator_instance = None
+# Shard processes started by --local-shards, stopped when the coordinator shuts down
+local_shard_processes = []
+startup_status = {"ready": False, "tokens_acquired": False, "warmup_queries": 0, "warmup_time": 0.0, "error": None}
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+def create_tools_from_results(result_list: List[Dict[str, Any]], score_field: str) -> List[Tool]:
+    """
+    Convert Azure Search result documents to Tool objects, skipping incomplete documents.
+    Args:
+        result_list (List[Dict[str, Any]]): The search result documents.
+        score_field (str): The result field holding the score, e.g. '@search.reranker_score'.
+    Returns:
+        List[Tool]: The tools, in result order.
+    """
+    return [Tool(
+        id=result.get('id'),
+        server=result.get('server', ''),
+        toolset=result.get('toolset', ''),
+        name=result.get('name', ''),
+        description=result.get('description', ''),
+        tool_vector=result.get('tool_vector', []),
+        score=result.get(score_field) or 0.0,
+    ) for result in result_list if result.get('id') and result.get('server') and result.get('name')]
+
 
 class ToolRouter:
     """High-performance MCP Tool Router"""
 
-    def __init__(self, token: str = None):
+    def __init__(self, token: str = None, azure_search_manager: AzureSearchManager = None):
 
         # Configuration variables from config.ini
         self.config = configparser.ConfigParser()
@@ -26,14 +64,210 @@ class ToolRouter:
         self.use_search_cache = self.config.getboolean('TestRun', 'USE_SEARCH_CACHE', fallback=False)
         self.minimum_tool_score = self.config.getfloat('ToolRouter', 'MINIMUM_TOOL_SCORE', fallback=0.5)
         self.minimum_reranker_score = self.config.getfloat('ToolRouter', 'MINIMUM_RERANKER_SCORE', fallback=1.1)
+        self.routing_mode = self.config.get('ToolRouter', 'ROUTING_MODE', fallback='flat')
+        self.hierarchy_top_servers = self.config.getint('ToolRouter', 'HIERARCHY_TOP_SERVERS', fallback=3)
+        self.local_index_file = self.config.get('ToolRouter', 'LOCAL_INDEX_FILE', fallback='python/src/server/data/local_tool_index.json')
+        self.shared_index_dir = os.environ.get('MCP_SHARED_INDEX_DIR') or self.config.get('ToolRouter', 'SHARED_INDEX_DIR', fallback='')
+        self.snapshot_file = self.config.get('ToolRouter', 'SNAPSHOT_FILE', fallback='')
+        self.verify_snapshot_checksum = self.config.getboolean('ToolRouter', 'VERIFY_SNAPSHOT_CHECKSUM', fallback=True)
+        self.use_semantic_cache = self.config.getboolean('ToolRouter', 'USE_SEMANTIC_CACHE', fallback=False)
+        self.semantic_cache_size = self.config.getint('ToolRouter', 'SEMANTIC_CACHE_SIZE', fallback=1024)
+        self.semantic_cache_threshold = self.config.getfloat('ToolRouter', 'SEMANTIC_CACHE_THRESHOLD', fallback=0.95)
+        self.fallback_cache_threshold = self.config.getfloat('ToolRouter', 'FALLBACK_CACHE_THRESHOLD', fallback=0.85)
+        self.latency_budget_ms = self.config.getint('ToolRouter', 'LATENCY_BUDGET_MS', fallback=0)
+        self.fallback_reserve = self.config.getint('ToolRouter', 'FALLBACK_RESERVE_MS', fallback=300) / 1000
+        self.two_stage_prefix_dims = self.config.getint('ToolRouter', 'TWO_STAGE_PREFIX_DIMS', fallback=0)
+        self.two_stage_shortlist = self.config.getint('ToolRouter', 'TWO_STAGE_SHORTLIST', fallback=100)
+        self.description_mode = self.config.get('ToolRouter', 'DESCRIPTION_MODE', fallback='full')
+        self.duplicate_threshold = self.config.getfloat('ToolRouter', 'DUPLICATE_THRESHOLD', fallback=0.97)
+        self.context_vector_weight = self.config.getfloat('ToolRouter', 'CONTEXT_VECTOR_WEIGHT', fallback=0.35)
+        self.context_server_boost = self.config.getfloat('ToolRouter', 'CONTEXT_SERVER_BOOST', fallback=0.3)
+        self.context_cache_size = self.config.getint('ToolRouter', 'CONTEXT_CACHE_SIZE', fallback=512)
+        self.watch_registry = self.config.get('ToolRouter', 'WATCH_REGISTRY', fallback='')
+        self.watch_interval = self.config.getfloat('ToolRouter', 'WATCH_INTERVAL_SECONDS', fallback=5.0)
+        self.sync_azure_index = self.config.getboolean('ToolRouter', 'SYNC_AZURE_INDEX', fallback=False)
+        self.use_single_flight = self.config.getboolean('ToolRouter', 'SINGLE_FLIGHT', fallback=True)
+        self.old_index_grace = self.config.getfloat('ToolRouter', 'OLD_INDEX_GRACE_SECONDS', fallback=30.0)
+        self.admin_endpoints = self.config.getboolean('ToolRouter', 'ADMIN_ENDPOINTS', fallback=False)
+        self.admin_token = self.config.get('ToolRouter', 'ADMIN_TOKEN', fallback='')
+        # Set by the launcher. Each worker switches indexes on its own, so some admin actions are unsafe with several.
+        self.workers = int(os.environ.get('MCP_WORKERS', 1))
+        self.adaptive_retrieval = self.config.getboolean('ToolRouter', 'ADAPTIVE_RETRIEVAL', fallback=False)
+        self.adaptive_initial_depth = self.config.getint('ToolRouter', 'ADAPTIVE_INITIAL_DEPTH', fallback=20)
+        self.adaptive_growth_factor = self.config.getint('ToolRouter', 'ADAPTIVE_GROWTH_FACTOR', fallback=4)
+        self.adaptive_min_results = self.config.getint('ToolRouter', 'ADAPTIVE_MIN_RESULTS', fallback=3)
+        self.skip_rerank_gap = self.config.getfloat('ToolRouter', 'SKIP_RERANK_GAP', fallback=0.1)
+        self.skip_rerank_min_score = self.config.getfloat('ToolRouter', 'SKIP_RERANK_MIN_SCORE', fallback=0.6)
+        # Servers this router serves when it runs as one shard behind a scatter-gather coordinator. Empty serves every server.
+        shard_servers = os.environ.get('MCP_SHARD_SERVERS') or self.config.get('ToolRouter', 'SHARD_SERVERS', fallback='')
+        self.shard_servers = [s.strip() for s in shard_servers.split(',') if s.strip()]
+
+        self.warmup_queries = [q.strip() for q in self.config.get('ToolRouter', 'WARMUP_QUERIES', fallback='').split('|') if q.strip()]
+        self.ready_on_degraded_startup = self.config.getboolean('ToolRouter', 'READY_ON_DEGRADED_STARTUP', fallback=False)
+        self.startup_retry_seconds = self.config.getfloat('ToolRouter', 'STARTUP_RETRY_SECONDS', fallback=10.0)
+
+        # Initialize the Azure Search Manager, sharing the caller's clients when provided
+        self.azure_search_manager = azure_search_manager if azure_search_manager is not None else AzureSearchManager()
+
+        # Load the local tool index holding the server and toolset centroids for hierarchical routing.
+        # Workers started by the multi-worker launcher attach to the copy it published instead of loading their own.
+        # A binary snapshot is memory-mapped, which is faster than parsing the JSON index and is shared between workers too.
+        self.local_index = LocalToolIndex.attach_shared(self.shared_index_dir) if self.shared_index_dir else None
+        if self.local_index is None and self.snapshot_file:
+            self.local_index = read_snapshot(self.snapshot_file, verify_checksum=self.verify_snapshot_checksum)
+        if self.local_index is None:
+            self.local_index = LocalToolIndex.load_from_file(self.local_index_file)
+        if self.local_index is not None:
+            self.prepare_local_index(self.local_index)
+
+        # Bumped on every index swap. Part of the cache scope, so results cached against an older index stop matching.
+        self.index_version = 1
+        if self.routing_mode == "hierarchical" and self.local_index is None:
+            logging.warning("Hierarchical routing requested but no local tool index is available. Falling back to flat routing.")
+
+        # Semantic result cache, so paraphrased queries skip Azure search and semantic reranking
+        self.semantic_cache = SemanticCache(
+            capacity=self.semantic_cache_size,
+            threshold=self.semantic_cache_threshold,
+            dimensions=self.azure_search_manager.azure_embedding_dimensions
+        ) if self.use_semantic_cache else None
+
+        # Embeddings of the application contexts seen so far. There are only a few hundred distinct contexts,
+        # so each is embedded once and reused by every query sent from that application.
+        self.context_vectors: "OrderedDict[str, List[float]]" = OrderedDict()
+
+        # Concurrent identical requests share one in-flight route, so a burst of the same query searches once
+        self.route_flight = SingleFlight("route") if self.use_single_flight else None
+
+        # Progress of the last blue/green rebuild, reported by /get_router_status
+        self.rebuild_status: Optional[Dict[str, Any]] = None
+
+        # Reranking work done by adaptive retrieval, against what fixed-depth retrieval would have done
+        self.retrieval_stats = {"requests": 0, "rerank_skipped": 0, "widened": 0, "candidates_reranked": 0, "fixed_depth_candidates": 0}
+
+    async def load_snapshot(self, file_path: str) -> bool:
+        """
+        Swap the local tool index for the one in a binary snapshot. The current index keeps serving if loading fails.
+        The snapshot is read and its checksum verified off the event loop.
+        Args:
+            file_path (str): The snapshot path.
+        Returns:
+            bool: True if the snapshot was loaded and swapped in.
+        """
+        local_index = await asyncio.to_thread(read_snapshot, file_path, self.verify_snapshot_checksum)
+        if local_index is None:
+            return False
+        self.swap_local_index(local_index)
+        self.snapshot_file = file_path
+        return True
 
-        # Initialize the Azure Search Manager
-        self.azure_search_manager = AzureSearchManager()
+    def swap_local_index(self, local_index: LocalToolIndex) -> int:
+        """
+        Atomically replace the local tool index. The new index is fully built before the swap, so readers see
+        either the old or the new index, never a partial one. Semantic cache entries from the previous version
+        stop matching and age out of the LRU.
+        Args:
+            local_index (LocalToolIndex): The fully built new index.
+        Returns:
+            int: The new index version.
+        """
+        self.prepare_local_index(local_index)
+        self.local_index = local_index
+        self.index_version += 1
+        return self.index_version
 
-        ####
-        # TODO: When local tools are implemented, initialize the LocalSearchManager
-        # First check if self.use_local_tools is True
-        ####
+    async def check_embedding_dimensions(self) -> Optional[str]:
+        """
+        Compare the embedding provider's vector size with the local tool index and the Azure Search vector field.
+        Vectors of different sizes cannot be compared, and after a provider switch they come from another model.
+        If the Azure Search schema cannot be read, e.g. during an outage, only the local index is checked.
+        Returns:
+            str: A description of the mismatch, or None if the dimensions agree.
+        """
+        dimensions = self.azure_search_manager.embedding_provider.dimensions
+        if self.local_index is not None and len(self.local_index) > 0 and self.local_index.vectors.shape[1] != dimensions:
+            return f"The local tool index has {self.local_index.vectors.shape[1]} dimensions but the {self.azure_search_manager.embedding_provider.name} embedding provider returns {dimensions}. Rebuild the index with the configured provider."
+        field_dimensions = await asyncio.to_thread(self.azure_search_manager.get_vector_field_dimensions)
+        if field_dimensions is not None and field_dimensions != dimensions:
+            return f"The Azure Search vector field has {field_dimensions} dimensions but the {self.azure_search_manager.embedding_provider.name} embedding provider returns {dimensions}. Recreate the index with the configured provider."
+        return None
+
+    def prepare_local_index(self, local_index: LocalToolIndex) -> None:
+        """Apply the configured search settings to a local tool index before it starts serving."""
+        if self.two_stage_prefix_dims > 0:
+            local_index.enable_two_stage(prefix_dims=self.two_stage_prefix_dims, shortlist_size=self.two_stage_shortlist)
+
+    async def rebuild_index(self, file_path: str, target: str = "azure", delete_old_index: bool = False) -> bool:
+        """
+        Blue/green rebuild from an MCP server registry. The registry is embedded and ingested into a fresh index
+        while the current one keeps serving, then the router switches to it in one step.
+        Tools keep the ids they have in the current local index, so allowed_tools lists stay valid.
+        Args:
+            file_path (str): The registry JSON file.
+            target (str): "azure" ingests into a new Azure Search index and switches searches to it. "local" only
+                rebuilds the local tool index, the stand-in used for hierarchical routing and degraded serving.
+            delete_old_index (bool): Delete the previous Azure Search index OLD_INDEX_GRACE_SECONDS after the switch.
+        Returns:
+            bool: True if the new index is serving. On failure the old index keeps serving.
+        """
+        start_time = time.time()
+        manager = self.azure_search_manager
+        self.rebuild_status = {"state": "embedding", "target": target, "registry": file_path, "index_name": None,
+                               "tool_count": 0, "started_at": datetime.now().isoformat(), "rebuild_time": None, "error": None}
+        search_client, index_name = None, None
+        try:
+            existing_ids = {key: self.local_index.ids[row] for row, key in enumerate(zip(self.local_index.servers, self.local_index.toolsets, self.local_index.names))} if self.local_index is not None else None
+            documents = await manager.build_tool_documents(file_path, existing_ids=existing_ids)
+            if not documents:
+                raise ValueError(f"No tools found in '{file_path}'")
+            missing = sum(1 for document in documents if not document.get("tool_vector"))
+            if missing:
+                raise RuntimeError(f"{missing} of {len(documents)} tools could not be embedded")
+            self.rebuild_status["tool_count"] = len(documents)
+            local_index = LocalToolIndex(documents)
+
+            if target == "azure":
+                base_name = self.config.get('AzureSearch', 'AZURE_SEARCH_INDEX_NAME', fallback=manager.azure_search_index_name)
+                index_name = f"{base_name}-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+                self.rebuild_status.update({"state": "ingesting", "index_name": index_name})
+                search_client = await asyncio.to_thread(manager.create_staging_index, index_name)
+                if search_client is None:
+                    raise RuntimeError(f"Could not create index '{index_name}'")
+                uploaded = await manager.run_document_batches(search_client.upload_documents, documents, label="Uploaded")
+                if uploaded < len(documents):
+                    raise RuntimeError(f"Only {uploaded} of {len(documents)} tools were uploaded")
+                # Uploads become searchable after a short refresh delay. Switching earlier would serve a partial index.
+                for _ in range(30):
+                    if await asyncio.to_thread(search_client.get_document_count) >= len(documents):
+                        break
+                    await asyncio.sleep(1)
+                else:
+                    raise RuntimeError(f"Index '{index_name}' did not report all {len(documents)} tools")
+            elif target != "local":
+                raise ValueError(f"Unknown rebuild target '{target}'. Use 'azure' or 'local'.")
+
+            # Switch both indexes together. The version bump retires cached results from the old index.
+            previous_client = manager.azure_search_client
+            previous_index_name = manager.switch_index(index_name, search_client) if target == "azure" else None
+            self.swap_local_index(local_index)
+            await asyncio.to_thread(local_index.save_to_file, self.local_index_file)
+            self.rebuild_status.update({"state": "serving", "rebuild_time": time.time() - start_time})
+            logging.info(f"Rebuilt the {target} index with {len(documents)} tools in {time.time() - start_time:.1f}s. Index version is now {self.index_version}.")
+        except Exception as e:
+            logging.error(f"Error rebuilding index from '{file_path}': {e}")
+            self.rebuild_status.update({"state": "failed", "error": str(e), "rebuild_time": time.time() - start_time})
+            if search_client is not None:
+                await asyncio.to_thread(manager.delete_index, index_name)
+                search_client.close()
+            return False
+
+        if previous_index_name:
+            # Searches started before the switch may still be using the old client
+            await asyncio.sleep(self.old_index_grace)
+            previous_client.close()
+            if delete_old_index:
+                await asyncio.to_thread(manager.delete_index, previous_index_name)
+        return True
 
     async def normalize_NNB_scores(self, scores: list[float]) -> list[float]:
         """
@@ -55,103 +289,713 @@ class ToolRouter:
         return [rescale(s, min_s, max_s) for s in scores]
 
 
-    ####
-    # TODO: When local tools are implemented, implement the get_local_tools method
-    # This method should retrieve local tools based on the query.
-    # And return a list of Tool objects.
-    ####
-    async def get_local_tools(self, query: str) -> List[Tool]:
+    async def get_local_tools(self, query: str, top_k: int = 10, allowed_tools: List[str] = [], query_vector: List[float] = None, servers: List[str] = None) -> List[Tool]:
         """
         Retrieve local tools based on the query.
         Args:
             query (str): The query string to search for local tools.
+            top_k (int): The number of top results to return.
+            allowed_tools (List[str]): A list of allowed tool IDs for the query.
+            query_vector (List[float]): Optional precomputed query embedding.
+            servers (List[str]): Optional list of server names to restrict the search to.
         Returns:
-            List[Tool]: A list of local tools matching the query.
+            List[Tool]: A list of local tools matching the query, or None if the local index or embedding is unavailable.
         """
-        return []  # Placeholder for local tools retrieval logic
+        if self.local_index is None:
+            return None
+        if query_vector is None:
+            query_vector = await self.azure_search_manager.create_text_embedding(text=query)
+            if query_vector is None:
+                return None
+        local_tools_list = self.local_index.search(query_vector, top_k=top_k, allowed_tools=allowed_tools, servers=servers)
+        return [tool for tool in local_tools_list if tool.score >= self.minimum_tool_score]
 
 
-    async def get_remote_tools(self, query: str, top_k: int = 10, allowed_tools: List[str] = []) -> List[Tool]:
+    async def get_candidate_servers(self, query_vector: List[float], allowed_tools: List[str] = [], allowed_servers: List[str] = None) -> List[str]:
+        """
+        Coarse routing step. Score the query against the server and toolset centroids of the local tool index.
+        Args:
+            query_vector (List[float]): The query embedding.
+            allowed_tools (List[str]): A list of allowed tool IDs for the query.
+            allowed_servers (List[str]): Optional list of server names the candidates must come from.
+        Returns:
+            List[str]: The top servers for the query.
+        """
+        if self.local_index is None or query_vector is None:
+            return []
+        if not allowed_servers:
+            return self.local_index.rank_servers(query_vector, top_n=self.hierarchy_top_servers, allowed_tools=allowed_tools)
+        ranked_servers = self.local_index.rank_servers(query_vector, top_n=len(self.local_index.server_names), allowed_tools=allowed_tools)
+        return [server for server in ranked_servers if server in allowed_servers][:self.hierarchy_top_servers]
+
+
+    async def get_context_vector(self, current_application: str, timeout: float = None) -> Optional[List[float]]:
+        """
+        Return the embedding of an application context, embedding it only the first time the context is seen.
+        Args:
+            current_application (str): The application the user is working in, e.g. "GitHub".
+            timeout (float): Optional seconds to wait for Azure OpenAI.
+        Returns:
+            List[float]: The context embedding, or None if there is no context or it could not be embedded.
+        """
+        if not current_application:
+            return None
+        context_vector = self.context_vectors.get(current_application)
+        if context_vector is not None:
+            self.context_vectors.move_to_end(current_application)
+            return context_vector
+        # Phrased like the prefix callers used to put in front of the query
+        context_vector = await self.azure_search_manager.create_text_embedding(text=f"Current application: {current_application}.", timeout=timeout)
+        if context_vector is not None:
+            self.context_vectors[current_application] = context_vector
+            if len(self.context_vectors) > self.context_cache_size:
+                self.context_vectors.popitem(last=False)
+        return context_vector
+
+
+    def combine_context(self, query_vector: List[float], context_vector: List[float]) -> List[float]:
+        """
+        Blend the query and context embeddings into the vector used for search, weighted by CONTEXT_VECTOR_WEIGHT.
+        Args:
+            query_vector (List[float]): The query embedding.
+            context_vector (List[float]): The context embedding, or None.
+        Returns:
+            List[float]: The search vector. The query vector itself when there is no context.
+        """
+        if query_vector is None or context_vector is None or self.context_vector_weight <= 0:
+            return query_vector
+        query = np.asarray(query_vector, dtype=np.float32)
+        context = np.asarray(context_vector, dtype=np.float32)
+        search_vector = query / (np.linalg.norm(query) or 1.0) + self.context_vector_weight * context / (np.linalg.norm(context) or 1.0)
+        return search_vector.tolist()
+
+
+    async def get_remote_tools(self, query: str, top_k: int = 10, allowed_tools: List[str] = [], servers: List[str] = None, query_vector: List[float] = None, timeout: float = None) -> List[Tool]:
         """
         Retrieve remote tools based on the query.
         Args:
             query (str): The query string to search for remote tools.
             allowed_tools (List[str]): A list of allowed tool IDs for the query.
+            servers (List[str]): Optional list of server names to restrict the search to.
+            query_vector (List[float]): Optional precomputed query embedding.
+            timeout (float): Optional seconds to wait for Azure Search.
         Returns:
-            List[Tool]: A list of remote tools matching the query.
+            List[Tool]: A list of remote tools matching the query, or None if Azure Search is unavailable.
         """
         try:
             search_result = await self.azure_search_manager.perform_azure_search(
                 search_text=query,
                 top_k=top_k,
-                allowed_tools=allowed_tools
+                allowed_tools=allowed_tools,
+                servers=servers,
+                vector=query_vector,
+                timeout=timeout
             )
         except Exception as e:
             logging.error(f"Error querying Azure Search for '{query}': {e}")
-            return [None]
-        if search_result is not None:
-            # Convert to list to check if we have results
-            result_list = list(search_result)
-            if result_list:
-                search_result_list = [Tool(
-                    id=result.get('id'),
-                    server=result.get('server', ''),
-                    toolset=result.get('toolset', ''),
-                    name=result.get('name', ''),
-                    description=result.get('description', ''),
-                    tool_vector=result.get('tool_vector', []),
-                    score=result.get('@search.reranker_score', 0.0),
-                ) for result in result_list if result.get('id') and result.get('server') and result.get('name')]
-
-                if len(search_result_list) == 0:
-                    logging.info("No results found.")                
-                return search_result_list
-        else:
+            return None
+        if search_result is None:
+            return None
+
+        search_result_list = create_tools_from_results(search_result, score_field='@search.reranker_score')
+        if len(search_result_list) == 0:
             logging.info(f"No remote tools found matching query: '{query}'")
-            return []
+        return search_result_list
 
 
-    async def route(self, query: str, top_k: int = 10, allowed_tools: List[str] = []) -> ToolResults:
+    async def get_adaptive_remote_tools(self, query: str, top_k: int = 10, allowed_tools: List[str] = [], servers: List[str] = None,
+                                        query_vector: List[float] = None, deadline: Deadline = None, current_application: str = None) -> tuple[Optional[List[Tool]], Dict[str, Any]]:
+        """
+        Retrieve remote tools while paying for as little semantic reranking as possible.
+        First the local index scores the query by vector similarity alone. If the best tool leads the runner-up by at least
+        SKIP_RERANK_GAP and scores at least SKIP_RERANK_MIN_SCORE, reranking could not change the answer much and is skipped.
+        Otherwise the reranked search starts at ADAPTIVE_INITIAL_DEPTH candidates and widens by ADAPTIVE_GROWTH_FACTOR, up to
+        top_k, while fewer than ADAPTIVE_MIN_RESULTS tools clear MINIMUM_RERANKER_SCORE or every candidate cleared it.
+        Args:
+            query (str): The query string.
+            top_k (int): The number of top results to return, and the most candidates ever reranked.
+            allowed_tools (List[str]): A list of allowed tool IDs for the query.
+            servers (List[str]): Optional list of server names to restrict the search to.
+            query_vector (List[float]): The query embedding.
+            deadline (Deadline): The request's latency budget.
+            current_application (str): Tools of this server get CONTEXT_SERVER_BOOST when counting the tools that clear the threshold.
+        Returns:
+            tuple[List[Tool], Dict[str, Any]]: The tools, or None if Azure Search is unavailable, and the retrieval decision.
+        """
+        deadline = deadline or Deadline(None)
+        decision = {"mode": "adaptive", "reranked": True, "vector_top_score": None, "vector_gap": None, "depths": [], "candidates_reranked": 0, "fixed_depth": top_k}
+        self.retrieval_stats["requests"] += 1
+        self.retrieval_stats["fixed_depth_candidates"] += top_k
+
+        if self.local_index is not None and query_vector is not None:
+            vector_tools = self.local_index.search(query_vector, top_k=max(top_k, 2), allowed_tools=allowed_tools, servers=servers)
+            if vector_tools:
+                decision["vector_top_score"] = vector_tools[0].score
+                decision["vector_gap"] = vector_tools[0].score - (vector_tools[1].score if len(vector_tools) > 1 else 0.0)
+                if decision["vector_top_score"] >= self.skip_rerank_min_score and decision["vector_gap"] >= self.skip_rerank_gap:
+                    decision["reranked"] = False
+                    self.retrieval_stats["rerank_skipped"] += 1
+                    return [tool for tool in vector_tools if tool.score >= self.minimum_tool_score][:top_k], decision
+
+        def boost(tool: Tool) -> float:
+            return self.context_server_boost if current_application and tool.server.lower() == current_application.lower() else 0.0
+
+        depth = min(top_k, max(self.adaptive_initial_depth, 1))
+        previous_tools = None
+        while True:
+            tools = await self.get_remote_tools(query=query, top_k=depth, allowed_tools=allowed_tools, servers=servers, query_vector=query_vector, timeout=deadline.remaining(self.fallback_reserve))
+            if tools is None:
+                # A failed widening still serves the narrower results
+                return previous_tools, decision
+            decision["depths"].append(depth)
+            decision["candidates_reranked"] += len(tools)
+            self.retrieval_stats["candidates_reranked"] += len(tools)
+
+            cleared = sum(1 for tool in tools if tool.score + boost(tool) >= self.minimum_reranker_score)
+            exhausted = depth >= top_k or len(tools) < depth or deadline.expired(self.fallback_reserve)
+            if exhausted or (cleared >= min(top_k, self.adaptive_min_results) and cleared < len(tools)):
+                return tools, decision
+            previous_tools = tools
+            depth = min(top_k, depth * max(self.adaptive_growth_factor, 2))
+            if len(decision["depths"]) == 1:
+                self.retrieval_stats["widened"] += 1
+
+
+    async def get_lexical_tools(self, query: str, top_k: int = 10, allowed_tools: List[str] = [], timeout: float = None) -> List[Tool]:
+        """
+        Retrieve remote tools with a keyword-only search. Used when the embedding deployment is unavailable.
+        Args:
+            query (str): The query string to search for remote tools.
+            top_k (int): The number of top results to return.
+            allowed_tools (List[str]): A list of allowed tool IDs for the query.
+            timeout (float): Optional seconds to wait for Azure Search.
+        Returns:
+            List[Tool]: A list of remote tools matching the query, or None if Azure Search is unavailable.
+        """
+        search_result = await self.azure_search_manager.perform_lexical_search(search_text=query, top_k=top_k, allowed_tools=allowed_tools, timeout=timeout)
+        if search_result is None:
+            return None
+        return create_tools_from_results(search_result, score_field='@search.score')
+
+
+    async def get_degraded_tools(self, query: str, query_vector: List[float], top_k: int, allowed_tools: List[str], cache_scope: tuple, deadline: Deadline, search_vector: List[float] = None, servers: List[str] = None) -> tuple[str, List[Tool]]:
+        """
+        Serve a query from the cheapest mode still available when the full pipeline cannot.
+        Tries, in order, a relaxed semantic cache lookup, the local tool index and a lexical-only Azure search.
+        Args:
+            query (str): The query string to process.
+            query_vector (List[float]): The query embedding, or None if embedding failed.
+            top_k (int): The number of top results to return.
+            allowed_tools (List[str]): A list of allowed tool IDs for the query.
+            cache_scope (tuple): The semantic cache scope of the request.
+            deadline (Deadline): The request's latency budget.
+            search_vector (List[float]): Optional query embedding blended with the application context, used for the local search.
+            servers (List[str]): Optional list of server names to restrict the local search to.
+        Returns:
+            tuple[str, List[Tool]]: The serving mode ("cached", "local", "lexical" or "unavailable") and its tools.
+        """
+        if self.semantic_cache is not None and query_vector is not None:
+            cached_tools = self.semantic_cache.lookup(query_vector, cache_scope, threshold=self.fallback_cache_threshold)
+            if cached_tools is not None:
+                return "cached", cached_tools
+
+        search_vector = search_vector if search_vector is not None else query_vector
+        local_tools_list = await self.get_local_tools(query=query, top_k=top_k, allowed_tools=allowed_tools, query_vector=search_vector, servers=servers) if search_vector is not None else None
+        if local_tools_list is not None:
+            return "local", local_tools_list
+
+        if not deadline.expired():
+            lexical_tools_list = await self.get_lexical_tools(query=query, top_k=top_k, allowed_tools=allowed_tools, timeout=deadline.remaining())
+            if lexical_tools_list is not None:
+                return "lexical", [tool for tool in lexical_tools_list if not servers or tool.server in servers][:top_k]
+
+        return "unavailable", []
+
+
+    async def route(self, query: str, top_k: int = 10, allowed_tools: List[str] = [], routing_mode: str = None, latency_budget_ms: int = None, context: Dict[str, Any] = None) -> ToolResults:
+        """
+        Process a single query, sharing the result of an identical request already in flight.
+        Takes the same arguments and returns the same ToolResults as route_query. Results shared from another
+        request are marked with "coalesced" in their kwargs.
+        """
+        if self.route_flight is None:
+            return await self.route_query(query, top_k, allowed_tools, routing_mode, latency_budget_ms, context)
+
+        start_execution_time = time.time()
+        key = (query, top_k, tuple(sorted(allowed_tools or [])), routing_mode or self.routing_mode, latency_budget_ms,
+               json.dumps(context, sort_keys=True, default=str) if context else None)
+        results, coalesced = await self.route_flight.do(key, lambda: self.route_query(query, top_k, allowed_tools, routing_mode, latency_budget_ms, context))
+        if not coalesced:
+            return results
+        # Callers may compact or stream the tool list, so each gets its own copy
+        return ToolResults(execution_time=time.time() - start_execution_time, tools=list(results.tools or []), kwargs={**(results.kwargs or {}), "coalesced": True})
+
+
+    async def route_query(self, query: str, top_k: int = 10, allowed_tools: List[str] = [], routing_mode: str = None, latency_budget_ms: int = None, context: Dict[str, Any] = None) -> ToolResults:
         """
         Process a single query with performance tracking
         Args:
             query (str): The query string to process
             top_k (int): The number of top results to return
             allowed_tools (List[str]): A list of allowed tool IDs for the query
+            routing_mode (str): "flat" or "hierarchical". Defaults to ROUTING_MODE from config.ini
+            latency_budget_ms (int): Time budget for the request, shared by every upstream call. Defaults to LATENCY_BUDGET_MS from config.ini
+            context (Dict[str, Any]): Optional structured context, kept out of the query text:
+                "current_application" (str) and "allowed_servers" (List[str])
         Returns:
             ToolResults: A ToolResults object containing the results of the query processing
         """
 
         start_execution_time = time.time()
-        try:
-            remote_tools_list = await self.get_remote_tools(query=query, top_k=top_k, allowed_tools=allowed_tools)
-            if remote_tools_list is not None:
-                remote_tools_list.sort(key=lambda x: x.score if x else 0, reverse=True)
-        except Exception as e:
-            logging.error(f"Error retrieving remote tools: {e}")
-            remote_tools_list = []
-   
-        if len(remote_tools_list) == 0 or remote_tools_list is None:
+        routing_mode = routing_mode or self.routing_mode
+        latency_budget_ms = latency_budget_ms if latency_budget_ms is not None else self.latency_budget_ms
+        deadline = Deadline(latency_budget_ms / 1000 if latency_budget_ms else None)
+        current_application = (context or {}).get("current_application") or None
+        allowed_servers = list((context or {}).get("allowed_servers") or []) or None
+        context_kwargs = {"current_application": current_application, "allowed_servers": allowed_servers} if context else None
+
+        # A shard only searches its own servers, and has nothing to add when the caller allows none of them
+        if self.shard_servers:
+            allowed_servers = [server for server in (allowed_servers or self.shard_servers) if server in self.shard_servers]
+            if not allowed_servers:
+                return ToolResults(execution_time=time.time() - start_execution_time, tools=[], kwargs={"routing_mode": routing_mode, "serving_mode": "full", "context": context_kwargs})
+        cache_scope = (top_k, tuple(sorted(allowed_tools or [])), routing_mode, self.index_version, current_application, tuple(sorted(allowed_servers or [])))
+
+        # An exact repeat of a cached query needs no embedding at all
+        if self.semantic_cache is not None:
+            cached_tools = self.semantic_cache.lookup_text(query, cache_scope)
+            if cached_tools is not None:
+                return ToolResults(execution_time=time.time() - start_execution_time, tools=cached_tools, kwargs={"routing_mode": routing_mode, "cache": "exact_hit", "serving_mode": "cached", "context": context_kwargs})
+
+        # Embed the query once and share the vector between the cache, the coarse routing step and the search
+        # Part of the budget is held back so a degraded mode can still answer if the full pipeline runs out of time
+        # The application context is embedded separately, and only the first time it is seen
+        query_vector, context_vector = await asyncio.gather(
+            self.azure_search_manager.create_text_embedding(text=query, timeout=deadline.remaining(self.fallback_reserve)),
+            self.get_context_vector(current_application, timeout=deadline.remaining(self.fallback_reserve))
+        )
+
+        # The cache is looked up on the bare query, so the same question from any application context shares entries within its scope
+        if self.semantic_cache is not None:
+            cached_tools = self.semantic_cache.lookup(query_vector, cache_scope)
+            if cached_tools is not None:
+                return ToolResults(execution_time=time.time() - start_execution_time, tools=cached_tools, kwargs={"routing_mode": routing_mode, "cache": "hit", "serving_mode": "cached", "context": context_kwargs})
+        search_vector = self.combine_context(query_vector, context_vector)
+
+        # Hierarchical routing first picks the top servers, then searches tools inside them only
+        servers = allowed_servers
+        if routing_mode == "hierarchical":
+            servers = await self.get_candidate_servers(query_vector=search_vector, allowed_tools=allowed_tools, allowed_servers=allowed_servers)
+            if not servers:
+                routing_mode = "flat"
+                servers = allowed_servers
+
+        remote_tools_list, degraded_reason = None, None
+        retrieval = {"mode": "fixed", "reranked": True, "depths": [top_k], "candidates_reranked": top_k, "fixed_depth": top_k}
+        if query_vector is None:
+            degraded_reason = "budget_exhausted" if deadline.expired(self.fallback_reserve) else "embedding_unavailable"
+        elif deadline.expired(self.fallback_reserve):
+            degraded_reason = "budget_exhausted"
+        else:
+            if self.adaptive_retrieval:
+                remote_tools_list, retrieval = await self.get_adaptive_remote_tools(query=query, top_k=top_k, allowed_tools=allowed_tools, servers=servers, query_vector=search_vector, deadline=deadline, current_application=current_application)
+            else:
+                remote_tools_list = await self.get_remote_tools(query=query, top_k=top_k, allowed_tools=allowed_tools, servers=servers, query_vector=search_vector, timeout=deadline.remaining(self.fallback_reserve))
+            if remote_tools_list is None:
+                degraded_reason = "budget_exhausted" if deadline.expired(self.fallback_reserve) else "search_unavailable"
+
+        # Fall back to a cheaper mode when the full pipeline is unavailable or out of time
+        if remote_tools_list is None:
+            serving_mode, degraded_tools_list = await self.get_degraded_tools(query, query_vector, top_k, allowed_tools, cache_scope, deadline, search_vector=search_vector, servers=servers)
+            logging.warning(f"Served query '{query}' in degraded mode '{serving_mode}' ({degraded_reason}).")
+            return ToolResults(
+                execution_time=time.time() - start_execution_time,
+                tools=degraded_tools_list,
+                kwargs={"routing_mode": routing_mode, "serving_mode": serving_mode, "degraded_reason": degraded_reason, "context": context_kwargs}
+            )
+
+        # The reranker no longer sees the application in the query text, so tools of the current application get a score boost instead.
+        # Tools served on vector similarity alone are already scored against the context-blended query vector.
+        if current_application and self.context_server_boost and retrieval["reranked"]:
+            for tool in remote_tools_list:
+                if tool.server.lower() == current_application.lower():
+                    tool.score += self.context_server_boost
+
+        remote_tools_list.sort(key=lambda x: x.score, reverse=True)
+        if len(remote_tools_list) == 0:
             logging.info(f"No remote tools found for query: '{query}'")
-            return ToolResults(execution_time=0.0, tools=[])
+            return ToolResults(execution_time=0.0, tools=[], kwargs={"routing_mode": routing_mode, "serving_mode": "full", "context": context_kwargs, "retrieval": retrieval})
 
-        ####
-        # TODO: When local tools are implemented, add the logic to retrieve local tools. Should be done async with remote call.
-        # After retrieveing both remote and local tools, combine & dedupe the results.
-        # Then normalize the scores and re-rank the results.
-        ####
+        # The local index holds the same tools as Azure Search, so get_local_tools only serves the degraded path
+        # and its results are not merged in here.
 
-        # Make sure tools meet the minimum score requirement
-        remote_tools_list = [tool for tool in remote_tools_list if tool.score >= self.minimum_reranker_score]
+        # Make sure tools meet the minimum score requirement. Unreranked tools already met MINIMUM_TOOL_SCORE.
+        if retrieval["reranked"]:
+            remote_tools_list = [tool for tool in remote_tools_list if tool.score >= self.minimum_reranker_score]
 
         # Limit the number of results if needed
         if len(remote_tools_list) > top_k:
             remote_tools_list = remote_tools_list[:top_k]
 
+        # Only reranked results are cached, so cached tools are always on the reranker scale, e.g. for a coordinator merging shards
+        if self.semantic_cache is not None and remote_tools_list and retrieval["reranked"]:
+            self.semantic_cache.store(query, query_vector, cache_scope, remote_tools_list)
+
         # create execution time for the query
         total_execution_time = time.time() - start_execution_time
 
-        return ToolResults(execution_time=total_execution_time, tools=remote_tools_list)
+        return ToolResults(
+            execution_time=total_execution_time,
+            tools=remote_tools_list,
+            kwargs={"routing_mode": routing_mode, "candidate_servers": servers or [], "cache": "miss" if self.semantic_cache is not None else "disabled", "serving_mode": "full", "context": context_kwargs, "retrieval": retrieval}
+        )
+
+
+    async def get_candidates(self, query: str, top_k: int = 100, allowed_tools: List[str] = [], context: Dict[str, Any] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        Retrieve scored candidates for offline evaluation, before any threshold, boost or cut-off is applied.
+        Args:
+            query (str): The query string.
+            top_k (int): The number of candidates to retrieve.
+            allowed_tools (List[str]): A list of allowed tool IDs for the query.
+            context (Dict[str, Any]): Optional structured context, as for route.
+        Returns:
+            List[Dict[str, Any]]: Candidates in search order with their reranker, search and vector scores,
+            or None if the query could not be embedded or searched.
+        """
+        current_application = (context or {}).get("current_application") or None
+        allowed_servers = list((context or {}).get("allowed_servers") or []) or None
+        query_vector, context_vector = await asyncio.gather(
+            self.azure_search_manager.create_text_embedding(text=query),
+            self.get_context_vector(current_application)
+        )
+        if query_vector is None:
+            return None
+        search_vector = self.combine_context(query_vector, context_vector)
+        search_result = await self.azure_search_manager.perform_azure_search(search_text=query, top_k=top_k, allowed_tools=allowed_tools, servers=allowed_servers, vector=search_vector)
+        if search_result is None:
+            return None
+
+        # Cosine similarity against the local index, the score MINIMUM_TOOL_SCORE applies to
+        vector_scores = {}
+        if self.local_index is not None:
+            rows = [self.local_index.id_to_row[r['id']] for r in search_result if r.get('id') in self.local_index.id_to_row]
+            if rows:
+                search_query = np.asarray(search_vector, dtype=np.float32)
+                scores = self.local_index.vectors[np.asarray(rows, dtype=np.int64)] @ (search_query / (np.linalg.norm(search_query) or 1.0))
+                vector_scores = {self.local_index.ids[row]: float(score) for row, score in zip(rows, scores)}
+
+        return [{
+            "id": result.get('id'),
+            "server": result.get('server', ''),
+            "toolset": result.get('toolset', ''),
+            "name": result.get('name', ''),
+            "description": result.get('description', ''),
+            "reranker_score": result.get('@search.reranker_score'),
+            "search_score": result.get('@search.score'),
+            "vector_score": vector_scores.get(result.get('id'))
+        } for result in search_result if result.get('id')]
+
+
+    def compacts_by_default(self) -> bool:
+        """Whether DESCRIPTION_MODE or DUPLICATE_THRESHOLD compacts responses to requests that set no compaction parameters."""
+        return self.description_mode != "full" or self.duplicate_threshold > 0
+
+
+    def compact_results(self, results: ToolResults, max_tokens: int = None, max_bytes: int = None, description_mode: str = None) -> ToolResults:
+        """
+        Shrink routed results for a downstream LLM prompt: shorten descriptions, drop near-duplicate tools
+        and keep the highest-ranked tools that fit in the budget.
+        Args:
+            results (ToolResults): The routed results.
+            max_tokens (int): Optional response budget in estimated tokens.
+            max_bytes (int): Optional response budget in bytes of JSON.
+            description_mode (str): "full", "short" or "name_only". Defaults to DESCRIPTION_MODE from config.ini
+        Returns:
+            ToolResults: The compacted results, with the compaction details in kwargs.
+        """
+        # Near-duplicates are found with the vectors already in the local index, so no extra embedding calls are made
+        vectors = {}
+        if self.local_index is not None:
+            for tool in results.tools:
+                row = self.local_index.id_to_row.get(tool.id)
+                if row is not None:
+                    vectors[tool.id] = self.local_index.vectors[row]
+        tools, compaction = compact_tools(
+            results.tools,
+            max_tokens=max_tokens,
+            max_bytes=max_bytes,
+            description_mode=description_mode or self.description_mode,
+            vectors=vectors,
+            duplicate_threshold=self.duplicate_threshold if self.duplicate_threshold > 0 else None
+        )
+        return ToolResults(execution_time=results.execution_time, tools=tools, kwargs={**(results.kwargs or {}), "compaction": compaction})
+
+
+    async def warm_up(self, queries: List[str] = None) -> List[str]:
+        """
+        Run the configured warm-up queries so connections, auth and caches are primed before traffic arrives.
+        Args:
+            queries (List[str]): Optional subset of the warm-up queries to run. Defaults to all of them.
+        Returns:
+            List[str]: The queries served by the full pipeline. A degraded or unavailable answer means an upstream is not reachable yet.
+        """
+        completed = []
+        for query in (self.warmup_queries if queries is None else queries):
+            try:
+                results = await self.route(query=query, latency_budget_ms=0)
+                if (results.kwargs or {}).get("serving_mode") == "full":
+                    completed.append(query)
+                else:
+                    logging.warning(f"Warm-up query '{query}' was served in mode '{(results.kwargs or {}).get('serving_mode')}'.")
+            except Exception as e:
+                logging.error(f"Error running warm-up query '{query}': {e}")
+        return completed
+
+
+async def check_startup(warmed_up: set) -> bool:
+    """
+    Acquire the auth tokens and run the warm-up queries that have not yet been served in full.
+    A coordinator instead checks that at least MIN_SHARDS shards report ready.
+    Args:
+        warmed_up (set): Warm-up queries already served in full, updated in place.
+    Returns:
+        bool: True once the tokens are acquired and every warm-up query was served in full, or enough shards are ready.
+    """
+    if coordinator_instance is not None:
+        ready = await coordinator_instance.check_ready()
+        startup_status["ready_shards"] = coordinator_instance.ready_shards
+        return ready
+    if not startup_status["tokens_acquired"]:
+        startup_status["tokens_acquired"] = await search_instance.acquire_tokens()
+    if startup_status["tokens_acquired"]:
+        warmed_up.update(await router_instance.warm_up([q for q in router_instance.warmup_queries if q not in warmed_up]))
+    startup_status["warmup_queries"] = len(warmed_up)
+    return startup_status["tokens_acquired"] and len(warmed_up) == len(router_instance.warmup_queries)
+
+
+async def retry_startup(warmed_up: set, interval: float) -> None:
+    """Repeat the startup checks every STARTUP_RETRY_SECONDS until the worker can report ready."""
+    while not startup_status["ready"]:
+        await asyncio.sleep(interval)
+        try:
+            startup_status["ready"] = await check_startup(warmed_up)
+        except Exception as e:
+            logging.error(f"Error retrying router startup: {e}")
+            startup_status["error"] = str(e)
+    logging.info("Router is ready.")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Build the shared clients once per worker, acquire auth tokens, load local indexes and run warm-up queries
+    before the worker reports ready.
+    """
+    global router_instance, search_instance, registry_watcher, coordinator_instance
+    start_time = time.time()
+    warmed_up = set()
+    try:
+        # A coordinator holds no index of its own, so it needs no Azure clients
+        coordinator_instance = load_coordinator()
+        if coordinator_instance is None:
+            search_instance = AzureSearchManager()
+            router_instance = ToolRouter(azure_search_manager=search_instance)
+            # Not ready until Azure Search and Azure OpenAI are reachable, unless the policy allows serving degraded
+            startup_status["ready"] = await check_startup(warmed_up) or router_instance.ready_on_degraded_startup
+            if router_instance.watch_registry:
+                registry_watcher = RegistryWatcher(router_instance, router_instance.watch_registry, interval=router_instance.watch_interval, sync_azure_index=router_instance.sync_azure_index)
+        else:
+            # Not ready until enough shards are, so a load balancer does not send queries that would all come back unavailable
+            startup_status["ready"] = await check_startup(warmed_up)
+    except Exception as e:
+        logging.error(f"Error during router startup: {e}")
+        startup_status["error"] = str(e)
+        # Without a router or coordinator the worker can never become ready, e.g. when the local embedding model is missing.
+        # Failing startup lets the process manager see it and restart the worker, instead of /healthz answering 200 forever.
+        if router_instance is None and coordinator_instance is None:
+            if search_instance is not None:
+                search_instance.close()
+            raise
+    startup_status["warmup_time"] = time.time() - start_time
+
+    if router_instance is not None:
+        # Mismatched vectors would be scored silently and serve the wrong tools, so the worker refuses to start
+        dimension_error = await router_instance.check_embedding_dimensions()
+        if dimension_error:
+            logging.error(dimension_error)
+            raise RuntimeError(dimension_error)
+
+    # Keep retrying in the background, so a worker started during an upstream outage becomes ready once it ends
+    startup_task = None
+    if (router_instance is not None or coordinator_instance is not None) and not startup_status["ready"]:
+        startup_task = asyncio.create_task(retry_startup(warmed_up, router_instance.startup_retry_seconds if router_instance is not None else coordinator_instance.ready_check_interval))
+
+    # Hot reload the local index in the background while serving
+    watcher_task = asyncio.create_task(registry_watcher.run()) if registry_watcher is not None else None
+
+    yield
+
+    startup_status["ready"] = False
+    if startup_task is not None:
+        startup_task.cancel()
+    if watcher_task is not None:
+        watcher_task.cancel()
+    if rebuild_task is not None and not rebuild_task.done():
+        rebuild_task.cancel()
+    if search_instance is not None:
+        search_instance.close()
+    if coordinator_instance is not None:
+        await coordinator_instance.close()
+    # uvicorn re-raises the shutdown signal after the lifespan ends, so atexit handlers may never run
+    for process in local_shard_processes:
+        process.terminate()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+def load_coordinator() -> Optional[ScatterGatherCoordinator]:
+    """
+    Build the scatter-gather coordinator when shards are configured in the [Coordinator] section of config.ini
+    or the MCP_COORDINATOR_SHARDS environment variable. A process started as a shard never becomes a coordinator,
+    even when config.ini lists shards, because it would fan its queries out to itself and its siblings.
+    Returns:
+        ScatterGatherCoordinator: The coordinator, or None to run as a regular router.
+    """
+    config = configparser.ConfigParser()
+    config.read('python/src/server/data/config.ini')
+    if os.environ.get('MCP_SHARD_SERVERS') or config.get('ToolRouter', 'SHARD_SERVERS', fallback=''):
+        return None
+    shards = parse_shards(os.environ.get('MCP_COORDINATOR_SHARDS') or config.get('Coordinator', 'SHARDS', fallback=''))
+    if not shards:
+        return None
+    logging.info(f"Running as a scatter-gather coordinator over {len(shards)} shards.")
+    return ScatterGatherCoordinator(
+        shards,
+        shard_timeout_ms=config.getint('Coordinator', 'SHARD_TIMEOUT_MS', fallback=1000),
+        min_shards=config.getint('Coordinator', 'MIN_SHARDS', fallback=1),
+        latency_budget_ms=config.getint('ToolRouter', 'LATENCY_BUDGET_MS', fallback=0),
+        ready_check_interval=config.getfloat('ToolRouter', 'STARTUP_RETRY_SECONDS', fallback=10.0)
+    )
+
+
+def not_ready_response() -> JSONResponse:
+    """Response returned while the worker has not finished startup."""
+    return JSONResponse(status_code=503, content={
+        "error": "Router is not ready",
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+def admin_error_response(request: Request) -> Optional[JSONResponse]:
+    """
+    Check a request to an admin endpoint, which loads files from paths given by the caller.
+    Args:
+        request (Request): The request.
+    Returns:
+        JSONResponse: A 403 when admin endpoints are disabled, a 401 when ADMIN_TOKEN is set and the bearer token does not match,
+            a 400 when the server runs several workers, else None.
+    """
+    if not router_instance.admin_endpoints:
+        return JSONResponse(status_code=403, content={
+            "error": "Admin endpoints are disabled. Set ADMIN_ENDPOINTS = True to enable them.",
+            "timestamp": datetime.now().isoformat()
+        })
+    auth_header = request.headers.get("Authorization") or ""
+    token = auth_header.split(" ")[1] if auth_header.startswith("Bearer ") else ""
+    if router_instance.admin_token and not hmac.compare_digest(token.encode("utf-8"), router_instance.admin_token.encode("utf-8")):
+        return JSONResponse(status_code=401, content={
+            "error": "Invalid admin token",
+            "timestamp": datetime.now().isoformat()
+        })
+    if router_instance.workers > 1:
+        # The request reaches one worker chosen by the kernel, and the others cannot be targeted,
+        # so the workers would serve a mix of old and new indexes until they restart
+        return JSONResponse(status_code=400, content={
+            "error": f"Admin endpoints only switch the worker that receives the request, and the server runs {router_instance.workers} workers. "
+                     "Use WATCH_REGISTRY with a snapshot directory, or update ACTIVE_INDEX_FILE and restart the workers.",
+            "timestamp": datetime.now().isoformat()
+        })
+    return None
+
+
+def get_stream_format(stream: Any, accept_header: str = None) -> Optional[str]:
+    """
+    Resolve the requested streaming format from the request body's "stream" value or the Accept header.
+    Args:
+        stream (Any): "ndjson", "sse", true (ndjson) or None.
+        accept_header (str): The request's Accept header.
+    Returns:
+        str: "ndjson" or "sse", or None for a regular JSON response.
+    """
+    if stream is True:
+        return "ndjson"
+    if isinstance(stream, str) and stream.lower() in STREAM_MEDIA_TYPES:
+        return stream.lower()
+    if accept_header:
+        for stream_format, media_type in STREAM_MEDIA_TYPES.items():
+            if media_type in accept_header:
+                return stream_format
+    return None
+
+
+def format_stream_record(record: Dict[str, Any], stream_format: str) -> str:
+    """Serialize one streamed record as an NDJSON line or a server-sent event."""
+    if stream_format == "sse":
+        return f"event: {record['type']}\ndata: {json.dumps(record)}\n\n"
+    return json.dumps(record) + "\n"
+
+
+async def stream_tools(tool_batches: AsyncIterator[List[Tool]], start_time: float, stream_format: str, kwargs: Dict[str, Any] = None) -> AsyncIterator[str]:
+    """
+    Emit tools in rank order as their batches arrive, then a summary record with timings.
+    Args:
+        tool_batches (AsyncIterator[List[Tool]]): Ranked tools, in one or more batches.
+        start_time (float): The request start time.
+        stream_format (str): "ndjson" or "sse".
+        kwargs (Dict[str, Any]): Extra routing metadata for the summary record.
+    Returns:
+        AsyncIterator[str]: The serialized records.
+    """
+    rank = 0
+    first_tool_time = None
+    try:
+        async for batch in tool_batches:
+            for tool in batch:
+                if first_tool_time is None:
+                    first_tool_time = time.time() - start_time
+                rank += 1
+                yield format_stream_record({"type": "tool", "rank": rank, "tool": asdict(tool)}, stream_format)
+    except Exception as e:
+        logging.error(f"Error streaming tools: {e}")
+        yield format_stream_record({"type": "error", "error": str(e), "timestamp": datetime.now().isoformat()}, stream_format)
+
+    yield format_stream_record({
+        "type": "summary",
+        "count": rank,
+        "first_tool_time": first_tool_time,
+        "execution_time": time.time() - start_time,
+        "kwargs": kwargs or {}
+    }, stream_format)
+
+
+async def single_batch(tools: List[Tool]) -> AsyncIterator[List[Tool]]:
+    """Wrap an already ranked tool list as a tool batch stream."""
+    yield tools
+
+
+async def search_result_batches(results) -> AsyncIterator[List[Tool]]:
+    """
+    Read Azure Search results one page at a time, off the event loop, so the first page can be streamed
+    before the rest has been fetched.
+    """
+    pages = results.by_page()
+    while True:
+        page = await asyncio.to_thread(lambda: list(next(pages, [])))
+        if not page:
+            break
+        yield create_tools_from_results(page, score_field='@search.score')
 
 
 @app.put("/run_az_search/")
@@ -165,10 +1009,10 @@ async def run_az_search(request: Request) -> ToolResults:
     query = json.loads(raw_RQ_body.decode("utf-8")).get("query", "")
     top_k = json.loads(raw_RQ_body.decode("utf-8")).get("top_k", 10)
     allowed_tools = json.loads(raw_RQ_body.decode("utf-8")).get("allowed_tools", [])
+    stream_format = get_stream_format(json.loads(raw_RQ_body.decode("utf-8")).get("stream"), request.headers.get("Accept"))
 
-    global search_instance
     if search_instance is None:
-        search_instance = AzureSearchManager()
+        return not_ready_response()
 
     # Timer start
     start_time = time.time()
@@ -180,9 +1024,10 @@ async def run_az_search(request: Request) -> ToolResults:
             "timestamp": datetime.now().isoformat()
         }
 
-    # Route the query to get tools    
+    # Route the query to get tools. The search client is synchronous, so it runs off the event loop.
     try:
-        results = search_instance.azure_search_client.search(
+        results = await asyncio.to_thread(
+                search_instance.azure_search_client.search,
                 query_type="simple",
                 search_text=query,
                 select=["id", "server", "toolset", "name", "description"],
@@ -194,23 +1039,15 @@ async def run_az_search(request: Request) -> ToolResults:
             "error": str(e),
             "timestamp": datetime.now().isoformat()
         }   
-    
+
+    if stream_format is not None:
+        return StreamingResponse(stream_tools(search_result_batches(results), start_time, stream_format), media_type=STREAM_MEDIA_TYPES[stream_format])
+
+    search_result_list = []
     if results is not None:
-        # Convert to list to check if we have results
-        result_list = list(results)
-        if result_list:
-            search_result_list = [Tool(
-                id=result.get('id'),
-                server=result.get('server', ''),
-                toolset=result.get('toolset', ''),
-                name=result.get('name', ''),
-                description=result.get('description', ''),
-                tool_vector=result.get('tool_vector', []),
-                score=result.get('@search.score') or 0.0,
-            ) for result in result_list if result.get('id') and result.get('server') and result.get('name')]
-            
-            if len(search_result_list) == 0:
-                logging.info("No results found.")                
+        search_result_list = create_tools_from_results(await asyncio.to_thread(list, results), score_field='@search.score')
+        if len(search_result_list) == 0:
+            logging.info("No results found.")
     else:
         logging.info(f"No remote tools found matching query: '{query}'")
 
@@ -234,10 +1071,18 @@ async def get_mcp_tools(request: Request) -> ToolResults:
     query = json.loads(raw_RQ_body.decode("utf-8")).get("query", "")
     top_k = json.loads(raw_RQ_body.decode("utf-8")).get("top_k", 10)
     allowed_tools = json.loads(raw_RQ_body.decode("utf-8")).get("allowed_tools", [])
+    routing_mode = json.loads(raw_RQ_body.decode("utf-8")).get("routing_mode", None)
+    latency_budget_ms = json.loads(raw_RQ_body.decode("utf-8")).get("latency_budget_ms", None)
+    max_tokens = json.loads(raw_RQ_body.decode("utf-8")).get("max_tokens", None)
+    max_bytes = json.loads(raw_RQ_body.decode("utf-8")).get("max_bytes", None)
+    description_mode = json.loads(raw_RQ_body.decode("utf-8")).get("description_mode", None)
+    context = json.loads(raw_RQ_body.decode("utf-8")).get("context", None)
+    stream_format = get_stream_format(json.loads(raw_RQ_body.decode("utf-8")).get("stream"), request.headers.get("Accept"))
 
-    global router_instance
-    if router_instance is None:
-        router_instance = ToolRouter()
+    # In coordinator mode the query is routed across the shards instead
+    router = coordinator_instance or router_instance
+    if router is None:
+        return not_ready_response()
 
     #Timer start
     start_time = time.time()
@@ -248,23 +1093,78 @@ async def get_mcp_tools(request: Request) -> ToolResults:
             "error": "Query cannot be empty",
             "timestamp": datetime.now().isoformat()
         }
+
+    if description_mode is not None and description_mode not in DESCRIPTION_MODES:
+        return JSONResponse(status_code=400, content={
+            "error": f"description_mode must be one of {', '.join(DESCRIPTION_MODES)}",
+            "timestamp": datetime.now().isoformat()
+        })
+    for name, value in (("max_tokens", max_tokens), ("max_bytes", max_bytes)):
+        # bool is an int subclass, so reject it explicitly
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value <= 0):
+            return JSONResponse(status_code=400, content={
+                "error": f"{name} must be a positive integer",
+                "timestamp": datetime.now().isoformat()
+            })
     
     # Route the query to get tools
     try:
-        results = await router_instance.route(query=query, top_k=top_k, allowed_tools=allowed_tools)
+        if coordinator_instance is not None:
+            # Shards enforce their own auth, so they get the caller's token
+            results = await coordinator_instance.route(query=query, top_k=top_k, allowed_tools=allowed_tools, routing_mode=routing_mode, latency_budget_ms=latency_budget_ms, context=context, token=token)
+        else:
+            results = await router.route(query=query, top_k=top_k, allowed_tools=allowed_tools, routing_mode=routing_mode, latency_budget_ms=latency_budget_ms, context=context)
     except Exception as e:
         logging.error(f"Error routing query '{query}': {e}")
         return {
             "error": str(e),
             "timestamp": datetime.now().isoformat()
         }
-    
+
+    # Fit the response to the caller's prompt budget, or apply the configured description mode and duplicate detection
+    if max_tokens is not None or max_bytes is not None or description_mode is not None or router.compacts_by_default():
+        results = router.compact_results(results, max_tokens=max_tokens, max_bytes=max_bytes, description_mode=description_mode)
+
+    # Reranked results are only complete once routing has finished, so they are streamed as one batch
+    if stream_format is not None:
+        return StreamingResponse(stream_tools(single_batch(results.tools), start_time, stream_format, results.kwargs), media_type=STREAM_MEDIA_TYPES[stream_format])
+
     if results is None or len(results.tools) == 0:
         logging.info(f"No tools found for query: '{query}'")
         return []
     return results
 
 
+@app.put("/get_candidates/")
+async def get_candidates(request: Request) -> Dict[str, Any]:
+    """
+    Get up to top_k scored candidates for a query, without thresholds or cut-offs, for offline configuration sweeps.
+    """
+    raw_RQ_body = await request.body()
+    query = json.loads(raw_RQ_body.decode("utf-8")).get("query", "")
+    top_k = json.loads(raw_RQ_body.decode("utf-8")).get("top_k", 100)
+    allowed_tools = json.loads(raw_RQ_body.decode("utf-8")).get("allowed_tools", [])
+    context = json.loads(raw_RQ_body.decode("utf-8")).get("context", None)
+
+    if router_instance is None:
+        return not_ready_response()
+
+    start_time = time.time()
+    if not query or query.strip() == "":
+        return JSONResponse(status_code=400, content={
+            "error": "Query cannot be empty",
+            "timestamp": datetime.now().isoformat()
+        })
+
+    candidates = await router_instance.get_candidates(query=query, top_k=top_k, allowed_tools=allowed_tools, context=context)
+    if candidates is None:
+        return JSONResponse(status_code=503, content={
+            "error": "Candidates could not be retrieved",
+            "timestamp": datetime.now().isoformat()
+        })
+    return {"execution_time": time.time() - start_time, "candidates": candidates}
+
+
 @app.get("/get_router_status")
 async def get_router_status(request: Request) -> Dict[str, Any]:
     """
@@ -276,24 +1176,60 @@ async def get_router_status(request: Request) -> Dict[str, Any]:
     auth_header = request.headers.get("Authorization")
     token = auth_header.split(" ")[1] if auth_header else None
 
-    global router_instance
+    if coordinator_instance is not None:
+        return {
+            "status": "active" if startup_status["ready"] else "starting",
+            "mode": "coordinator",
+            "coordinator": coordinator_instance.stats(),
+            "startup": startup_status,
+            "timestamp": datetime.now().isoformat()
+        }
+
     if router_instance is None:
-        router_instance = ToolRouter()
+        return not_ready_response()
 
     try:
         return {
-            "status": "active",
+            "status": "active" if startup_status["ready"] else "starting",
             "configuration": {
                 "max_concurrent_requests": router_instance.max_concurrent_requests,
-                "tool_result_count": router_instance.tool_result_cnt,
-                "tool_return_limit": router_instance.tool_return_limit,
+                "minimum_tool_score": router_instance.minimum_tool_score,
+                "minimum_reranker_score": router_instance.minimum_reranker_score,
+                "routing_mode": router_instance.routing_mode,
+                "hierarchy_top_servers": router_instance.hierarchy_top_servers,
+                "two_stage_prefix_dims": router_instance.two_stage_prefix_dims,
+                "shard_servers": router_instance.shard_servers,
+                "latency_budget_ms": router_instance.latency_budget_ms,
+                "description_mode": router_instance.description_mode,
                 "use_local_tools": router_instance.use_local_tools,
                 "use_search_cache": router_instance.use_search_cache
             },
             "services": {
-                "azure_search": "initialized" if hasattr(router_instance, 'azure_search_manager') else "not_initialized",
-                "local_search": "initialized" if hasattr(router_instance, 'local_search_manager') else "not_initialized"
+                "azure_search": "initialized" if router_instance.azure_search_manager is not None else "not_initialized",
+                "local_index": f"{router_instance.local_index.storage} ({len(router_instance.local_index)} tools)" if router_instance.local_index is not None else "not_loaded",
+                "index_version": router_instance.index_version,
+                "azure_search_index": getattr(router_instance.azure_search_manager, "azure_search_index_name", None),
+                "index_rebuild": router_instance.rebuild_status or "none",
+                "registry_watcher": registry_watcher.stats() if registry_watcher is not None else "disabled",
+                "snapshot": router_instance.local_index.snapshot_info if router_instance.local_index is not None and router_instance.local_index.snapshot_info else "not_loaded",
+                "semantic_cache": router_instance.semantic_cache.stats() if router_instance.semantic_cache is not None else "disabled",
+                "context_vectors": len(router_instance.context_vectors),
+                "adaptive_retrieval": {
+                    **router_instance.retrieval_stats,
+                    "rerank_saved_ratio": 1 - router_instance.retrieval_stats["candidates_reranked"] / router_instance.retrieval_stats["fixed_depth_candidates"] if router_instance.retrieval_stats["fixed_depth_candidates"] else 0.0
+                } if router_instance.adaptive_retrieval else "disabled",
+                "single_flight": {
+                    "route": router_instance.route_flight.stats() if router_instance.route_flight is not None else "disabled",
+                    "embedding": router_instance.azure_search_manager.embedding_flight.stats() if router_instance.azure_search_manager.embedding_flight is not None else "disabled"
+                },
+                "embedding_provider": router_instance.azure_search_manager.embedding_provider.stats(),
+                "circuit_breakers": {
+                    "embedding": router_instance.azure_search_manager.embedding_breaker.stats(),
+                    "embedding_background": router_instance.azure_search_manager.background_embedding_breaker.stats(),
+                    "azure_search": router_instance.azure_search_manager.search_breaker.stats()
+                }
             },
+            "startup": startup_status,
             "timestamp": datetime.now().isoformat()
         }
         
@@ -306,5 +1242,136 @@ async def get_router_status(request: Request) -> Dict[str, Any]:
         }
 
 
+@app.put("/load_snapshot/")
+async def load_snapshot(request: Request) -> Dict[str, Any]:
+    """
+    Swap the router's local tool index for a binary snapshot given by path.
+    """
+    raw_RQ_body = await request.body()
+    file_path = json.loads(raw_RQ_body.decode("utf-8")).get("path", "")
+
+    if router_instance is None:
+        return not_ready_response()
+    admin_error = admin_error_response(request)
+    if admin_error is not None:
+        return admin_error
+
+    if not await router_instance.load_snapshot(file_path):
+        return JSONResponse(status_code=400, content={
+            "error": f"Could not load snapshot '{file_path}'",
+            "timestamp": datetime.now().isoformat()
+        })
+    return {
+        "status": "loaded",
+        "snapshot": router_instance.local_index.snapshot_info,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@app.put("/rebuild_index/")
+async def rebuild_index(request: Request):
+    """
+    Start a blue/green rebuild from a registry file in the background. The current index serves until the new one is ready.
+    Progress is reported under services.index_rebuild in /get_router_status.
+    """
+    global rebuild_task
+    raw_RQ_body = await request.body()
+    body = json.loads(raw_RQ_body.decode("utf-8")) if raw_RQ_body else {}
+    file_path = body.get("registry") or "python/src/server/data/mcp_servers.json"
+    target = body.get("target", "azure")
+    delete_old_index = bool(body.get("delete_old_index", False))
+
+    if router_instance is None:
+        return not_ready_response()
+    admin_error = admin_error_response(request)
+    if admin_error is not None:
+        return admin_error
+
+    if target not in ("azure", "local"):
+        return JSONResponse(status_code=400, content={
+            "error": f"Unknown target '{target}'. Use 'azure' or 'local'.",
+            "timestamp": datetime.now().isoformat()
+        })
+    if rebuild_task is not None and not rebuild_task.done():
+        return JSONResponse(status_code=409, content={
+            "error": "A rebuild is already running",
+            "rebuild": router_instance.rebuild_status,
+            "timestamp": datetime.now().isoformat()
+        })
+
+    rebuild_task = asyncio.create_task(router_instance.rebuild_index(file_path, target=target, delete_old_index=delete_old_index))
+    return JSONResponse(status_code=202, content={
+        "status": "started",
+        "registry": file_path,
+        "target": target,
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+@app.get("/healthz")
+async def get_liveness() -> Dict[str, Any]:
+    """
+    Liveness probe. The process is up and serving HTTP.
+    """
+    return {"status": "alive", "timestamp": datetime.now().isoformat()}
+
+
+@app.get("/readyz")
+async def get_readiness():
+    """
+    Readiness probe. Returns 503 until the auth tokens are acquired and every warm-up query was served by the full pipeline.
+    """
+    if not startup_status["ready"]:
+        return JSONResponse(status_code=503, content={"status": "not_ready", **startup_status, "timestamp": datetime.now().isoformat()})
+    return {"status": "ready", **startup_status, "timestamp": datetime.now().isoformat()}
+
+
+def publish_shared_index(directory: str) -> bool:
+    """
+    Load the local tool index once and publish it for the uvicorn workers to attach to.
+    Args:
+        directory (str): The shared directory, ideally on tmpfs such as /dev/shm.
+    Returns:
+        bool: True if an index was published.
+    """
+    config = configparser.ConfigParser()
+    config.read('python/src/server/data/config.ini')
+    if config.get('ToolRouter', 'SNAPSHOT_FILE', fallback=''):
+        logging.info("SNAPSHOT_FILE is set. Workers memory-map the snapshot directly, so nothing is published.")
+        return False
+    local_index = LocalToolIndex.load_from_file(config.get('ToolRouter', 'LOCAL_INDEX_FILE', fallback='python/src/server/data/local_tool_index.json'))
+    if local_index is None:
+        return False
+    local_index.publish_shared(directory)
+    return True
+
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    parser = argparse.ArgumentParser(description="MCP Tool Router server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="Number of uvicorn worker processes")
+    parser.add_argument("--shared-index-dir", default="/dev/shm/mcp-tool-router", help="Where the local tool index is published for the workers")
+    parser.add_argument("--shard-servers", help="Run as a shard serving only these comma-separated servers")
+    parser.add_argument("--coordinator", help="Run as a scatter-gather coordinator over these comma-separated shard URLs")
+    parser.add_argument("--local-shards", help="Run as a coordinator over local shard processes, one per '|'-separated server group, e.g. 'GitHub,Azure|VSCode,Notion'")
+    parser.add_argument("--shard-base-port", type=int, default=8101, help="Port of the first local shard process")
+    args = parser.parse_args()
+
+    if args.shard_servers:
+        os.environ['MCP_SHARD_SERVERS'] = args.shard_servers
+    if args.coordinator:
+        os.environ['MCP_COORDINATOR_SHARDS'] = args.coordinator
+    if args.local_shards:
+        local_shard_processes, local_shards = launch_local_shards([group for group in args.local_shards.split('|') if group.strip()], base_port=args.shard_base_port)
+        atexit.register(lambda: [process.terminate() for process in local_shard_processes])
+        os.environ['MCP_COORDINATOR_SHARDS'] = ",".join(f"{name}={url}" for name, url in local_shards)
+
+    if args.workers > 1:
+        os.environ['MCP_WORKERS'] = str(args.workers)
+        # Load the index once in the launcher. Workers memory-map the published copy, so memory stays flat as workers are added.
+        if publish_shared_index(args.shared_index_dir):
+            os.environ['MCP_SHARED_INDEX_DIR'] = args.shared_index_dir
+        uvicorn.run("run:app", host=args.host, port=args.port, workers=args.workers)
+    else:
+        uvicorn.run(app, host=args.host, port=args.port)
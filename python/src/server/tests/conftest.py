@@ -0,0 +1,4 @@
+import os, sys
+
+# The server modules import each other by module name, as when run.py is started from the server directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,67 @@
+from utils_cache import SemanticCache
+from utils_objects import Tool
+
+
+def tools(name: str):
+    return [Tool(tool_vector=[], id=name, server="GitHub", name=name)]
+
+
+def test_hit_and_miss():
+    cache = SemanticCache(capacity=4, threshold=0.9, dimensions=3)
+    cache.store("create a repo", [1.0, 0.0, 0.0], 5, tools("create_repository"))
+
+    assert cache.lookup([0.99, 0.05, 0.0], 5)[0].name == "create_repository"
+    assert cache.lookup([0.0, 1.0, 0.0], 5) is None
+    assert cache.lookup([0.0, 1.0, 0.0], 5, threshold=-1.0) is not None
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+
+
+def test_exact_text_lookup():
+    cache = SemanticCache(capacity=4, dimensions=3)
+    cache.store("Create a  Repo", [1.0, 0.0, 0.0], 5, tools("create_repository"))
+
+    assert cache.lookup_text("create a repo", 5)[0].name == "create_repository"
+    assert cache.lookup_text("delete a repo", 5) is None
+    assert cache.stats()["exact_hits"] == 1
+
+
+def test_scopes_are_isolated():
+    cache = SemanticCache(capacity=4, threshold=0.9, dimensions=3)
+    cache.store("create a repo", [1.0, 0.0, 0.0], (5, ("GitHub",)), tools("create_repository"))
+
+    assert cache.lookup([1.0, 0.0, 0.0], (10, ("GitHub",))) is None
+    assert cache.lookup_text("create a repo", (10, ("GitHub",))) is None
+    assert cache.lookup([1.0, 0.0, 0.0], (5, ("GitHub",))) is not None
+
+
+def test_least_recently_used_is_evicted():
+    cache = SemanticCache(capacity=2, threshold=0.9, dimensions=3)
+    cache.store("a", [1.0, 0.0, 0.0], 5, tools("a"))
+    cache.store("b", [0.0, 1.0, 0.0], 5, tools("b"))
+    assert cache.lookup([1.0, 0.0, 0.0], 5) is not None
+    cache.store("c", [0.0, 0.0, 1.0], 5, tools("c"))
+
+    assert len(cache) == 2
+    assert cache.stats()["evictions"] == 1
+    assert cache.lookup([0.0, 1.0, 0.0], 5) is None
+    assert cache.lookup([1.0, 0.0, 0.0], 5)[0].name == "a"
+    assert cache.lookup([0.0, 0.0, 1.0], 5)[0].name == "c"
+
+
+def test_wrong_dimensions_are_not_stored():
+    cache = SemanticCache(capacity=2, dimensions=3)
+    cache.store("a", [1.0, 0.0], 5, tools("a"))
+    assert len(cache) == 0
+
+
+def test_clear():
+    cache = SemanticCache(capacity=2, threshold=0.9, dimensions=3)
+    cache.store("a", [1.0, 0.0, 0.0], 5, tools("a"))
+    cache.clear()
+
+    assert len(cache) == 0
+    assert cache.lookup([1.0, 0.0, 0.0], 5) is None
+    cache.store("b", [0.0, 1.0, 0.0], 5, tools("b"))
+    assert cache.lookup([0.0, 1.0, 0.0], 5)[0].name == "b"
@@ -0,0 +1,57 @@
+import numpy as np
+from utils_compact import compact_tools, shorten_description, response_size
+from utils_objects import Tool
+
+DESCRIPTION = "Create a repository. Use it for new projects. Keywords: repo, create. Examples: make a repo"
+
+
+def make_tools(count: int):
+    return [Tool(tool_vector=[0.1] * 8, id=str(i), server="GitHub", toolset="repos", name=f"tool_{i}", description=DESCRIPTION, score=1.0 - i / 10)
+            for i in range(count)]
+
+
+def test_description_modes():
+    assert shorten_description(DESCRIPTION, "full") == DESCRIPTION
+    assert shorten_description(DESCRIPTION, "short") == "Create a repository."
+    assert shorten_description(DESCRIPTION, "name_only") == ""
+    assert shorten_description("word " * 100, "short").endswith("...")
+
+
+def test_vectors_are_dropped_and_order_kept():
+    selected, info = compact_tools(make_tools(3), description_mode="short")
+    assert [tool.name for tool in selected] == ["tool_0", "tool_1", "tool_2"]
+    assert all(tool.tool_vector == [] and tool.description == "Create a repository." for tool in selected)
+    assert info["dropped_duplicates"] == 0
+    assert info["dropped_over_budget"] == 0
+    assert info["bytes"] == sum(response_size(tool)[0] for tool in selected)
+
+
+def test_budget_stops_at_first_tool_that_does_not_fit():
+    tools = make_tools(5)
+    tool_bytes, tool_tokens = response_size(compact_tools(tools[:1])[0][0])
+
+    selected, info = compact_tools(tools, max_bytes=tool_bytes * 2 + 1)
+    assert [tool.name for tool in selected] == ["tool_0", "tool_1"]
+    assert info["dropped_over_budget"] == 3
+    assert info["bytes"] <= tool_bytes * 2 + 1
+
+    selected, info = compact_tools(tools, max_tokens=tool_tokens)
+    assert len(selected) == 1
+    assert info["estimated_tokens"] == tool_tokens
+    assert info["dropped_over_budget"] == 4
+
+
+def test_near_duplicates_are_dropped():
+    tools = make_tools(3)
+    vectors = {
+        "0": np.array([1.0, 0.0], dtype=np.float32),
+        "1": np.array([0.999, 0.0447], dtype=np.float32),
+        "2": np.array([0.0, 1.0], dtype=np.float32)
+    }
+    selected, info = compact_tools(tools, vectors=vectors, duplicate_threshold=0.99)
+    assert [tool.name for tool in selected] == ["tool_0", "tool_2"]
+    assert info["dropped_duplicates"] == 1
+
+    selected, info = compact_tools(tools, vectors=vectors)
+    assert len(selected) == 3
+    assert info["dropped_duplicates"] == 0
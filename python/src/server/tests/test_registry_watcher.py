@@ -0,0 +1,41 @@
+from utils_local_index import LocalToolIndex
+from utils_registry_watcher import compute_tool_delta
+
+
+def document(name: str, description: str, server: str = "GitHub", toolset: str = "repos"):
+    return {"server": server, "toolset": toolset, "name": name, "description": description, "embedding_text": name}
+
+
+def make_index() -> LocalToolIndex:
+    return LocalToolIndex([
+        {**document("create_repository", "Create a repository."), "id": "1", "tool_vector": [1.0, 0.0]},
+        {**document("delete_repository", "Delete a repository."), "id": "2", "tool_vector": [0.0, 1.0]},
+        {**document("list_issues", "List issues.", toolset="issues"), "id": "3", "tool_vector": [1.0, 1.0]}
+    ])
+
+
+def test_delta_against_current_index():
+    index = make_index()
+    documents = [
+        document("create_repository", "Create a repository."),
+        document("delete_repository", "Delete a repository permanently."),
+        document("create_issue", "Create an issue.", toolset="issues")
+    ]
+    delta = compute_tool_delta(index, documents)
+
+    assert delta["unchanged"] == [index.id_to_row["1"]]
+    assert [(d["name"], d["id"]) for d in delta["changed"]] == [("delete_repository", "2")]
+    assert [d["name"] for d in delta["added"]] == ["create_issue"]
+    assert delta["removed"] == [index.id_to_row["3"]]
+
+
+def test_same_name_in_another_toolset_is_added():
+    delta = compute_tool_delta(make_index(), [document("create_repository", "Create a repository.", toolset="admin")])
+    assert len(delta["added"]) == 1
+    assert len(delta["removed"]) == 3
+
+
+def test_without_current_index_everything_is_added():
+    documents = [document("create_repository", "Create a repository."), document("create_repository", "Create a repository.")]
+    delta = compute_tool_delta(None, documents)
+    assert delta == {"added": documents, "changed": [], "unchanged": [], "removed": []}
@@ -0,0 +1,58 @@
+import time
+import pytest
+from utils_resilience import CircuitBreaker, CircuitOpenError
+
+
+def test_opens_on_failure_rate():
+    breaker = CircuitBreaker("test", failure_rate_threshold=0.5, window_size=10, minimum_calls=4)
+    for success in (True, True, False):
+        breaker.record(success, 0.01)
+    assert breaker.state == "closed"
+
+    breaker.record(False, 0.01)
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.stats()["rejected_calls"] == 1
+
+
+def test_slow_calls_count_as_failures():
+    breaker = CircuitBreaker("test", slow_call_seconds=0.5, minimum_calls=2)
+    breaker.record(True, 1.0)
+    breaker.record(True, 1.0)
+    assert breaker.state == "open"
+
+
+def test_half_open_trial_closes_or_reopens():
+    breaker = CircuitBreaker("test", minimum_calls=1, reset_timeout=30.0)
+    breaker.record(False, 0.01)
+    assert breaker.state == "open"
+
+    breaker.opened_at = time.monotonic() - 31.0
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+    breaker.record(False, 0.01)
+    assert breaker.state == "open"
+    assert breaker.stats()["times_opened"] == 2
+
+    breaker.opened_at = time.monotonic() - 31.0
+    assert breaker.allow()
+    breaker.record(True, 0.01)
+    assert breaker.state == "closed"
+    assert breaker.stats()["window_calls"] == 0
+
+
+@pytest.mark.asyncio
+async def test_call_records_outcomes_and_rejects_when_open():
+    breaker = CircuitBreaker("test", minimum_calls=3)
+    assert await breaker.call(lambda: 42) == 42
+
+    def fail():
+        raise RuntimeError("upstream error")
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            await breaker.call(fail)
+    assert breaker.state == "open"
+
+    with pytest.raises(CircuitOpenError):
+        await breaker.call(lambda: 42)
@@ -0,0 +1,68 @@
+import numpy as np
+from utils_local_index import LocalToolIndex
+from utils_snapshot import write_snapshot, read_snapshot
+
+
+def make_index() -> LocalToolIndex:
+    documents = [
+        {"id": "1", "server": "GitHub", "toolset": "repos", "name": "create_repository", "description": "Create a repository.", "tool_vector": [1.0, 0.0, 0.0, 0.0]},
+        {"id": "2", "server": "GitHub", "toolset": "issues", "name": "create_issue", "description": "Create an issue.", "tool_vector": [0.0, 2.0, 0.0, 0.0]},
+        {"id": "3", "server": "Azure", "toolset": "", "name": "list_resources", "description": "List resources ✓.", "tool_vector": [1.0, 1.0, 1.0, 1.0]}
+    ]
+    return LocalToolIndex(documents)
+
+
+def test_round_trip(tmp_path):
+    index = make_index()
+    path = str(tmp_path / "index.snapshot")
+    info = write_snapshot(index, path, info={"source": "test"})
+
+    loaded = read_snapshot(path)
+    assert loaded is not None
+    assert loaded.storage == "snapshot"
+    assert loaded.ids == index.ids
+    assert loaded.servers == index.servers
+    assert loaded.toolsets == index.toolsets
+    assert loaded.names == index.names
+    assert loaded.descriptions == index.descriptions
+    assert loaded.id_to_row == index.id_to_row
+    np.testing.assert_array_equal(loaded.vectors, index.vectors)
+    assert loaded.snapshot_info["checksum"] == info["checksum"]
+    assert loaded.snapshot_info["source"] == "test"
+    assert loaded.snapshot_info["tool_count"] == 3
+
+
+def test_empty_index(tmp_path):
+    path = str(tmp_path / "empty.snapshot")
+    info = write_snapshot(LocalToolIndex([]), path)
+    assert info["tool_count"] == 0
+    assert info["dimensions"] == 0
+
+    loaded = read_snapshot(path)
+    assert loaded is not None
+    assert len(loaded) == 0
+    assert loaded.ids == []
+
+
+def test_corrupted_checksum(tmp_path):
+    path = str(tmp_path / "index.snapshot")
+    write_snapshot(make_index(), path)
+    with open(path, 'r+b') as f:
+        f.seek(-1, 2)
+        last_byte = f.read(1)
+        f.seek(-1, 2)
+        f.write(bytes([last_byte[0] ^ 0xFF]))
+
+    assert read_snapshot(path) is None
+    assert read_snapshot(path, verify_checksum=False) is not None
+
+
+def test_bad_magic_and_missing_file(tmp_path):
+    path = str(tmp_path / "index.snapshot")
+    write_snapshot(make_index(), path)
+    with open(path, 'r+b') as f:
+        f.write(b"NOTASNAP")
+
+    assert read_snapshot(path) is None
+    assert read_snapshot(str(tmp_path / "missing.snapshot")) is None
+
@@ -1,16 +1,54 @@
-import re, configparser, logging, json, uuid
+import os, re, configparser, logging, json, uuid, asyncio
 from azure.search.documents import SearchClient
+from azure.search.documents.indexes import SearchIndexClient
 from azure.search.documents.models import VectorizedQuery
 from azure.identity import DefaultAzureCredential, get_bearer_token_provider
 from openai import AzureOpenAI
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple, Callable
 from utils_objects import Tool
+from utils_local_index import LocalToolIndex
+from utils_resilience import CircuitBreaker, CircuitOpenError
+from utils_embeddings import load_embedding_provider, AzureOpenAIEmbeddingProvider
+from utils_cache import SingleFlight
 
 # Configuration variables from config.ini
 config = configparser.ConfigParser()
 # config.read('data/config.ini')
 config.read('python/src/server/data/config.ini')
 
+# TEMPORARY: List of servers with more than 5 tools to limit noise in the search index
+SERVERS_WITH_MORE_THAN_5_TOOLS = ['GitHub', 'Azure', 'VSCode', 'ActionKitbyParagon', 'AlibabaCloudOPS', 'AlibabaCloudRDS', 'AllVoiceLab', 'ApacheIoTDB', 'AqaraMCPServer', 'Auth0', 'AWS', 'BoostSpace', 'Campertunity', 'Cloudinary', 'CodeLogic', 'CoinGecko', 'DevRev', 'Drata', 'DumplingAI', 'fetchSERP', 'FluidAttacks', 'Globalping', 'Hiveflow', 'HubSpot', 'Hunter', 'Hyperbolic', 'Hyperbrowser', 'IntegrationApp', 'JFrog', 'Klaviyo', 'klusterai', 'LaunchDarkly', 'LINE', 'Linear', 'Lingodev', 'Liveblocks', 'Logfire', 'MagicMealKits', 'Memgraph', 'Milvus', 'NanoVMs', 'Netdata', 'NormanFinance', 'Notion', 'Nutrient', 'Octagon', 'OctoEverywhere', 'ONLYOFFICEDocSpace', 'OpenSearch', 'PlayCanvas', 'Pluggedin', 'PortIO', 'Putio', 'Rember', 'Riza', 'RobloxStudio', 'RootSignals', 'Shortcut', 'SonarQube', 'Sophtron', 'Tako', 'ThoughtSpot', 'Tianji', 'TradeAgent', 'Twilio', 'UnifAI', 'Upstash', 'WaveSpeed', 'YepCode', 'Yunxin', 'Zapier', 'ZIZAI Recruitment', 'OpsLevel', 'SmoothOperator', 'TextIn']
+
+
+def create_registry_documents(server: dict) -> List[Dict[str, Any]]:
+    """
+    Create tool documents from the server information, without ids or embeddings.
+    Args:
+        server (dict): The server information containing tools.
+    Returns:
+        List[Dict[str, Any]]: Tool documents with server, toolset, name, description and the text to embed.
+    """
+    documents = []
+    server_name = server.get("name", "")
+    for toolset in server.get("toolsets", []):
+        for tool in toolset.get("tools", []):
+            documents.append({
+                "server": server_name,
+                "toolset": toolset.get("name", ""),
+                "name": tool.get("name", ""),
+                "description": f"{tool.get('description', '')} Keywords: {', '.join(tool.get('keywords', []))}. Examples: {'; '.join(tool.get('sample_questions', []))}",
+                "embedding_text": f"Server name: {server_name} Tool name: {tool.get('name', '')}: Description: {tool.get('description', '')}."
+            })
+    return documents
+
+
+def registry_tool_id(server: str, toolset: str, name: str) -> str:
+    """
+    Derive a tool's document id from its server, toolset and name. Every process and every ingest derives the same id,
+    so workers syncing the same registry change upsert one document instead of one each.
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"mcp-tool://{server}/{toolset}/{name}"))
+
 
 class AzureSearchManager():
     """Manager for Azure Search and Azure OpenAI embedding operations."""
@@ -31,69 +69,174 @@ class AzureSearchManager():
         # Azure Search configuration
         self.azure_search_endpoint = config.get('AzureSearch', 'AZURE_SEARCH_ENDPOINT')
         self.azure_search_index_name = config.get('AzureSearch', 'AZURE_SEARCH_INDEX_NAME')
+        # Written by blue/green rebuilds. When present it names the index currently serving.
+        self.active_index_file = config.get('AzureSearch', 'ACTIVE_INDEX_FILE', fallback='')
+        if self.active_index_file and os.path.isfile(self.active_index_file):
+            with open(self.active_index_file, 'r', encoding='utf-8') as f:
+                self.azure_search_index_name = f.read().strip() or self.azure_search_index_name
+
+        # One circuit breaker per upstream service
+        breaker_settings = dict(
+            failure_rate_threshold=config.getfloat('CircuitBreaker', 'FAILURE_RATE_THRESHOLD', fallback=0.5),
+            slow_call_seconds=config.getint('CircuitBreaker', 'SLOW_CALL_MS', fallback=2000) / 1000,
+            window_size=config.getint('CircuitBreaker', 'WINDOW_SIZE', fallback=20),
+            minimum_calls=config.getint('CircuitBreaker', 'MINIMUM_CALLS', fallback=5),
+            reset_timeout=config.getfloat('CircuitBreaker', 'RESET_TIMEOUT_SECONDS', fallback=30.0)
+        )
+        self.embedding_breaker = CircuitBreaker("embedding", **breaker_settings)
+        # Index builds and registry reloads embed hundreds of tools at once. They get their own breaker,
+        # so a burst that is throttled or slow cannot open the one live queries go through.
+        self.background_embedding_breaker = CircuitBreaker("embedding_background", **breaker_settings)
+        self.search_breaker = CircuitBreaker("azure_search", **breaker_settings)
 
         # Azure Auth configuration
-        credential = DefaultAzureCredential()
-        token_provider = get_bearer_token_provider(credential, "https://cognitiveservices.azure.com/.default")
+        self.credential = DefaultAzureCredential()
+        self.token_provider = get_bearer_token_provider(self.credential, "https://cognitiveservices.azure.com/.default")
 
         # Initialize Azure OpenAI embedding model
         self.embedding_client = AzureOpenAI(
             azure_endpoint=self.azure_foundry_endpoint,
             azure_deployment=self.azure_embedding_deployment,
             api_version=self.azure_api_version,
-            azure_ad_token_provider=token_provider,
+            azure_ad_token_provider=self.token_provider,
         )
 
+        # Optional CPU-local embedding model. When loaded it embeds every query and tool instead of Azure OpenAI,
+        # so the index vectors and the semantic cache use its dimensions.
+        self.embedding_provider = load_embedding_provider(config) or AzureOpenAIEmbeddingProvider(
+            self.embedding_client, self.azure_embedding_model, self.azure_embedding_dimensions, self.embedding_breaker,
+            self.background_embedding_breaker)
+        self.azure_embedding_dimensions = self.embedding_provider.dimensions
+
+        # Concurrent requests to embed the same text share one upstream call
+        self.embedding_flight = SingleFlight("embedding") if config.getboolean('ToolRouter', 'SINGLE_FLIGHT', fallback=True) else None
+
         # Initialize Azure Search client
         self.azure_search_client = SearchClient(
             endpoint=self.azure_search_endpoint,
             index_name=self.azure_search_index_name,
-            credential=credential
+            credential=self.credential
         )
+        self.index_client = SearchIndexClient(endpoint=self.azure_search_endpoint, credential=self.credential)
+
+
+    async def acquire_tokens(self) -> bool:
+        """
+        Acquire the Azure OpenAI and Azure Search auth tokens ahead of the first request.
+        The credential chain can block for seconds (managed identity probe, az CLI), so it runs in a worker thread.
+        Returns:
+            bool: True if both tokens were acquired, False otherwise.
+        """
+        try:
+            await asyncio.to_thread(self.token_provider)
+            await asyncio.to_thread(self.credential.get_token, "https://search.azure.com/.default")
+            return True
+        except Exception as e:
+            logging.error(f"Error acquiring Azure auth tokens: {e}")
+            return False
+
+
+    def close(self) -> None:
+        """Close the Azure Search and Azure OpenAI clients."""
+        try:
+            self.azure_search_client.close()
+            self.index_client.close()
+            self.embedding_client.close()
+            self.embedding_provider.close()
+        except Exception as e:
+            logging.error(f"Error closing Azure clients: {e}")
 
 
-    async def create_text_embedding(self, text) -> List[float]:
+    async def create_text_embedding(self, text, timeout: float = None) -> List[float]:
         """
-        Embed text using Azure OpenAI embedding model.
+        Embed text using Azure OpenAI embedding model, or the local embedding model when one is configured.
+        Concurrent calls for the same text share one upstream call when single-flight is enabled.
         Args:
             text (str): The text to embed.
+            timeout (float): Optional seconds to wait for the embedding deployment.
         Returns:
-            List[float]: The embedding vector for the text.
+            List[float]: The embedding vector for the text, or None if the call failed, timed out or the breaker is open.
         """
+        if self.embedding_flight is None:
+            return await self._create_text_embedding(text, timeout=timeout)
         try:
-            response = self.embedding_client.embeddings.create(
-                model=self.azure_embedding_model,
-                input=[text],
-                dimensions=self.azure_embedding_dimensions
-            )
-            return response.data[0].embedding
-        except Exception as e:
-            logging.error("Error embedding text")
+            vector, _ = await self.embedding_flight.do(text, lambda: self._create_text_embedding(text, timeout=timeout), timeout=timeout)
+            return vector
+        except asyncio.TimeoutError:
+            logging.error(f"Embedding text timed out after {timeout}s")
             return None
 
 
-    async def perform_azure_search(self, search_text: str, top_k: int = 10, allowed_tools: List[str] = []):
+    async def _create_text_embedding(self, text, timeout: float = None) -> List[float]:
+        """Make the upstream embedding call for create_text_embedding."""
+        return await self.embedding_provider.embed_one(text, timeout=timeout)
+
+
+    async def create_background_embedding(self, text: str, semaphore: asyncio.Semaphore = None) -> Optional[List[float]]:
+        """
+        Embed a tool for an index build or registry reload. The call goes through the background embedding breaker
+        rather than the one live queries use, and bypasses single-flight.
+        Args:
+            text (str): The text to embed.
+            semaphore (asyncio.Semaphore): Optional limit on embedding requests in flight. Time spent waiting for a slot
+                is not part of the call, so it does not count as a slow call.
+        Returns:
+            List[float]: The embedding vector for the text, or None if the call failed or the breaker is open.
+        """
+        if semaphore is None:
+            return await self.embedding_provider.embed_one(text, background=True)
+        async with semaphore:
+            return await self.embedding_provider.embed_one(text, background=True)
+
+
+    def build_search_filter(self, allowed_tools: List[str] = [], servers: List[str] = None) -> str:
+        """
+        Build the OData filter restricting a search to allowed tools and servers.
+        Args:
+            allowed_tools (List[str]): A list of allowed tool IDs for the query.
+            servers (List[str]): Optional list of server names to restrict the search to.
+        Returns:
+            str: The filter string, empty when there is nothing to filter on.
+        """
+        cleaned_tools_list = [f"'{i}'" for i in allowed_tools] if allowed_tools else []
+
+        filters = []
+        if allowed_tools and len(allowed_tools) > 0:
+            filters.append(f"search.in(id, {','.join(cleaned_tools_list)})")
+        if servers:
+            # Server names can contain spaces and commas, so use '|' as the delimiter
+            cleaned_servers = "|".join(s.replace("'", "''") for s in servers)
+            filters.append(f"search.in(server, '{cleaned_servers}', '|')")
+        return " and ".join(filters)
+
+
+    async def perform_azure_search(self, search_text: str, top_k: int = 10, allowed_tools: List[str] = [], servers: List[str] = None, vector: List[float] = None, timeout: float = None):
         """
         Performs a hybrid search for documents in the specified Azure Search index.
         Args:
             search_text (str): The text to search for in the index.
             top_k (int): The number of top results to return.
             allowed_tools (List[str]): A list of allowed tool IDs for the query.
+            servers (List[str]): Optional list of server names to restrict the search to.
+            vector (List[float]): Optional precomputed embedding for search_text.
+            timeout (float): Optional seconds to wait for Azure Search.
         Returns:
-            SearchResults: The search results.
+            List[Dict[str, Any]]: The search results, or None if the search failed, timed out or the breaker is open.
         """
-        cleaned_tools_list = [f"'{i}'" for i in allowed_tools] if allowed_tools else []
+        filter_str = self.build_search_filter(allowed_tools=allowed_tools, servers=servers)
+        request_options = {"timeout": timeout} if timeout is not None else {}
 
-        if allowed_tools and len(allowed_tools) > 0:
-            filter_str = f"search.in(id, {','.join(cleaned_tools_list)})"
-        else:
-            filter_str = ""
+        if vector is None:
+            vector = await self.create_text_embedding(text=search_text, timeout=timeout)
+            if vector is None:
+                return None
 
         try:
-            results = self.azure_search_client.search(
+            # Results are paged lazily, so read them inside the guarded call
+            results = await self.search_breaker.call(lambda: list(self.azure_search_client.search(
                 search_text=search_text,
                 vector_queries=[VectorizedQuery(
-                    vector=await self.create_text_embedding(text=search_text),
+                    vector=vector,
                     k_nearest_neighbors=top_k,
                     fields="tool_vector"
                 )],
@@ -101,82 +244,318 @@ class AzureSearchManager():
                 semantic_configuration_name="default",
                 select=["id", "server", "toolset", "name", "description"],
                 top=top_k,
-                filter=filter_str
-            )
+                filter=filter_str,
+                **request_options
+            )), timeout=timeout)
             return results
+        except CircuitOpenError as e:
+            logging.warning(f"Skipping search: {e}")
+            return None
+        except asyncio.TimeoutError:
+            logging.error(f"Searching documents timed out after {timeout}s")
+            return None
         except Exception as e:
             logging.error(f"Error searching documents: {e}")
             return None
-    
 
-    async def clear_azure_search_index(self):
+
+    async def perform_lexical_search(self, search_text: str, top_k: int = 10, allowed_tools: List[str] = [], timeout: float = None):
         """
-        Clear all documents from the specified Azure Search index.
+        Performs a keyword-only search, with no embedding and no semantic reranking. Used as a degraded fallback.
         Args:
-            client (SearchClient): The Azure Search client to use for clearing the index.
+            search_text (str): The text to search for in the index.
+            top_k (int): The number of top results to return.
+            allowed_tools (List[str]): A list of allowed tool IDs for the query.
+            timeout (float): Optional seconds to wait for Azure Search.
         Returns:
-            None: If the operation is successful, or an error message if it fails.
+            List[Dict[str, Any]]: The search results, or None if the search failed, timed out or the breaker is open.
         """
+        request_options = {"timeout": timeout} if timeout is not None else {}
         try:
-            # First, retrieve all document IDs
-            results = self.azure_search_client.search(
-                search_text="*",
-                select=["id"]
-            )
-            ids_to_delete = [doc['id'] for doc in results]
+            return await self.search_breaker.call(lambda: list(self.azure_search_client.search(
+                query_type="simple",
+                search_text=search_text,
+                select=["id", "server", "toolset", "name", "description"],
+                top=top_k,
+                filter=self.build_search_filter(allowed_tools=allowed_tools),
+                **request_options
+            )), timeout=timeout)
+        except CircuitOpenError as e:
+            logging.warning(f"Skipping lexical search: {e}")
+            return None
         except Exception as e:
-            logging.error(f"Error retrieving documents for clearing index: {e}")
-            ids_to_delete = []
+            logging.error(f"Error running lexical search: {e}")
+            return None
+    
 
-        if not ids_to_delete or len(ids_to_delete) == 0:
-            logging.info("No documents to delete.")
+    async def run_document_batches(self, action: Callable[[List[Dict[str, Any]]], Any], documents: List[Dict[str, Any]],
+                                   batch_size: int = 1000, max_concurrent_batches: int = 4, label: str = "Processed") -> int:
+        """
+        Send documents to the index in batches, with a bounded number of batches in flight.
+        Args:
+            action (Callable): A blocking client call taking one batch, e.g. SearchClient.delete_documents.
+            documents (List[Dict[str, Any]]): The documents to send.
+            batch_size (int): Documents per request. Azure Search accepts at most 1000.
+            max_concurrent_batches (int): Requests in flight at the same time.
+            label (str): Verb for the progress log.
+        Returns:
+            int: The number of documents in batches that succeeded.
+        """
+        semaphore = asyncio.Semaphore(max(max_concurrent_batches, 1))
+        batch_size = min(max(batch_size, 1), 1000)
+
+        async def send(batch: List[Dict[str, Any]]) -> int:
+            async with semaphore:
+                try:
+                    await asyncio.to_thread(action, batch)
+                    return len(batch)
+                except Exception as e:
+                    logging.error(f"Error sending a batch of {len(batch)} documents: {e}")
+                    return 0
+
+        batches = [documents[i:i + batch_size] for i in range(0, len(documents), batch_size)]
+        done = 0
+        for finished in asyncio.as_completed([send(batch) for batch in batches]):
+            done += await finished
+            logging.info(f"{label} {done}/{len(documents)} documents.")
+        return done
+
+
+    async def clear_azure_search_index(self, batch_size: int = 1000, max_concurrent_batches: int = 4, search_client: SearchClient = None) -> Optional[int]:
+        """
+        Delete every document from the Azure Search index, one page of ids at a time.
+        Each round reads at most batch_size * max_concurrent_batches ids and deletes them in concurrent batches.
+        Only the previous round's ids are remembered, so memory use is bounded by one page however large the index is.
+        Rounds repeat until a search returns nothing.
+        Args:
+            batch_size (int): Documents per delete request. Azure Search accepts at most 1000.
+            max_concurrent_batches (int): Delete requests in flight at the same time.
+            search_client (SearchClient): The index to clear. Defaults to the index currently serving.
+        Returns:
+            int: The number of documents deleted, or None if reading or deleting failed.
+        """
+        client = search_client or self.azure_search_client
+        page_size = min(max(batch_size, 1), 1000) * max(max_concurrent_batches, 1)
+        try:
+            total = await asyncio.to_thread(client.get_document_count)
+        except Exception as e:
+            logging.error(f"Error counting documents for clearing index: {e}")
             return None
+        if not total:
+            logging.info("No documents to delete.")
+            return 0
+
+        deleted_count = 0
+        previous_ids = set()
+        stale_rounds = 0
+        while True:
+            try:
+                page = await asyncio.to_thread(lambda: [doc['id'] for doc in client.search(search_text="*", select=["id"], top=page_size)])
+            except Exception as e:
+                logging.error(f"Error retrieving documents for clearing index: {e}")
+                return None
+            if not page:
+                break
+            # Deletes become visible to search after a short refresh delay, so the last round's ids can come back once or twice.
+            # Ids from older rounds are rare and deleting a missing document succeeds, so they are simply sent again.
+            ids_to_delete = [id for id in page if id not in previous_ids]
+            if not ids_to_delete:
+                stale_rounds += 1
+                if stale_rounds > 10:
+                    logging.error(f"Deleted documents are still returned by the index after {stale_rounds} retries.")
+                    return None
+                await asyncio.sleep(1)
+                continue
+            stale_rounds = 0
 
-        # Now, delete documents in bulk
+            deleted = await self.run_document_batches(client.delete_documents, [{"id": id} for id in ids_to_delete],
+                                                      batch_size=batch_size, max_concurrent_batches=max_concurrent_batches, label="Deleted")
+            if deleted < len(ids_to_delete):
+                logging.error(f"Failed to delete {len(ids_to_delete) - deleted} documents. {deleted_count + deleted} of about {total} were deleted.")
+                return None
+            deleted_count += deleted
+            previous_ids = set(ids_to_delete)
+            logging.info(f"Cleared {deleted_count} of about {total} documents from the index.")
+
+        return deleted_count
+
+
+    async def get_tool_documents(self, search_client: SearchClient = None) -> Optional[List[Dict[str, str]]]:
+        """
+        Read the id, server, toolset and name of every tool in the Azure Search index, without vectors.
+        Args:
+            search_client (SearchClient): The index to read. Defaults to the index currently serving.
+        Returns:
+            List[Dict[str, str]]: The tool documents, or None if the index could not be read.
+        """
+        client = search_client or self.azure_search_client
         try:
-            result = self.azure_search_client.delete_documents(documents=[{"id": id} for id in ids_to_delete])
-            return result
+            return await asyncio.to_thread(lambda: [{key: doc[key] for key in ("id", "server", "toolset", "name")}
+                                                    for doc in client.search(search_text="*", select=["id", "server", "toolset", "name"])])
         except Exception as e:
-            logging.error(f"Error deleting documents from index: {e}")
+            logging.error(f"Error reading tool documents from the Azure Search index: {e}")
             return None
-        
 
-    async def create_tools_from_file(self, file_path: str) -> bool:
+
+    async def build_tool_documents(self, file_path: str, existing_ids: Dict[Tuple[str, str, str], str] = None,
+                                   max_concurrent_embeddings: int = 16) -> List[Dict[str, Any]]:
+        """
+        Read an MCP server registry and embed its tools as Azure Search documents.
+        Args:
+            file_path (str): The path to the JSON file containing MCP server information.
+            existing_ids (Dict[Tuple[str, str, str], str]): Optional ids by (server, toolset, name) to keep, so allowed_tools lists stay valid across a rebuild.
+            max_concurrent_embeddings (int): Embedding requests in flight at the same time, across all servers.
+        Returns:
+            List[Dict[str, Any]]: The tool documents, including tool_vector.
+        """
+        if not file_path or not file_path.endswith('.json'):
+            raise ValueError("Invalid file path. Must be a JSON file.")
+
+        with open(file_path, 'r', encoding='utf-8') as f:
+            mcp_servers = json.load(f)
+
+        semaphore = asyncio.Semaphore(max(max_concurrent_embeddings, 1))
+        servers = [server for server in mcp_servers.get("servers", []) if server.get("name") in SERVERS_WITH_MORE_THAN_5_TOOLS]
+        server_documents = await asyncio.gather(*[self.create_tool_dictionaries(server, existing_ids=existing_ids, semaphore=semaphore) for server in servers])
+        return [document for documents in server_documents for document in documents]
+
+
+    async def create_tools_from_file(self, file_path: str, local_index_path: str = None, search_client: SearchClient = None,
+                                     existing_ids: Dict[Tuple[str, str, str], str] = None) -> bool:
         """
         Create tools from a JSON file and upload them to Azure Search.
         This function reads a JSON file containing MCP server information, extracts tool metadata, and uploads each tool as a document to the Azure Search index.
 
         Args:
             file_path (str): The path to the JSON file containing MCP server information.
+            local_index_path (str): Optional path to also save the uploaded tools as a local tool index, used for hierarchical routing.
+            search_client (SearchClient): The index to upload to. Defaults to the index currently serving.
+            existing_ids (Dict[Tuple[str, str, str], str]): Optional ids to keep, see build_tool_documents.
         Returns:
             bool: True if the operation is successful, False otherwise.
         """
+        client = search_client or self.azure_search_client
+        documents = await self.build_tool_documents(file_path, existing_ids=existing_ids)
+        uploaded = await self.run_document_batches(client.upload_documents, documents, label="Uploaded")
+        logging.info(f"Uploaded {uploaded} of {len(documents)} tools to Azure Search.")
+        if uploaded < len(documents):
+            return False
 
-        if not file_path or not file_path.endswith('.json'):
-            raise ValueError("Invalid file path. Must be a JSON file.")
+        if local_index_path:
+            LocalToolIndex(documents).save_to_file(local_index_path)
+        return True
 
-        with open(file_path, 'r', encoding='utf-8') as f:
-            mcp_servers = json.load(f)
 
-        # TEMPORARY: List of servers with more than 5 tools to limit noise in the search index
-        servers_with_more_than_5_tools = ['GitHub', 'Azure', 'VSCode', 'ActionKitbyParagon', 'AlibabaCloudOPS', 'AlibabaCloudRDS', 'AllVoiceLab', 'ApacheIoTDB', 'AqaraMCPServer', 'Auth0', 'AWS', 'BoostSpace', 'Campertunity', 'Cloudinary', 'CodeLogic', 'CoinGecko', 'DevRev', 'Drata', 'DumplingAI', 'fetchSERP', 'FluidAttacks', 'Globalping', 'Hiveflow', 'HubSpot', 'Hunter', 'Hyperbolic', 'Hyperbrowser', 'IntegrationApp', 'JFrog', 'Klaviyo', 'klusterai', 'LaunchDarkly', 'LINE', 'Linear', 'Lingodev', 'Liveblocks', 'Logfire', 'MagicMealKits', 'Memgraph', 'Milvus', 'NanoVMs', 'Netdata', 'NormanFinance', 'Notion', 'Nutrient', 'Octagon', 'OctoEverywhere', 'ONLYOFFICEDocSpace', 'OpenSearch', 'PlayCanvas', 'Pluggedin', 'PortIO', 'Putio', 'Rember', 'Riza', 'RobloxStudio', 'RootSignals', 'Shortcut', 'SonarQube', 'Sophtron', 'Tako', 'ThoughtSpot', 'Tianji', 'TradeAgent', 'Twilio', 'UnifAI', 'Upstash', 'WaveSpeed', 'YepCode', 'Yunxin', 'Zapier', 'ZIZAI Recruitment', 'OpsLevel', 'SmoothOperator', 'TextIn']
+    def get_vector_field_dimensions(self, field_name: str = "tool_vector") -> Optional[int]:
+        """
+        Read the size of the vector field from the schema of the index currently serving.
+        Args:
+            field_name (str): The vector field.
+        Returns:
+            int: The field's dimensions, or None if the schema could not be read or has no such field.
+        """
+        try:
+            schema = self.index_client.get_index(self.azure_search_index_name)
+        except Exception as e:
+            logging.error(f"Error reading the schema of index '{self.azure_search_index_name}': {e}")
+            return None
+        for field in schema.fields:
+            if field.name == field_name:
+                return field.vector_search_dimensions
+        logging.error(f"Index '{self.azure_search_index_name}' has no vector field '{field_name}'.")
+        return None
+
 
-        for server in mcp_servers.get("servers", []):
-            if server.get("name") in servers_with_more_than_5_tools:
-                toolset = await self.create_tool_dictionaries(server)
-                try: 
-                    self.azure_search_client.upload_documents(documents=[tool for tool in toolset])
-                    logging.info(f"Uploaded {len(toolset)} tools for server '{server.get('name')}' to Azure Search index '{self.azure_search_index_name}'.")
-                except Exception as e:
-                    logging.error(f"Error uploading tools for server '{server.get('name')}': {e}")
+    def create_staging_index(self, index_name: str) -> Optional[SearchClient]:
+        """
+        Create an empty index with the same schema as the index currently serving, for a blue/green rebuild.
+        Args:
+            index_name (str): The new index name.
+        Returns:
+            SearchClient: A client for the new index, or None if it could not be created.
+        """
+        try:
+            schema = self.index_client.get_index(self.azure_search_index_name)
+            schema.name = index_name
+            schema.e_tag = None
+            self.index_client.create_index(schema)
+            logging.info(f"Created staging index '{index_name}' from '{self.azure_search_index_name}'.")
+            return SearchClient(endpoint=self.azure_search_endpoint, index_name=index_name, credential=self.credential)
+        except Exception as e:
+            logging.error(f"Error creating staging index '{index_name}': {e}")
+            return None
+
+
+    def switch_index(self, index_name: str, search_client: SearchClient) -> str:
+        """
+        Point every subsequent search at another index. Searches already running finish against the old one.
+        The active index name is saved to ACTIVE_INDEX_FILE, so a restart keeps serving it.
+        Args:
+            index_name (str): The index to serve from.
+            search_client (SearchClient): A client for that index.
+        Returns:
+            str: The name of the index that was serving before.
+        """
+        previous_index_name = self.azure_search_index_name
+        self.azure_search_client = search_client
+        self.azure_search_index_name = index_name
+        if self.active_index_file:
+            try:
+                with open(self.active_index_file, 'w', encoding='utf-8') as f:
+                    f.write(index_name)
+            except Exception as e:
+                logging.error(f"Error saving the active index name to '{self.active_index_file}': {e}")
+        logging.info(f"Switched Azure Search from index '{previous_index_name}' to '{index_name}'.")
+        return previous_index_name
+
+
+    def delete_index(self, index_name: str) -> bool:
+        """
+        Delete an index, e.g. the previous one after a blue/green rebuild.
+        Args:
+            index_name (str): The index to delete. The index currently serving is never deleted.
+        Returns:
+            bool: True if the index was deleted.
+        """
+        if index_name == self.azure_search_index_name:
+            logging.error(f"Refusing to delete '{index_name}', the index currently serving.")
+            return False
+        try:
+            self.index_client.delete_index(index_name)
+            logging.info(f"Deleted index '{index_name}'.")
+            return True
+        except Exception as e:
+            logging.error(f"Error deleting index '{index_name}': {e}")
+            return False
+
+
+    async def apply_tool_delta(self, upserts: List[Dict[str, Any]], deletes: List[str]) -> bool:
+        """
+        Apply a per-tool change set to the Azure Search index in place, without clearing it.
+        Args:
+            upserts (List[Dict[str, Any]]): Added or changed tool documents, including tool_vector.
+            deletes (List[str]): IDs of removed tools.
+        Returns:
+            bool: True if the operation is successful, False otherwise.
+        """
+        client = self.azure_search_client
+        upserted = await self.run_document_batches(client.merge_or_upload_documents, upserts, label="Upserted") if upserts else 0
+        deleted = await self.run_document_batches(client.delete_documents, [{"id": id} for id in deletes], label="Deleted") if deletes else 0
+        if upserted < len(upserts) or deleted < len(deletes):
+            logging.error(f"Error applying tool delta to Azure Search index: {upserted}/{len(upserts)} upserted, {deleted}/{len(deletes)} deleted.")
+            return False
+        logging.info(f"Applied tool delta to Azure Search index '{self.azure_search_index_name}': {len(upserts)} upserted, {len(deletes)} deleted.")
         return True
 
 
-    async def create_tool_dictionaries(self, server:dict) -> List[Dict[str, Any]]:
+    async def create_tool_dictionaries(self, server:dict, existing_ids: Dict[Tuple[str, str, str], str] = None,
+                                       semaphore: asyncio.Semaphore = None) -> List[Dict[str, Any]]:
         """
-        Create a list of tool dictionaries from the server information.
+        Create a list of tool dictionaries from the server information. The tools are embedded concurrently.
         Args:
             server (dict): The server information containing tools.
+            existing_ids (Dict[Tuple[str, str, str], str]): Optional ids by (server, toolset, name) to reuse instead of derived ones.
+            semaphore (asyncio.Semaphore): Optional limit on embedding requests in flight, shared between servers.
         Returns:
             List[Dict[str, Any]]: A list of dictionaries representing tools.
         """
@@ -184,19 +563,16 @@ class AzureSearchManager():
             """Removes special characters that the Azure Search index key does not support."""
             return re.sub(r'[^a-zA-Z0-9_\-]', '', s)
 
+        documents = create_registry_documents(server)
+        vectors = await asyncio.gather(*[self.create_background_embedding(document["embedding_text"], semaphore) for document in documents])
         tools_to_return = []
-        server_name = server.get("name", "")
-        toolsets = server.get("toolsets", [])
-        for toolset in toolsets:
-            tools = toolset.get("tools", [])
-            for tool in tools:
-                tools_to_return.append({
-                    "id": str(uuid.uuid4()),
-                    "server": server_name,
-                    "toolset": toolset.get("name", ""),
-                    "name": tool.get("name", ""),
-                    "description": f"{tool.get('description', '')} Keywords: {', '.join(tool.get('keywords', []))}. Examples: {'; '.join(tool.get('sample_questions', []))}",
-                    "tool_vector": await self.create_text_embedding(text=f"Server name: {server_name} Tool name: {tool.get('name', '')}: Description: {tool.get('description', '')}.")
-                })
+        for document, vector in zip(documents, vectors):
+            tools_to_return.append({
+                "id": (existing_ids or {}).get((document["server"], document["toolset"], document["name"])) or registry_tool_id(document["server"], document["toolset"], document["name"]),
+                "server": document["server"],
+                "toolset": document["toolset"],
+                "name": document["name"],
+                "description": document["description"],
+                "tool_vector": vector
+            })
         return tools_to_return
-    
\ No newline at end of file
@@ -0,0 +1,206 @@
+import asyncio, logging
+import numpy as np
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Hashable, Callable, Awaitable, Tuple
+from utils_objects import Tool
+
+
+class SemanticCache():
+    """Bounded LRU cache of routing results, looked up by query embedding similarity."""
+
+    def __init__(self, capacity: int = 1024, threshold: float = 0.95, dimensions: int = 1536):
+        """
+        Initialize the cache with a fixed amount of vector memory.
+        Args:
+            capacity (int): The maximum number of cached queries.
+            threshold (float): The minimum cosine similarity for a cached query to count as a hit.
+            dimensions (int): The embedding dimensions.
+        """
+        self.capacity = max(capacity, 1)
+        self.threshold = threshold
+        self.dimensions = dimensions
+
+        # Query vectors live in one preallocated matrix so a lookup is a single matrix-vector product
+        self.vectors = np.zeros((self.capacity, dimensions), dtype=np.float32)
+        self.slot_scopes = np.zeros(self.capacity, dtype=np.int64)
+        self.slot_used = np.zeros(self.capacity, dtype=bool)
+        self.free_slots = list(range(self.capacity - 1, -1, -1))
+
+        # LRU order of (scope, text) keys, oldest first. Values are (slot, tools).
+        self.entries: "OrderedDict[tuple, tuple[int, List[Tool]]]" = OrderedDict()
+        self.slot_keys: Dict[int, tuple] = {}
+
+        self.hits = 0
+        self.exact_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """Normalize query text for the exact-match fast path."""
+        return " ".join(text.lower().split())
+
+    def lookup_text(self, text: str, scope: Hashable) -> Optional[List[Tool]]:
+        """
+        Look up a query by its exact normalized text. This path does not need an embedding.
+        Args:
+            text (str): The query text.
+            scope (Hashable): Request parameters that must match, e.g. top_k and allowed_tools.
+        Returns:
+            List[Tool]: The cached tools, or None on a miss. Misses are not counted, lookup() follows.
+        """
+        key = (hash(scope), self.normalize_text(text))
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        self.exact_hits += 1
+        return list(entry[1])
+
+    def lookup(self, query_vector: List[float], scope: Hashable, threshold: float = None) -> Optional[List[Tool]]:
+        """
+        Look up the most similar cached query in the same scope.
+        Args:
+            query_vector (List[float]): The query embedding.
+            scope (Hashable): Request parameters that must match, e.g. top_k and allowed_tools.
+            threshold (float): Optional similarity threshold overriding the cache default.
+        Returns:
+            List[Tool]: The cached tools if the best match clears the threshold, otherwise None.
+        """
+        if not self.entries or query_vector is None:
+            self.misses += 1
+            return None
+        query = self._normalize(query_vector)
+        candidates = np.flatnonzero(self.slot_used & (self.slot_scopes == hash(scope)))
+        if query is None or candidates.size == 0:
+            self.misses += 1
+            return None
+
+        similarities = self.vectors[candidates] @ query
+        best = int(np.argmax(similarities))
+        if similarities[best] < (self.threshold if threshold is None else threshold):
+            self.misses += 1
+            return None
+
+        key = self.slot_keys[int(candidates[best])]
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return list(self.entries[key][1])
+
+    def store(self, text: str, query_vector: List[float], scope: Hashable, tools: List[Tool]) -> None:
+        """
+        Cache the tools returned for a query, evicting the least recently used entry when full.
+        Args:
+            text (str): The query text.
+            query_vector (List[float]): The query embedding.
+            scope (Hashable): Request parameters that must match on lookup.
+            tools (List[Tool]): The routed tools.
+        """
+        vector = self._normalize(query_vector) if query_vector is not None else None
+        if vector is None:
+            return
+        key = (hash(scope), self.normalize_text(text))
+        if key in self.entries:
+            slot = self.entries[key][0]
+            self.entries[key] = (slot, list(tools))
+            self.entries.move_to_end(key)
+            return
+
+        if not self.free_slots:
+            self._evict()
+        slot = self.free_slots.pop()
+        self.vectors[slot] = vector
+        self.slot_scopes[slot] = hash(scope)
+        self.slot_used[slot] = True
+        self.slot_keys[slot] = key
+        self.entries[key] = (slot, list(tools))
+
+    def clear(self) -> None:
+        """Drop every cached entry. Statistics are kept."""
+        self.entries.clear()
+        self.slot_keys.clear()
+        self.slot_used[:] = False
+        self.free_slots = list(range(self.capacity - 1, -1, -1))
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache size and hit-rate metrics."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "capacity": self.capacity,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "exact_hits": self.exact_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+    def _evict(self) -> None:
+        """Remove the least recently used entry and free its slot."""
+        key, (slot, _) = self.entries.popitem(last=False)
+        del self.slot_keys[slot]
+        self.slot_used[slot] = False
+        self.free_slots.append(slot)
+        self.evictions += 1
+
+    def _normalize(self, vector: List[float]) -> Optional[np.ndarray]:
+        """Return the vector as a unit-length float32 array, or None if its dimensions do not match the cache."""
+        vector = np.asarray(vector, dtype=np.float32)
+        if vector.shape != (self.dimensions,):
+            logging.warning(f"Semantic cache expected {self.dimensions} dimensions, got {vector.shape}.")
+            return None
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+
+class SingleFlight():
+    """Coalesces concurrent identical calls, so a burst of the same request makes one upstream call."""
+
+    def __init__(self, name: str):
+        """
+        Args:
+            name (str): The call name used in logs and status.
+        """
+        self.name = name
+        self.in_flight: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.upstream_calls = 0
+        self.coalesced_calls = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]], timeout: float = None) -> Tuple[Any, bool]:
+        """
+        Run func, or join the call already running for the same key.
+        The upstream call runs as its own task, so a caller that gives up or is cancelled does not cancel it for the others.
+        Args:
+            key (Hashable): Identifies identical calls.
+            func (Callable[[], Awaitable[Any]]): Makes the upstream call.
+            timeout (float): Optional seconds this caller waits. None waits for the result.
+        Returns:
+            Tuple[Any, bool]: The result, and whether it came from another caller's call.
+        Raises:
+            asyncio.TimeoutError: If the result is not ready within the timeout.
+        """
+        self.calls += 1
+        task = self.in_flight.get(key)
+        coalesced = task is not None
+        if coalesced:
+            self.coalesced_calls += 1
+        else:
+            self.upstream_calls += 1
+            task = asyncio.ensure_future(func())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        return await asyncio.wait_for(asyncio.shield(task), timeout=timeout), coalesced
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the call counters. coalesced_calls is the number of upstream calls saved."""
+        return {
+            "calls": self.calls,
+            "upstream_calls": self.upstream_calls,
+            "coalesced_calls": self.coalesced_calls,
+            "in_flight": len(self.in_flight)
+        }
@@ -0,0 +1,83 @@
+import re, json, math
+import numpy as np
+from dataclasses import asdict, replace
+from typing import List, Dict, Any, Tuple
+from utils_objects import Tool
+
+DESCRIPTION_MODES = ("full", "short", "name_only")
+# Rough size of a token in bytes of JSON for English text. Good enough to budget prompts without a tokenizer.
+BYTES_PER_TOKEN = 4
+SHORT_DESCRIPTION_CHARS = 160
+
+
+def shorten_description(description: str, description_mode: str = "full") -> str:
+    """
+    Shorten a tool description for the response.
+    Args:
+        description (str): The indexed description, which may end with the " Keywords: ... Examples: ..." ingest suffix.
+        description_mode (str): "full" keeps the description, "short" keeps its first sentence without keywords
+            and examples, "name_only" drops it.
+    Returns:
+        str: The description to return.
+    """
+    if description_mode == "name_only":
+        return ""
+    if description_mode != "short" or not description:
+        return description
+    text = description.split(" Keywords: ")[0].strip()
+    text = re.split(r'(?<=[.!?])\s', text, maxsplit=1)[0]
+    if len(text) > SHORT_DESCRIPTION_CHARS:
+        text = text[:SHORT_DESCRIPTION_CHARS].rsplit(' ', 1)[0] + "..."
+    return text
+
+
+def response_size(tool: Tool) -> Tuple[int, int]:
+    """Return the (bytes, estimated tokens) the tool adds to a JSON response."""
+    size = len(json.dumps(asdict(tool)).encode('utf-8'))
+    return size, math.ceil(size / BYTES_PER_TOKEN)
+
+
+def compact_tools(tools: List[Tool], max_tokens: int = None, max_bytes: int = None, description_mode: str = "full",
+                  vectors: Dict[str, np.ndarray] = None, duplicate_threshold: float = None) -> Tuple[List[Tool], Dict[str, Any]]:
+    """
+    Fit ranked tools into a response budget. Tools are taken in rank order, near-duplicates of a tool already
+    taken are dropped, and the list stops at the first tool that would exceed the budget.
+    Args:
+        tools (List[Tool]): Ranked tools, best first.
+        max_tokens (int): Optional budget in estimated tokens.
+        max_bytes (int): Optional budget in bytes of JSON.
+        description_mode (str): One of DESCRIPTION_MODES.
+        vectors (Dict[str, np.ndarray]): Unit-length tool vectors by tool id, used to detect near-duplicates.
+        duplicate_threshold (float): The cosine similarity above which a tool counts as a near-duplicate. None disables it.
+    Returns:
+        Tuple[List[Tool], Dict[str, Any]]: The tools to return and compaction details for the response kwargs.
+    """
+    selected, selected_vectors = [], []
+    used_bytes, used_tokens, duplicates, over_budget = 0, 0, 0, 0
+    for position, tool in enumerate(tools):
+        vector = vectors.get(tool.id) if vectors and duplicate_threshold is not None else None
+        if vector is not None and selected_vectors and float(np.max(np.stack(selected_vectors) @ vector)) >= duplicate_threshold:
+            duplicates += 1
+            continue
+
+        compact_tool = replace(tool, description=shorten_description(tool.description, description_mode), tool_vector=[])
+        tool_bytes, tool_tokens = response_size(compact_tool)
+        if (max_bytes is not None and used_bytes + tool_bytes > max_bytes) or (max_tokens is not None and used_tokens + tool_tokens > max_tokens):
+            # This tool and every lower-ranked one are left out
+            over_budget = len(tools) - position
+            break
+        selected.append(compact_tool)
+        if vector is not None:
+            selected_vectors.append(vector)
+        used_bytes += tool_bytes
+        used_tokens += tool_tokens
+
+    return selected, {
+        "description_mode": description_mode,
+        "max_tokens": max_tokens,
+        "max_bytes": max_bytes,
+        "bytes": used_bytes,
+        "estimated_tokens": used_tokens,
+        "dropped_duplicates": duplicates,
+        "dropped_over_budget": over_budget
+    }
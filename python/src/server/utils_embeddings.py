@@ -0,0 +1,299 @@
+import os, abc, asyncio, logging, configparser
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple, Any
+from utils_resilience import CircuitBreaker, CircuitOpenError
+
+
+class EmbeddingProvider(abc.ABC):
+    """
+    Interface for query and tool embedding providers. AzureSearchManager.create_text_embedding embeds through
+    the configured provider: the remote Azure OpenAI deployment by default, or a CPU-local model.
+    """
+    name = "base"
+    dimensions = 0
+
+    @abc.abstractmethod
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed a batch of texts.
+        Args:
+            texts (List[str]): The texts to embed.
+        Returns:
+            List[List[float]]: One vector per text.
+        """
+
+    async def embed_one(self, text: str, timeout: float = None, background: bool = False) -> Optional[List[float]]:
+        """
+        Embed a single text.
+        Args:
+            text (str): The text to embed.
+            timeout (float): Optional seconds to wait for the embedding.
+            background (bool): Whether this is an index build or reload rather than a live query.
+        Returns:
+            List[float]: The vector, or None if embedding failed or timed out.
+        """
+        try:
+            return (await asyncio.wait_for(self.embed([text]), timeout=timeout))[0]
+        except Exception as e:
+            logging.error(f"Error creating {self.name} embedding: {e}")
+            return None
+
+    @abc.abstractmethod
+    def stats(self) -> dict:
+        """Return the provider settings and counters for the status endpoint."""
+
+    def close(self) -> None:
+        """Release the provider's resources."""
+
+
+class AzureOpenAIEmbeddingProvider(EmbeddingProvider):
+    """The remote Azure OpenAI embedding deployment, called through the embedding circuit breaker."""
+    name = "azure_openai"
+
+    def __init__(self, client: Any, model: str, dimensions: int, breaker: CircuitBreaker, background_breaker: CircuitBreaker = None):
+        """
+        Args:
+            client (AzureOpenAI): The Azure OpenAI client. It is owned and closed by AzureSearchManager.
+            model (str): The embedding model name.
+            dimensions (int): The vector size requested from the model.
+            breaker (CircuitBreaker): The circuit breaker guarding the deployment for live queries.
+            background_breaker (CircuitBreaker): Optional breaker for index builds and reloads, so their failures
+                and slow calls do not open the breaker live queries go through.
+        """
+        self.client = client
+        self.model = model
+        self.dimensions = dimensions
+        self.breaker = breaker
+        self.background_breaker = background_breaker or breaker
+        self.requests = 0
+        self.texts = 0
+
+    async def embed(self, texts: List[str], timeout: float = None, breaker: CircuitBreaker = None) -> List[List[float]]:
+        """
+        Embed texts in one request, through breaker or by default the live query breaker.
+        Raises:
+            CircuitOpenError: If the breaker is open.
+            asyncio.TimeoutError: If the deployment does not answer within timeout.
+            Exception: If the request fails.
+        """
+        request_options = {"timeout": timeout} if timeout is not None else {}
+        self.requests += 1
+        self.texts += len(texts)
+        response = await (breaker or self.breaker).call(lambda: self.client.embeddings.create(
+            model=self.model,
+            input=texts,
+            dimensions=self.dimensions,
+            **request_options
+        ), timeout=timeout)
+        return [item.embedding for item in response.data]
+
+    async def embed_one(self, text: str, timeout: float = None, background: bool = False) -> Optional[List[float]]:
+        """Embed a single text. Returns None if the call failed, timed out or the breaker is open."""
+        try:
+            return (await self.embed([text], timeout=timeout, breaker=self.background_breaker if background else self.breaker))[0]
+        except CircuitOpenError as e:
+            logging.warning(f"Skipping embedding: {e}")
+            return None
+        except asyncio.TimeoutError:
+            logging.error(f"Embedding text timed out after {timeout}s")
+            return None
+        except Exception as e:
+            logging.error(f"Error embedding text: {e}")
+            return None
+
+    def stats(self) -> dict:
+        """Return the provider settings and request counters."""
+        return {
+            "provider": self.name,
+            "model": self.model,
+            "dimensions": self.dimensions,
+            "requests": self.requests,
+            "texts": self.texts
+        }
+
+
+class OnnxEmbeddingProvider(EmbeddingProvider):
+    """
+    CPU-local embedding model run with ONNX Runtime. The model directory must hold model.onnx and a
+    Hugging Face tokenizer.json. Nothing is ever downloaded.
+    Concurrent embed_one calls are collected into micro-batches, so a burst of queries shares one model run.
+    """
+    name = "onnx"
+
+    def __init__(self, model_path: str, threads: int = 4, workers: int = 1, batch_size: int = 32,
+                 batch_wait_ms: float = 2.0, max_tokens: int = 256, pooling: str = "mean", dimensions: int = 0):
+        """
+        Args:
+            model_path (str): The model directory on local disk.
+            threads (int): Threads ONNX Runtime uses within one model run.
+            workers (int): Model runs that may execute at the same time, each in its own worker thread.
+            batch_size (int): The maximum number of texts per model run.
+            batch_wait_ms (float): How long a query waits for others to share its model run.
+            max_tokens (int): Inputs are truncated to this many tokens.
+            pooling (str): "mean" over the attention mask, or "cls" for the first token.
+            dimensions (int): Keep only the leading dimensions of each vector. 0 keeps the model's full size.
+        Raises:
+            FileNotFoundError: If the model or tokenizer file is missing.
+            ImportError: If onnxruntime or tokenizers is not installed.
+        """
+        model_file = os.path.join(model_path, "model.onnx")
+        tokenizer_file = os.path.join(model_path, "tokenizer.json")
+        for file_path in (model_file, tokenizer_file):
+            if not os.path.isfile(file_path):
+                raise FileNotFoundError(f"Local embedding model file '{file_path}' not found. Models are never downloaded, copy it there first.")
+
+        # Optional dependencies, only needed when the local provider is enabled
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = max(threads, 1)
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(model_file, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_file)
+        self.tokenizer.enable_truncation(max_length=max_tokens)
+        self.tokenizer.enable_padding()
+
+        self.model_path = model_path
+        self.pooling = pooling
+        self.batch_size = max(batch_size, 1)
+        self.batch_wait = max(batch_wait_ms, 0) / 1000
+        self.executor = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="local-embedding")
+        self.pending: List[Tuple[str, asyncio.Future]] = []
+        self.flush_handle = None
+        self.batch_tasks = set()
+        self.batches = 0
+        self.texts = 0
+
+        # One run up front primes the session and tells us the model's output size
+        model_dimensions = self.encode(["warm up"]).shape[1]
+        self.dimensions = dimensions if 0 < dimensions < model_dimensions else model_dimensions
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Run the model on a batch of texts. Blocking, called from the worker threads.
+        Args:
+            texts (List[str]): The texts to embed.
+        Returns:
+            np.ndarray: Unit-length float32 vectors, one row per text.
+        """
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.asarray([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.asarray([e.attention_mask for e in encodings], dtype=np.int64)
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            inputs["token_type_ids"] = np.asarray([e.type_ids for e in encodings], dtype=np.int64)
+        outputs = self.session.run(None, {k: v for k, v in inputs.items() if k in self.input_names})[0]
+
+        if outputs.ndim == 3:
+            if self.pooling == "cls":
+                outputs = outputs[:, 0]
+            else:
+                mask = attention_mask[:, :, None].astype(np.float32)
+                outputs = (outputs * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1.0)
+        vectors = np.asarray(outputs, dtype=np.float32)
+        if self.dimensions:
+            vectors = vectors[:, :self.dimensions]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts in batches of at most batch_size, on the worker threads."""
+        loop = asyncio.get_running_loop()
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            vectors.extend((await loop.run_in_executor(self.executor, self.encode, batch)).tolist())
+            self.batches += 1
+            self.texts += len(batch)
+        return vectors
+
+    async def embed_one(self, text: str, timeout: float = None, background: bool = False) -> Optional[List[float]]:
+        """Queue a text for the next micro-batch and wait for its vector. Background texts share the same batches."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((text, future))
+        if len(self.pending) >= self.batch_size:
+            self._flush()
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.batch_wait, self._flush)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+        except Exception as e:
+            logging.error(f"Error creating {self.name} embedding: {e}")
+            return None
+
+    def _flush(self) -> None:
+        """Start a model run for every queued text."""
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        batch, self.pending = self.pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run_batch(batch))
+            self.batch_tasks.add(task)
+            task.add_done_callback(self.batch_tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        """Embed one micro-batch and resolve its waiters."""
+        try:
+            vectors = await self.embed([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+    def stats(self) -> dict:
+        """Return the provider settings and batch counters."""
+        return {
+            "provider": self.name,
+            "model_path": self.model_path,
+            "dimensions": self.dimensions,
+            "batches": self.batches,
+            "texts": self.texts,
+            "mean_batch_size": self.texts / self.batches if self.batches else 0.0
+        }
+
+    def close(self) -> None:
+        """Stop the worker threads."""
+        self.executor.shutdown(wait=False)
+
+
+def load_embedding_provider(config: configparser.ConfigParser) -> Optional[EmbeddingProvider]:
+    """
+    Build the embedding provider selected in the [LocalEmbeddings] section of config.ini.
+    A configured local provider that cannot be loaded is an error rather than a silent fallback to Azure OpenAI,
+    because the tool vectors in the index were built with the local model and would not match.
+    Args:
+        config (configparser.ConfigParser): The server configuration.
+    Returns:
+        EmbeddingProvider: The local provider, or None to use the remote Azure OpenAI deployment (AzureOpenAIEmbeddingProvider).
+    Raises:
+        ValueError: If EMBEDDING_PROVIDER is unknown.
+        FileNotFoundError: If the local model files are missing.
+    """
+    provider = config.get('LocalEmbeddings', 'EMBEDDING_PROVIDER', fallback='azure')
+    if provider == 'azure':
+        return None
+    if provider != 'onnx':
+        raise ValueError(f"Unknown EMBEDDING_PROVIDER '{provider}'. Use 'azure' or 'onnx'.")
+    local_provider = OnnxEmbeddingProvider(
+        model_path=config.get('LocalEmbeddings', 'LOCAL_EMBEDDING_MODEL_PATH', fallback=''),
+        threads=config.getint('LocalEmbeddings', 'LOCAL_EMBEDDING_THREADS', fallback=4),
+        workers=config.getint('LocalEmbeddings', 'LOCAL_EMBEDDING_WORKERS', fallback=1),
+        batch_size=config.getint('LocalEmbeddings', 'LOCAL_EMBEDDING_BATCH_SIZE', fallback=32),
+        batch_wait_ms=config.getfloat('LocalEmbeddings', 'LOCAL_EMBEDDING_BATCH_WAIT_MS', fallback=2.0),
+        max_tokens=config.getint('LocalEmbeddings', 'LOCAL_EMBEDDING_MAX_TOKENS', fallback=256),
+        pooling=config.get('LocalEmbeddings', 'LOCAL_EMBEDDING_POOLING', fallback='mean'),
+        dimensions=config.getint('LocalEmbeddings', 'LOCAL_EMBEDDING_DIMENSIONS', fallback=0)
+    )
+    logging.info(f"Loaded local embedding model from '{local_provider.model_path}' ({local_provider.dimensions} dimensions).")
+    return local_provider
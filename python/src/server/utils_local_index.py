@@ -0,0 +1,294 @@
+import os, json, logging
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
+from utils_objects import Tool
+
+
+class LocalToolIndex():
+    """Local copy of the tool index, grouped by server and toolset, with precomputed centroid embeddings."""
+
+    def __init__(self, documents: List[Dict[str, Any]]):
+        """
+        Build the index from tool documents shaped like the Azure Search documents.
+        Args:
+            documents (List[Dict[str, Any]]): Tool documents with id, server, toolset, name, description and tool_vector.
+        """
+        documents = [doc for doc in documents if doc.get('id') and doc.get('server') and doc.get('tool_vector')]
+        metadata = {
+            "ids": [doc['id'] for doc in documents],
+            "servers": [doc['server'] for doc in documents],
+            "toolsets": [doc.get('toolset') or '' for doc in documents],
+            "names": [doc.get('name', '') for doc in documents],
+            "descriptions": [doc.get('description', '') for doc in documents]
+        }
+        vectors = np.asarray([doc['tool_vector'] for doc in documents], dtype=np.float32)
+        self._build(metadata, self._normalize_rows(vectors) if len(documents) else np.zeros((0, 0), dtype=np.float32))
+
+    @classmethod
+    def from_arrays(cls, metadata: Dict[str, List[str]], vectors: np.ndarray) -> "LocalToolIndex":
+        """
+        Build the index around existing unit-length vectors without copying them, e.g. a read-only memory map.
+        Args:
+            metadata (Dict[str, List[str]]): Per-row ids, servers, toolsets, names and descriptions.
+            vectors (np.ndarray): Row-normalized float32 tool vectors.
+        Returns:
+            LocalToolIndex: The index.
+        """
+        index = cls.__new__(cls)
+        index._build(metadata, vectors)
+        return index
+
+    def _build(self, metadata: Dict[str, List[str]], vectors: np.ndarray) -> None:
+        """Set the index contents and precompute the server and toolset groupings."""
+        self.type = "local"
+        self.storage = "memory"
+        self.snapshot_info = None
+        self.prefix_dims = 0
+        self.prefix_vectors = None
+        self.shortlist_size = 0
+        self.ids = metadata["ids"]
+        self.servers = metadata["servers"]
+        self.toolsets = metadata["toolsets"]
+        self.names = metadata["names"]
+        self.descriptions = metadata["descriptions"]
+        self.id_to_row = {tool_id: row for row, tool_id in enumerate(self.ids)}
+        self.vectors = vectors
+
+        # Row membership per server and per (server, toolset)
+        self.server_rows: Dict[str, np.ndarray] = {}
+        self.toolset_rows: Dict[Tuple[str, str], np.ndarray] = {}
+        for row, (server, toolset) in enumerate(zip(self.servers, self.toolsets)):
+            self.server_rows.setdefault(server, []).append(row)
+            self.toolset_rows.setdefault((server, toolset), []).append(row)
+        self.server_rows = {k: np.asarray(v, dtype=np.int64) for k, v in self.server_rows.items()}
+        self.toolset_rows = {k: np.asarray(v, dtype=np.int64) for k, v in self.toolset_rows.items()}
+
+        # Precompute the centroid embeddings used by hierarchical routing
+        self.server_names = list(self.server_rows.keys())
+        self.server_centroids = self._centroids(list(self.server_rows.values()))
+        self.toolset_keys = list(self.toolset_rows.keys())
+        self.toolset_centroids = self._centroids(list(self.toolset_rows.values()))
+        server_positions = {server: i for i, server in enumerate(self.server_names)}
+        self.toolset_server_idx = np.asarray([server_positions[server] for server, _ in self.toolset_keys], dtype=np.int64)
+
+    def metadata(self) -> Dict[str, List[str]]:
+        """Return the per-row metadata lists."""
+        return {"ids": self.ids, "servers": self.servers, "toolsets": self.toolsets, "names": self.names, "descriptions": self.descriptions}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @staticmethod
+    def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+        """Scale each row to unit length so dot products are cosine similarities."""
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def enable_two_stage(self, prefix_dims: int = 256, shortlist_size: int = 100) -> None:
+        """
+        Precompute the truncated vectors used by two-stage search. text-embedding-3 models are trained so that
+        a renormalized prefix of an embedding is itself a usable, lower-fidelity embedding.
+        Args:
+            prefix_dims (int): The number of leading dimensions scanned in the first pass. 0 disables two-stage search.
+            shortlist_size (int): The number of candidates re-scored at full dimension in the second pass.
+        """
+        if len(self) == 0 or prefix_dims <= 0 or prefix_dims >= self.vectors.shape[1]:
+            self.prefix_dims, self.prefix_vectors, self.shortlist_size = 0, None, 0
+            return
+        self.prefix_dims = prefix_dims
+        self.shortlist_size = shortlist_size
+        # A contiguous copy, so the first pass streams prefix_dims floats per tool rather than strided full rows
+        self.prefix_vectors = np.ascontiguousarray(self._normalize_rows(np.asarray(self.vectors[:, :prefix_dims], dtype=np.float32)))
+
+    def _centroids(self, groups: List[np.ndarray]) -> np.ndarray:
+        """Return one normalized mean vector per group of rows."""
+        if not groups:
+            return np.zeros((0, self.vectors.shape[1] if self.vectors.size else 0), dtype=np.float32)
+        return self._normalize_rows(np.stack([self.vectors[rows].mean(axis=0) for rows in groups]))
+
+    def rank_servers(self, query_vector: List[float], top_n: int = 3, allowed_tools: List[str] = []) -> List[str]:
+        """
+        Score the query against server and toolset centroids and return the best servers.
+        A server scores the higher of its own centroid and its best toolset centroid.
+        Args:
+            query_vector (List[float]): The query embedding.
+            top_n (int): The number of servers to return.
+            allowed_tools (List[str]): A list of allowed tool IDs. Servers and toolsets without an allowed tool are skipped
+                and centroids are computed over the allowed tools only.
+        Returns:
+            List[str]: Server names ordered by score.
+        """
+        if len(self) == 0 or query_vector is None:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        if allowed_tools:
+            allowed_rows = np.asarray([self.id_to_row[i] for i in allowed_tools if i in self.id_to_row], dtype=np.int64)
+            if allowed_rows.size == 0:
+                return []
+            mask = np.zeros(len(self), dtype=bool)
+            mask[allowed_rows] = True
+            server_groups = {s: rows[mask[rows]] for s, rows in self.server_rows.items()}
+            toolset_groups = {k: rows[mask[rows]] for k, rows in self.toolset_rows.items()}
+            server_groups = {s: rows for s, rows in server_groups.items() if rows.size}
+            toolset_groups = {k: rows for k, rows in toolset_groups.items() if rows.size}
+            server_names = list(server_groups.keys())
+            server_scores = self._centroids(list(server_groups.values())) @ query
+            toolset_servers = [server_names.index(server) for server, _ in toolset_groups.keys()]
+            toolset_scores = self._centroids(list(toolset_groups.values())) @ query
+        else:
+            server_names = self.server_names
+            server_scores = self.server_centroids @ query
+            toolset_servers = self.toolset_server_idx
+            toolset_scores = self.toolset_centroids @ query
+
+        # Lift each server to its best toolset score
+        np.maximum.at(server_scores, np.asarray(toolset_servers, dtype=np.int64), toolset_scores)
+
+        order = np.argsort(-server_scores)[:max(top_n, 0)]
+        return [server_names[i] for i in order]
+
+    def search(self, query_vector: List[float], top_k: int = 10, allowed_tools: List[str] = [], servers: List[str] = None, exact: bool = False) -> List[Tool]:
+        """
+        Cosine similarity search over the local tool vectors.
+        When two-stage search is enabled, candidates are shortlisted on the truncated prefix vectors
+        and only the shortlist is re-scored at full dimension.
+        Args:
+            query_vector (List[float]): The query embedding.
+            top_k (int): The number of top results to return.
+            allowed_tools (List[str]): A list of allowed tool IDs for the query.
+            servers (List[str]): Optional list of server names to restrict the search to.
+            exact (bool): Score every candidate at full dimension even when two-stage search is enabled.
+        Returns:
+            List[Tool]: The best matching tools, scored by cosine similarity, highest first.
+        """
+        if len(self) == 0 or query_vector is None or top_k <= 0:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        rows = None
+        if allowed_tools:
+            rows = np.asarray([self.id_to_row[i] for i in allowed_tools if i in self.id_to_row], dtype=np.int64)
+        if servers:
+            server_rows = np.concatenate([self.server_rows[s] for s in servers if s in self.server_rows] or [np.zeros(0, dtype=np.int64)])
+            rows = server_rows if rows is None else np.intersect1d(rows, server_rows)
+
+        all_rows = rows is None
+        if all_rows:
+            rows = np.arange(len(self))
+        elif rows.size == 0:
+            return []
+
+        shortlist_size = max(self.shortlist_size, top_k)
+        if self.prefix_vectors is not None and not exact and rows.size > shortlist_size:
+            # First pass on the prefixes, second pass at full dimension over the shortlist only
+            prefix_query = query[:self.prefix_dims] / (np.linalg.norm(query[:self.prefix_dims]) or 1.0)
+            prefix_scores = self.prefix_vectors @ prefix_query if all_rows else self.prefix_vectors[rows] @ prefix_query
+            rows = rows[np.argpartition(-prefix_scores, shortlist_size - 1)[:shortlist_size]]
+            scores = self.vectors[rows] @ query
+        elif all_rows:
+            # Score the whole matrix in place rather than gathering a copy of every row
+            scores = self.vectors @ query
+        else:
+            scores = self.vectors[rows] @ query
+        if rows.size > top_k:
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            best = np.arange(rows.size)
+        best = best[np.argsort(-scores[best])]
+
+        return [Tool(
+            id=self.ids[row],
+            server=self.servers[row],
+            toolset=self.toolsets[row],
+            name=self.names[row],
+            description=self.descriptions[row],
+            tool_vector=[],
+            score=float(scores[i]),
+        ) for i, row in ((i, int(rows[i])) for i in best)]
+
+    def to_documents(self) -> List[Dict[str, Any]]:
+        """Return the index contents as tool documents."""
+        return [{
+            "id": self.ids[row],
+            "server": self.servers[row],
+            "toolset": self.toolsets[row],
+            "name": self.names[row],
+            "description": self.descriptions[row],
+            "tool_vector": self.vectors[row].tolist()
+        } for row in range(len(self))]
+
+    def save_to_file(self, file_path: str) -> None:
+        """
+        Save the index documents to a JSON file.
+        Args:
+            file_path (str): The path to write the index to.
+        """
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump({"tools": self.to_documents()}, f)
+        logging.info(f"Saved local tool index with {len(self)} tools to '{file_path}'.")
+
+    @classmethod
+    def load_from_file(cls, file_path: str) -> Optional["LocalToolIndex"]:
+        """
+        Load an index from a JSON file written by save_to_file.
+        Args:
+            file_path (str): The path to the index file.
+        Returns:
+            LocalToolIndex: The loaded index, or None if the file is missing or invalid.
+        """
+        if not file_path or not os.path.exists(file_path):
+            logging.info(f"No local tool index found at '{file_path}'.")
+            return None
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                return cls(json.load(f).get("tools", []))
+        except Exception as e:
+            logging.error(f"Error loading local tool index from '{file_path}': {e}")
+            return None
+
+    def publish_shared(self, directory: str) -> None:
+        """
+        Publish the index into a shared directory, ideally on tmpfs such as /dev/shm, so other processes can attach to it.
+        Vectors are written as a raw .npy block that attaching processes memory-map, so the pages are shared between them.
+        Files are written under temporary names and renamed into place.
+        Args:
+            directory (str): The directory to publish to.
+        """
+        os.makedirs(directory, exist_ok=True)
+        vectors_path = os.path.join(directory, "vectors.npy")
+        metadata_path = os.path.join(directory, "metadata.json")
+        np.save(vectors_path + ".tmp.npy", np.ascontiguousarray(self.vectors, dtype=np.float32))
+        with open(metadata_path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(self.metadata(), f)
+        os.replace(vectors_path + ".tmp.npy", vectors_path)
+        os.replace(metadata_path + ".tmp", metadata_path)
+        logging.info(f"Published local tool index with {len(self)} tools to '{directory}'.")
+
+    @classmethod
+    def attach_shared(cls, directory: str) -> Optional["LocalToolIndex"]:
+        """
+        Attach read-only to an index published with publish_shared.
+        Args:
+            directory (str): The directory the index was published to.
+        Returns:
+            LocalToolIndex: The attached index, or None if nothing has been published there.
+        """
+        vectors_path = os.path.join(directory, "vectors.npy")
+        metadata_path = os.path.join(directory, "metadata.json")
+        if not os.path.exists(vectors_path) or not os.path.exists(metadata_path):
+            logging.info(f"No shared tool index found at '{directory}'.")
+            return None
+        try:
+            with open(metadata_path, 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+            vectors = np.load(vectors_path, mmap_mode='r')
+            index = cls.from_arrays(metadata, vectors)
+            index.storage = "shared"
+            return index
+        except Exception as e:
+            logging.error(f"Error attaching to shared tool index at '{directory}': {e}")
+            return None
@@ -0,0 +1,295 @@
+import os, json, time, glob, asyncio, logging
+import numpy as np
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+from utils_local_index import LocalToolIndex
+from utils_snapshot import read_snapshot
+from utils_azure_search import AzureSearchManager, SERVERS_WITH_MORE_THAN_5_TOOLS, create_registry_documents, registry_tool_id
+
+
+def compute_tool_delta(current_index: Optional[LocalToolIndex], documents: List[Dict[str, Any]]) -> Dict[str, List]:
+    """
+    Compare registry tool documents against the local index, tool by tool.
+    Tools are matched on (server, toolset, name). A matched tool whose description differs is changed and keeps its id.
+    Args:
+        current_index (LocalToolIndex): The index currently serving, or None.
+        documents (List[Dict[str, Any]]): Tool documents from create_registry_documents.
+    Returns:
+        Dict[str, List]: "added" and "changed" documents (changed ones carry the existing id), "unchanged" index rows
+        and "removed" index rows.
+    """
+    current_rows: Dict[Tuple[str, str, str], int] = {}
+    if current_index is not None:
+        for row, key in enumerate(zip(current_index.servers, current_index.toolsets, current_index.names)):
+            current_rows[key] = row
+
+    delta = {"added": [], "changed": [], "unchanged": [], "removed": []}
+    seen_rows = set()
+    for document in documents:
+        key = (document["server"], document["toolset"], document["name"])
+        row = current_rows.get(key)
+        if row is None or row in seen_rows:
+            delta["added"].append(document)
+            continue
+        seen_rows.add(row)
+        if current_index.descriptions[row] == document["description"]:
+            delta["unchanged"].append(row)
+        else:
+            delta["changed"].append({**document, "id": current_index.ids[row]})
+    delta["removed"] = [row for row in current_rows.values() if row not in seen_rows]
+    return delta
+
+
+def apply_tool_delta(current_index: Optional[LocalToolIndex], delta: Dict[str, List], vectors: Dict[str, List[float]]) -> LocalToolIndex:
+    """
+    Build a shadow copy of the local index with the delta applied. The current index is not modified.
+    Unchanged tools reuse their rows' vectors, added and changed tools take their new embeddings.
+    Args:
+        current_index (LocalToolIndex): The index currently serving, or None.
+        delta (Dict[str, List]): The delta from compute_tool_delta. Added documents must have an id.
+        vectors (Dict[str, List[float]]): New embeddings of the added and changed tools, by tool id.
+    Returns:
+        LocalToolIndex: The new index.
+    """
+    rows = delta["unchanged"]
+    metadata = {
+        "ids": [current_index.ids[row] for row in rows],
+        "servers": [current_index.servers[row] for row in rows],
+        "toolsets": [current_index.toolsets[row] for row in rows],
+        "names": [current_index.names[row] for row in rows],
+        "descriptions": [current_index.descriptions[row] for row in rows]
+    } if rows else {"ids": [], "servers": [], "toolsets": [], "names": [], "descriptions": []}
+    blocks = [np.asarray(current_index.vectors[np.asarray(rows, dtype=np.int64)], dtype=np.float32)] if rows else []
+
+    new_documents = [doc for doc in delta["changed"] + delta["added"] if vectors.get(doc["id"]) is not None]
+    for doc in new_documents:
+        metadata["ids"].append(doc["id"])
+        metadata["servers"].append(doc["server"])
+        metadata["toolsets"].append(doc["toolset"])
+        metadata["names"].append(doc["name"])
+        metadata["descriptions"].append(doc["description"])
+    if new_documents:
+        blocks.append(LocalToolIndex._normalize_rows(np.asarray([vectors[doc["id"]] for doc in new_documents], dtype=np.float32)))
+
+    return LocalToolIndex.from_arrays(metadata, np.vstack(blocks) if blocks else np.zeros((0, 0), dtype=np.float32))
+
+
+class RegistryWatcher():
+    """Watches the tool registry file or a snapshot directory and hot-swaps the router's local index when it changes."""
+
+    def __init__(self, router, source: str, interval: float = 5.0, sync_azure_index: bool = False, max_concurrent_embeddings: int = 16):
+        """
+        Args:
+            router (ToolRouter): The router whose local index is replaced.
+            source (str): A registry JSON file, or a directory of binary snapshots of which the newest is served.
+            interval (float): Seconds between checks for a change.
+            sync_azure_index (bool): Whether to also apply registry deltas to the Azure Search index.
+            max_concurrent_embeddings (int): Embedding requests in flight at the same time during a reload.
+        """
+        self.router = router
+        self.source = source
+        self.interval = max(interval, 0.1)
+        self.sync_azure_index = sync_azure_index
+        self.max_concurrent_embeddings = max(max_concurrent_embeddings, 1)
+        self.source_type = "snapshot_dir" if os.path.isdir(source) else "registry"
+
+        self.last_signature = None
+        self.reloads = 0
+        self.failures = 0
+        self.last_reload = None
+        self.last_delta = None
+        self.last_error = None
+
+    def current_file(self) -> Optional[str]:
+        """Return the file to load: the registry itself or the newest snapshot in the directory."""
+        if self.source_type == "registry":
+            return self.source if os.path.exists(self.source) else None
+        snapshots = glob.glob(os.path.join(self.source, "*.snapshot"))
+        return max(snapshots, key=os.path.getmtime) if snapshots else None
+
+    def signature(self) -> Optional[tuple]:
+        """Cheap change check: the current file's path, size and modification time."""
+        file_path = self.current_file()
+        if file_path is None:
+            return None
+        stat = os.stat(file_path)
+        return (file_path, stat.st_size, stat.st_mtime_ns)
+
+    async def run(self) -> None:
+        """
+        Poll the source until cancelled. The first check compares the source against the serving index,
+        so changes made while the server was down are applied at startup. A snapshot directory whose newest
+        snapshot is already serving is taken as loaded.
+        """
+        file_path = self.current_file()
+        if self.source_type == "snapshot_dir" and self.router.local_index is not None and file_path and self.router.snapshot_file \
+                and os.path.abspath(file_path) == os.path.abspath(self.router.snapshot_file):
+            self.last_signature = self.signature()
+        logging.info(f"Watching {self.source_type} '{self.source}' for tool registry changes every {self.interval}s.")
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                logging.error(f"Error reloading tool registry from '{self.source}': {e}")
+            await asyncio.sleep(self.interval)
+
+    async def check(self) -> bool:
+        """
+        Reload the source if it changed since the last check.
+        A reload that fails raises before the signature is recorded, so the same source is retried on the next check.
+        Returns:
+            bool: True if a new index was swapped in, False if nothing changed.
+        """
+        signature = self.signature()
+        if signature is None or signature == self.last_signature:
+            return False
+        if self.source_type == "registry":
+            swapped = await self.reload_registry(signature[0])
+        else:
+            swapped = await self.reload_snapshot(signature[0])
+        self.last_signature = signature
+        return swapped
+
+    async def reload_registry(self, file_path: str) -> bool:
+        """
+        Apply a registry file to a shadow copy of the local index, embedding only added and changed tools.
+        Args:
+            file_path (str): The registry JSON file.
+        Returns:
+            bool: True if the new index was swapped in, False if no tool differs from the serving index.
+        Raises:
+            RuntimeError: If tools could not be embedded or the Azure Search index could not be read or updated.
+                The current index keeps serving.
+        """
+        start_time = time.time()
+        with open(file_path, 'r', encoding='utf-8') as f:
+            mcp_servers = json.load(f)
+        documents = []
+        for server in mcp_servers.get("servers", []):
+            if server.get("name") in SERVERS_WITH_MORE_THAN_5_TOOLS:
+                documents.extend(create_registry_documents(server))
+
+        manager: AzureSearchManager = self.router.azure_search_manager
+        current_index = self.router.local_index
+        delta = compute_tool_delta(current_index, documents)
+
+        azure_ids, stale_azure_ids = {}, []
+        if self.sync_azure_index and current_index is None:
+            # With no serving index, e.g. after ingest_mcp_servers.py, nothing mirrors Azure's ids. Match the tools
+            # to the documents already in Azure, so they are updated in place rather than added a second time.
+            azure_documents = await manager.get_tool_documents()
+            if azure_documents is None:
+                raise RuntimeError("Could not read the Azure Search index to match tool ids. The local index was not swapped.")
+            registry_keys = {(doc["server"], doc["toolset"], doc["name"]) for doc in documents}
+            for azure_doc in azure_documents:
+                key = (azure_doc["server"], azure_doc["toolset"], azure_doc["name"])
+                if key in registry_keys and key not in azure_ids:
+                    azure_ids[key] = azure_doc["id"]
+                else:
+                    stale_azure_ids.append(azure_doc["id"])
+
+        # Derived ids, so every worker gives an added tool the same id and the Azure sync upserts one document
+        for doc in delta["added"]:
+            key = (doc["server"], doc["toolset"], doc["name"])
+            doc["id"] = azure_ids.get(key) or registry_tool_id(*key)
+        if not delta["added"] and not delta["changed"] and not delta["removed"]:
+            logging.info(f"Tool registry '{file_path}' has no tools that differ from the serving index.")
+            return False
+
+        # Bounded like an index build, so a large delta does not flood the embedding deployment
+        semaphore = asyncio.Semaphore(self.max_concurrent_embeddings)
+        to_embed = delta["changed"] + delta["added"]
+        embeddings = await asyncio.gather(*[manager.create_background_embedding(doc["embedding_text"], semaphore) for doc in to_embed])
+        vectors = {doc["id"]: vector for doc, vector in zip(to_embed, embeddings)}
+        missing = [doc["name"] for doc in to_embed if vectors[doc["id"]] is None]
+        if missing:
+            # Keep serving the current index rather than swap in one with tools missing
+            raise RuntimeError(f"Could not embed {len(missing)} tools, e.g. '{missing[0]}'. The local index was not swapped.")
+
+        new_index = await asyncio.to_thread(apply_tool_delta, current_index, delta, vectors)
+
+        if self.sync_azure_index:
+            synced = await manager.apply_tool_delta(
+                upserts=[{
+                    "id": doc["id"],
+                    "server": doc["server"],
+                    "toolset": doc["toolset"],
+                    "name": doc["name"],
+                    "description": doc["description"],
+                    "tool_vector": vectors[doc["id"]]
+                } for doc in to_embed],
+                deletes=[current_index.ids[row] for row in delta["removed"]] + stale_azure_ids
+            )
+            if not synced:
+                # Raising keeps the source marked as changed, so the whole delta is retried on the next check
+                # instead of the local index moving ahead of Azure Search
+                raise RuntimeError("Could not apply the tool delta to the Azure Search index. The local index was not swapped.")
+
+        self.finish_reload(new_index, file_path, {
+            "added": len(delta["added"]),
+            "changed": len(delta["changed"]),
+            "removed": len(delta["removed"]),
+            "unchanged": len(delta["unchanged"])
+        }, start_time)
+        return True
+
+    async def reload_snapshot(self, file_path: str) -> bool:
+        """
+        Load the newest snapshot off the event loop and swap it in. Snapshot vectors are precomputed, so nothing is embedded.
+        Args:
+            file_path (str): The snapshot file.
+        Returns:
+            bool: True if the new index was swapped in.
+        Raises:
+            RuntimeError: If the snapshot could not be loaded, e.g. while it is still being copied.
+        """
+        start_time = time.time()
+        new_index = await asyncio.to_thread(read_snapshot, file_path, self.router.verify_snapshot_checksum)
+        if new_index is None:
+            raise RuntimeError(f"Could not load snapshot '{file_path}'")
+
+        current_index = self.router.local_index
+        current_ids = set(current_index.ids) if current_index is not None else set()
+        new_ids = set(new_index.ids)
+        changed = 0
+        if current_index is not None:
+            changed = sum(1 for tool_id in new_ids & current_ids
+                          if current_index.descriptions[current_index.id_to_row[tool_id]] != new_index.descriptions[new_index.id_to_row[tool_id]])
+        self.finish_reload(new_index, file_path, {
+            "added": len(new_ids - current_ids),
+            "changed": changed,
+            "removed": len(current_ids - new_ids),
+            "unchanged": len(new_ids & current_ids) - changed
+        }, start_time)
+        return True
+
+    def finish_reload(self, new_index: LocalToolIndex, file_path: str, delta: Dict[str, int], start_time: float) -> None:
+        """Swap the new index into the router and record the reload."""
+        index_version = self.router.swap_local_index(new_index)
+        self.reloads += 1
+        self.last_error = None
+        self.last_delta = delta
+        self.last_reload = {
+            "file": os.path.abspath(file_path),
+            "index_version": index_version,
+            "tool_count": len(new_index),
+            "reload_time_ms": (time.time() - start_time) * 1000,
+            "timestamp": datetime.now().isoformat()
+        }
+        logging.info(f"Swapped in tool index version {index_version} from '{file_path}': {delta}.")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the watcher state for the status endpoint."""
+        return {
+            "source": self.source,
+            "source_type": self.source_type,
+            "interval_seconds": self.interval,
+            "sync_azure_index": self.sync_azure_index,
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_reload": self.last_reload,
+            "last_delta": self.last_delta,
+            "last_error": self.last_error
+        }
@@ -0,0 +1,142 @@
+import asyncio, logging, time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the upstream's circuit breaker is open."""
+
+
+class Deadline():
+    """Latency budget for one request, shared by every upstream call made while serving it."""
+
+    def __init__(self, budget_seconds: float = None):
+        """
+        Args:
+            budget_seconds (float): The total time the request may take. None or 0 means no budget.
+        """
+        self.budget_seconds = budget_seconds if budget_seconds and budget_seconds > 0 else None
+        self.expires_at = time.monotonic() + self.budget_seconds if self.budget_seconds else None
+
+    def remaining(self, reserve: float = 0.0) -> Optional[float]:
+        """
+        Seconds left in the budget, or None when there is no budget.
+        Args:
+            reserve (float): Seconds held back, e.g. for a fallback after this call.
+        """
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - reserve - time.monotonic(), 0.0)
+
+    def expired(self, reserve: float = 0.0) -> bool:
+        """True once the budget, less the reserve, is used up."""
+        return self.expires_at is not None and time.monotonic() >= self.expires_at - reserve
+
+
+class CircuitBreaker():
+    """Circuit breaker for one upstream service. Trips on error rate, counting slow calls as errors."""
+
+    def __init__(self, name: str, failure_rate_threshold: float = 0.5, slow_call_seconds: float = 2.0,
+                 window_size: int = 20, minimum_calls: int = 5, reset_timeout: float = 30.0):
+        """
+        Args:
+            name (str): The upstream name used in logs and status.
+            failure_rate_threshold (float): The share of failed calls in the window that opens the breaker.
+            slow_call_seconds (float): Calls slower than this count as failures.
+            window_size (int): The number of recent calls considered.
+            minimum_calls (int): The number of calls needed in the window before the breaker can open.
+            reset_timeout (float): Seconds the breaker stays open before letting a trial call through.
+        """
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.minimum_calls = minimum_calls
+        self.reset_timeout = reset_timeout
+
+        self.state = "closed"
+        self.outcomes = deque(maxlen=window_size)
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.times_opened = 0
+        self.rejected_calls = 0
+
+    def allow(self) -> bool:
+        """Return True if a call may be made now."""
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.rejected_calls += 1
+                return False
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self.trial_in_flight:
+                self.rejected_calls += 1
+                return False
+            self.trial_in_flight = True
+        return True
+
+    def record(self, success: bool, latency: float) -> None:
+        """
+        Record the outcome of a call.
+        Args:
+            success (bool): Whether the call returned without error.
+            latency (float): The call duration in seconds.
+        """
+        failed = not success or latency > self.slow_call_seconds
+
+        if self.state == "half_open":
+            self.trial_in_flight = False
+            if failed:
+                self._open()
+            else:
+                logging.info(f"Circuit breaker '{self.name}' closed.")
+                self.state = "closed"
+                self.outcomes.clear()
+            return
+
+        self.outcomes.append(failed)
+        if self.state == "closed" and len(self.outcomes) >= self.minimum_calls and self.failure_rate() >= self.failure_rate_threshold:
+            self._open()
+
+    def failure_rate(self) -> float:
+        """Share of failed calls in the current window."""
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    async def call(self, func: Callable[[], Any], timeout: float = None) -> Any:
+        """
+        Run a blocking upstream call in a worker thread, bounded by the timeout and guarded by the breaker.
+        Args:
+            func (Callable[[], Any]): The blocking call to make.
+            timeout (float): Seconds to wait for the call. None waits indefinitely.
+        Returns:
+            Any: The result of func.
+        Raises:
+            CircuitOpenError: If the breaker is open.
+            asyncio.TimeoutError: If the call does not finish within the timeout.
+        """
+        if not self.allow():
+            raise CircuitOpenError(f"Circuit breaker '{self.name}' is open")
+        start_time = time.monotonic()
+        try:
+            result = await asyncio.wait_for(asyncio.to_thread(func), timeout=timeout)
+        except BaseException:
+            self.record(False, time.monotonic() - start_time)
+            raise
+        self.record(True, time.monotonic() - start_time)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the breaker state and counters."""
+        return {
+            "state": self.state,
+            "failure_rate": self.failure_rate(),
+            "window_calls": len(self.outcomes),
+            "times_opened": self.times_opened,
+            "rejected_calls": self.rejected_calls
+        }
+
+    def _open(self) -> None:
+        """Open the breaker and start the reset timer."""
+        logging.warning(f"Circuit breaker '{self.name}' opened (failure rate {self.failure_rate():.2f}).")
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
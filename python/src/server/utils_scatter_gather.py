@@ -0,0 +1,322 @@
+import os, sys, time, asyncio, logging, subprocess
+import httpx
+from typing import List, Dict, Any, Tuple
+from utils_objects import Tool, ToolResults
+from utils_compact import compact_tools
+
+# Damping constant of reciprocal rank fusion. Larger values flatten the gap between a shard's first and later tools.
+RANK_CONSTANT = 60
+# Breaks ties between tools at the same rank on different shards, by the evidence behind their scores
+SCORE_TYPE_STRENGTH = {"reranker": 2, "vector": 1, "lexical": 0}
+
+
+def parse_shards(value: str) -> List[Tuple[str, str]]:
+    """
+    Parse a shard list such as "github=http://10.0.0.5:8000,http://10.0.0.6:8000".
+    Args:
+        value (str): Comma-separated shard URLs, each optionally prefixed with "name=".
+    Returns:
+        List[Tuple[str, str]]: (name, base URL) per shard. Unnamed shards are named after their URL.
+    """
+    shards = []
+    for entry in (value or "").split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        # Only a "name=" before the scheme is a name. Query strings in the URL may hold '=' too.
+        name, _, url = entry.partition('=') if '=' in entry.split('://')[0] else ("", "", entry)
+        url = url.strip().rstrip('/')
+        shards.append((name.strip() or url, url))
+    return shards
+
+
+def score_type(kwargs: Dict[str, Any]) -> str:
+    """
+    Tell which scale a shard's tool scores are on, from the serving mode it reported.
+    The router only caches reranked results, so cached tools are on the reranker scale.
+    Args:
+        kwargs (Dict[str, Any]): The shard response kwargs.
+    Returns:
+        str: "reranker" (0 to 4), "vector" (cosine similarity) or "lexical" (unbounded keyword score).
+    """
+    serving_mode = kwargs.get("serving_mode")
+    if serving_mode == "lexical":
+        return "lexical"
+    if serving_mode == "local" or (kwargs.get("retrieval") or {}).get("reranked") is False:
+        return "vector"
+    return "reranker"
+
+
+def normalize_shard_scores(tools: List[Dict[str, Any]]) -> List[float]:
+    """
+    Put one shard's tool scores on a shared 0 to 1 scale, so tools from different shards can be merged.
+    Reranker, cosine and lexical scores have no common scale, so a tool is scored by its rank within its shard,
+    as in reciprocal rank fusion, scaled so that each shard's first tool scores 1.
+    Args:
+        tools (List[Dict[str, Any]]): The shard's tools.
+    Returns:
+        List[float]: One normalized score per tool.
+    """
+    order = sorted(range(len(tools)), key=lambda i: tools[i].get("score") or 0.0, reverse=True)
+    scores = [0.0] * len(tools)
+    for rank, i in enumerate(order):
+        scores[i] = (RANK_CONSTANT + 1) / (RANK_CONSTANT + 1 + rank)
+    return scores
+
+
+class HttpShard():
+    """A shard router reached over HTTP, either a peer node or a local shard process."""
+
+    def __init__(self, name: str, url: str, client: httpx.AsyncClient, token: str = None):
+        """
+        Args:
+            name (str): The shard name used in responses and status.
+            url (str): The shard's base URL, e.g. http://127.0.0.1:8101.
+            client (httpx.AsyncClient): The shared HTTP client.
+            token (str): Optional bearer token sent to the shard when the caller sent none.
+        """
+        self.name = name
+        self.url = url
+        self.client = client
+        self.token = token
+        self.requests = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.total_latency = 0.0
+        self.last_error = None
+
+    async def route(self, body: Dict[str, Any], timeout: float, token: str = None) -> Dict[str, Any]:
+        """
+        Route a query on the shard.
+        Args:
+            body (Dict[str, Any]): The /get_mcp_tools/ request body.
+            timeout (float): Seconds to wait for the shard.
+            token (str): The caller's bearer token, forwarded in place of the configured one.
+        Returns:
+            Dict[str, Any]: The shard's ToolResults as JSON.
+        Raises:
+            asyncio.TimeoutError: If the shard does not answer in time.
+            Exception: If the request fails or the shard returns an error.
+        """
+        token = token or self.token
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        response = await asyncio.wait_for(self.client.put(f"{self.url}/get_mcp_tools/", json=body, headers=headers, timeout=timeout), timeout=timeout)
+        response.raise_for_status()
+        payload = response.json()
+        # The endpoint answers [] when nothing matched
+        if isinstance(payload, list):
+            return {"tools": payload, "kwargs": {}}
+        if "error" in payload:
+            raise RuntimeError(payload["error"])
+        return payload
+
+    async def ready(self, timeout: float) -> bool:
+        """
+        Ask the shard's readiness probe whether it is ready.
+        Args:
+            timeout (float): Seconds to wait for the shard.
+        Returns:
+            bool: True if /readyz answered 200.
+        """
+        try:
+            response = await asyncio.wait_for(self.client.get(f"{self.url}/readyz", timeout=timeout), timeout=timeout)
+            return response.status_code == 200
+        except Exception as e:
+            self.last_error = str(e)
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the shard's request counters."""
+        return {
+            "url": self.url,
+            "requests": self.requests,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "mean_latency_ms": self.total_latency / self.requests * 1000 if self.requests else 0.0,
+            "last_error": self.last_error
+        }
+
+
+class ScatterGatherCoordinator():
+    """
+    Routes each query across several shard routers, each holding part of the tool catalog, e.g. split by server or tenant.
+    The query is fanned out to every shard in parallel and their top-k lists are merged on normalized scores.
+    A shard that is slow or failing is left out of that response instead of failing it.
+    """
+
+    def __init__(self, shards: List[Tuple[str, str]], shard_timeout_ms: int = 1000, min_shards: int = 1,
+                 latency_budget_ms: int = 0, token: str = None, ready_check_interval: float = 10.0):
+        """
+        Args:
+            shards (List[Tuple[str, str]]): (name, base URL) per shard.
+            shard_timeout_ms (int): The most time any shard may take.
+            min_shards (int): Shards that must answer. With fewer the response is reported as unavailable.
+            latency_budget_ms (int): Default request budget. A shard gets the smaller of this and shard_timeout_ms.
+            token (str): Optional bearer token sent to the shards when the caller sent none.
+            ready_check_interval (float): Seconds between shard readiness checks while fewer than min_shards are ready.
+        """
+        self.type = "coordinator"
+        self.client = httpx.AsyncClient()
+        self.shards = [HttpShard(name, url, self.client, token=token) for name, url in shards]
+        self.shard_timeout = shard_timeout_ms / 1000
+        self.min_shards = max(min_shards, 1)
+        self.latency_budget_ms = latency_budget_ms
+        self.ready_check_interval = ready_check_interval
+        self.requests = 0
+        self.partial_responses = 0
+        self.ready_shards = 0
+
+    async def check_ready(self) -> bool:
+        """
+        Probe every shard's /readyz in parallel.
+        Returns:
+            bool: True if at least min_shards shards are ready.
+        """
+        results = await asyncio.gather(*[shard.ready(self.shard_timeout) for shard in self.shards])
+        self.ready_shards = sum(results)
+        return self.ready_shards >= self.min_shards
+
+    async def query_shard(self, shard: HttpShard, body: Dict[str, Any], timeout: float, token: str = None) -> Dict[str, Any]:
+        """
+        Route on one shard and record how it went.
+        Args:
+            shard (HttpShard): The shard.
+            body (Dict[str, Any]): The request body.
+            timeout (float): Seconds to wait.
+            token (str): The caller's bearer token.
+        Returns:
+            Dict[str, Any]: A shard report with its status, latency, serving mode and tools.
+        """
+        start_time = time.perf_counter()
+        shard.requests += 1
+        report = {"shard": shard.name, "status": "ok", "latency_ms": 0.0, "serving_mode": None, "tools": []}
+        try:
+            payload = await shard.route(body, timeout, token=token)
+            kwargs = payload.get("kwargs") or {}
+            report["serving_mode"] = kwargs.get("serving_mode")
+            if report["serving_mode"] == "unavailable":
+                # The shard answered, but none of its upstreams or fallbacks could serve the query
+                shard.failures += 1
+                shard.last_error = "Shard reported serving_mode 'unavailable'"
+                report["status"] = "unavailable"
+            else:
+                tools = payload.get("tools") or []
+                report.update({"tools": tools, "scores": normalize_shard_scores(tools), "strength": SCORE_TYPE_STRENGTH[score_type(kwargs)]})
+        except (asyncio.TimeoutError, httpx.TimeoutException):
+            shard.timeouts += 1
+            report["status"] = "timeout"
+        except Exception as e:
+            shard.failures += 1
+            shard.last_error = str(e)
+            report["status"] = "error"
+            logging.error(f"Error routing on shard '{shard.name}': {e}")
+        report["latency_ms"] = (time.perf_counter() - start_time) * 1000
+        shard.total_latency += report["latency_ms"] / 1000
+        return report
+
+    async def route(self, query: str, top_k: int = 10, allowed_tools: List[str] = [], routing_mode: str = None,
+                    latency_budget_ms: int = None, context: Dict[str, Any] = None, token: str = None) -> ToolResults:
+        """
+        Fan a query out to every shard and merge their results. Takes the same arguments as ToolRouter.route,
+        plus the caller's bearer token, which is forwarded to the shards.
+        Returns:
+            ToolResults: The merged top_k tools, scored 0 to 1, with a per-shard report in kwargs.
+        """
+        start_execution_time = time.time()
+        self.requests += 1
+        budget_ms = latency_budget_ms if latency_budget_ms is not None else self.latency_budget_ms
+        timeout = min(self.shard_timeout, budget_ms / 1000) if budget_ms else self.shard_timeout
+
+        body = {"query": query, "top_k": top_k, "allowed_tools": allowed_tools}
+        if budget_ms:
+            # Shards get most of the timeout as their own budget, so they fall back to a degraded mode before the coordinator gives up on them.
+            # Without a budget from the caller or the coordinator, shards use their own LATENCY_BUDGET_MS.
+            body["latency_budget_ms"] = int(timeout * 800)
+        elif latency_budget_ms == 0:
+            # A caller's explicit 0 disables budgets on the shards too
+            body["latency_budget_ms"] = 0
+        if routing_mode:
+            body["routing_mode"] = routing_mode
+        if context:
+            body["context"] = context
+        reports = await asyncio.gather(*[self.query_shard(shard, body, timeout, token=token) for shard in self.shards])
+
+        # A tool served by more than one shard, e.g. replicas, keeps its best score
+        merged: Dict[str, Tool] = {}
+        strengths: Dict[str, int] = {}
+        for report in reports:
+            tools, scores, strength = report.pop("tools"), report.pop("scores", []), report.pop("strength", 0)
+            report["tool_count"] = len(tools)
+            for tool, score in zip(tools, scores):
+                if tool.get("id") and (tool["id"] not in merged or (merged[tool["id"]].score, strengths[tool["id"]]) < (score, strength)):
+                    strengths[tool["id"]] = strength
+                    merged[tool["id"]] = Tool(
+                        tool_vector=tool.get("tool_vector") or [],
+                        id=tool["id"],
+                        server=tool.get("server", ""),
+                        toolset=tool.get("toolset"),
+                        name=tool.get("name", ""),
+                        description=tool.get("description", ""),
+                        score=score
+                    )
+        tools = sorted(merged.values(), key=lambda tool: (tool.score, strengths[tool.id]), reverse=True)[:top_k]
+
+        answered = sum(1 for report in reports if report["status"] == "ok")
+        partial = answered < len(self.shards)
+        if partial:
+            self.partial_responses += 1
+            logging.warning(f"Served query '{query}' from {answered} of {len(self.shards)} shards.")
+        return ToolResults(
+            execution_time=time.time() - start_execution_time,
+            tools=tools,
+            kwargs={
+                "serving_mode": "scatter_gather" if answered >= self.min_shards else "unavailable",
+                "partial": partial,
+                "shards": reports,
+                "context": context
+            }
+        )
+
+    def compacts_by_default(self) -> bool:
+        """The coordinator only compacts when a request asks for it. Shards apply their own configuration."""
+        return False
+
+    def compact_results(self, results: ToolResults, max_tokens: int = None, max_bytes: int = None, description_mode: str = None) -> ToolResults:
+        """Fit merged results into a response budget, as ToolRouter.compact_results does but without duplicate detection."""
+        tools, compaction = compact_tools(results.tools or [], max_tokens=max_tokens, max_bytes=max_bytes, description_mode=description_mode or "full")
+        return ToolResults(execution_time=results.execution_time, tools=tools, kwargs={**(results.kwargs or {}), "compaction": compaction})
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the coordinator and per-shard counters."""
+        return {
+            "requests": self.requests,
+            "partial_responses": self.partial_responses,
+            "shard_timeout_ms": self.shard_timeout * 1000,
+            "min_shards": self.min_shards,
+            "ready_shards": self.ready_shards,
+            "shards": {shard.name: shard.stats() for shard in self.shards}
+        }
+
+    async def close(self) -> None:
+        """Close the shared HTTP client."""
+        await self.client.aclose()
+
+
+def launch_local_shards(shard_servers: List[str], base_port: int = 8101, host: str = "127.0.0.1") -> Tuple[List[subprocess.Popen], List[Tuple[str, str]]]:
+    """
+    Start one shard router process per server group on this machine, for running a sharded setup on one node.
+    Args:
+        shard_servers (List[str]): Comma-separated server names per shard, e.g. ["GitHub,Azure", "VSCode,Notion"].
+        base_port (int): The first shard's port. Later shards use the following ports.
+        host (str): The interface the shards listen on.
+    Returns:
+        Tuple[List[subprocess.Popen], List[Tuple[str, str]]]: The processes, and (name, URL) per shard for the coordinator.
+    """
+    processes, shards = [], []
+    run_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "run.py")
+    for i, servers in enumerate(shard_servers):
+        port = base_port + i
+        processes.append(subprocess.Popen([sys.executable, run_file, "--host", host, "--port", str(port), "--shard-servers", servers]))
+        shards.append((f"shard-{i}", f"http://{host}:{port}"))
+        logging.info(f"Started shard-{i} for servers '{servers}' on port {port}.")
+    return processes, shards
@@ -0,0 +1,195 @@
+import os, sys, json, time, struct, hashlib, logging, argparse, asyncio, mmap
+import numpy as np
+from datetime import datetime
+from typing import Dict, Any, Optional
+from utils_local_index import LocalToolIndex
+
+# Binary snapshot layout, all little-endian:
+#   header    fixed-size struct below
+#   info      UTF-8 JSON with build details
+#   offsets   uint64[string_count + 1], byte offsets into the string bytes
+#   strings   UTF-8 string bytes, each distinct string stored once
+#   rows      uint32[tool_count, 5], string ids of id, server, toolset, name and description per tool
+#   vectors   float32[tool_count, dimensions], row-normalized, 64-byte aligned
+# The checksum is the SHA-256 of every byte after the header.
+SNAPSHOT_MAGIC = b"MCPTIDX\x00"
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("<8sIIQQQQQQQQQ32s")
+METADATA_FIELDS = ["ids", "servers", "toolsets", "names", "descriptions"]
+
+
+def _align(offset: int, alignment: int = 64) -> int:
+    """Round offset up to the next multiple of alignment."""
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def write_snapshot(index: LocalToolIndex, file_path: str, info: Dict[str, Any] = None) -> Dict[str, Any]:
+    """
+    Compile a local tool index into a binary snapshot file.
+    The file is written under a temporary name and renamed into place, so readers never see a partial snapshot.
+    Args:
+        index (LocalToolIndex): The index to write.
+        file_path (str): The snapshot path.
+        info (Dict[str, Any]): Extra build details stored in the snapshot, e.g. the source registry.
+    Returns:
+        Dict[str, Any]: The snapshot info, including its checksum.
+    """
+    metadata = index.metadata()
+    string_ids: Dict[str, int] = {}
+    rows = np.zeros((len(index), len(METADATA_FIELDS)), dtype=np.uint32)
+    for column, field in enumerate(METADATA_FIELDS):
+        for row, value in enumerate(metadata[field]):
+            rows[row, column] = string_ids.setdefault(value or '', len(string_ids))
+
+    encoded_strings = [s.encode('utf-8') for s in string_ids.keys()]
+    string_offsets = np.zeros(len(encoded_strings) + 1, dtype=np.uint64)
+    string_offsets[1:] = np.cumsum([len(s) for s in encoded_strings], dtype=np.uint64)
+    string_bytes = b"".join(encoded_strings)
+
+    vectors = np.ascontiguousarray(index.vectors, dtype=np.float32)
+    dimensions = vectors.shape[1] if vectors.ndim == 2 and len(index) else 0
+    info = {
+        "created_at": datetime.now().isoformat(),
+        "tool_count": len(index),
+        "server_count": len(index.server_names),
+        "dimensions": dimensions,
+        **(info or {})
+    }
+    info_bytes = json.dumps(info).encode('utf-8')
+
+    # Lay out the sections after the header
+    info_offset = SNAPSHOT_HEADER.size
+    offsets_offset = _align(info_offset + len(info_bytes), 8)
+    strings_offset = offsets_offset + string_offsets.nbytes
+    rows_offset = _align(strings_offset + len(string_bytes), 8)
+    vectors_offset = _align(rows_offset + rows.nbytes)
+    total_size = vectors_offset + vectors.nbytes
+
+    body = bytearray(total_size - SNAPSHOT_HEADER.size)
+    def put(offset: int, data: bytes) -> None:
+        body[offset - SNAPSHOT_HEADER.size:offset - SNAPSHOT_HEADER.size + len(data)] = data
+    put(info_offset, info_bytes)
+    put(offsets_offset, string_offsets.tobytes())
+    put(strings_offset, string_bytes)
+    put(rows_offset, rows.tobytes())
+    put(vectors_offset, vectors.tobytes())
+    checksum = hashlib.sha256(body).digest()
+
+    header = SNAPSHOT_HEADER.pack(
+        SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, dimensions, len(index), len(encoded_strings),
+        info_offset, len(info_bytes), offsets_offset, strings_offset, len(string_bytes),
+        rows_offset, vectors_offset, checksum
+    )
+    temp_path = file_path + ".tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(header)
+        f.write(body)
+    os.replace(temp_path, file_path)
+
+    info["checksum"] = checksum.hex()
+    logging.info(f"Wrote snapshot with {len(index)} tools ({total_size} bytes) to '{file_path}'.")
+    return info
+
+
+def read_snapshot(file_path: str, verify_checksum: bool = True) -> Optional[LocalToolIndex]:
+    """
+    Memory-map a binary snapshot as a local tool index. The vectors stay in the mapped file and are not copied.
+    Args:
+        file_path (str): The snapshot path.
+        verify_checksum (bool): Whether to verify the SHA-256 checksum before using the snapshot.
+    Returns:
+        LocalToolIndex: The index, with the snapshot details in its snapshot_info attribute, or None if the
+        file is missing, of an unsupported format version or corrupt.
+    """
+    if not file_path or not os.path.exists(file_path):
+        logging.info(f"No snapshot found at '{file_path}'.")
+        return None
+
+    start_time = time.time()
+    try:
+        with open(file_path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, dimensions, tool_count, string_count, info_offset, info_length, offsets_offset,
+         strings_offset, strings_length, rows_offset, vectors_offset, checksum) = SNAPSHOT_HEADER.unpack_from(buffer, 0)
+
+        if magic != SNAPSHOT_MAGIC:
+            logging.error(f"'{file_path}' is not a tool index snapshot.")
+            return None
+        if version != SNAPSHOT_FORMAT_VERSION:
+            logging.error(f"Snapshot '{file_path}' has format version {version}, expected {SNAPSHOT_FORMAT_VERSION}.")
+            return None
+        if verify_checksum and hashlib.sha256(memoryview(buffer)[SNAPSHOT_HEADER.size:]).digest() != checksum:
+            logging.error(f"Snapshot '{file_path}' failed checksum verification.")
+            return None
+
+        info = json.loads(bytes(buffer[info_offset:info_offset + info_length]).decode('utf-8'))
+        string_offsets = np.frombuffer(buffer, dtype=np.uint64, count=string_count + 1, offset=offsets_offset)
+        string_bytes = buffer[strings_offset:strings_offset + strings_length]
+        strings = [string_bytes[int(start):int(end)].decode('utf-8') for start, end in zip(string_offsets[:-1], string_offsets[1:])]
+        rows = np.frombuffer(buffer, dtype=np.uint32, count=tool_count * len(METADATA_FIELDS), offset=rows_offset).reshape(tool_count, len(METADATA_FIELDS))
+        metadata = {field: [strings[i] for i in rows[:, column].tolist()] for column, field in enumerate(METADATA_FIELDS)}
+        vectors = np.frombuffer(buffer, dtype=np.float32, count=tool_count * dimensions, offset=vectors_offset).reshape(tool_count, dimensions)
+    except Exception as e:
+        logging.error(f"Error reading snapshot '{file_path}': {e}")
+        return None
+
+    index = LocalToolIndex.from_arrays(metadata, vectors)
+    index.storage = "snapshot"
+    index.snapshot_info = {
+        **info,
+        "path": os.path.abspath(file_path),
+        "format_version": version,
+        "checksum": checksum.hex(),
+        "load_time_ms": (time.time() - start_time) * 1000
+    }
+    logging.info(f"Loaded snapshot '{file_path}' with {tool_count} tools in {index.snapshot_info['load_time_ms']:.1f} ms.")
+    return index
+
+
+async def build_snapshot_from_registry(registry_path: str, ids_from: str = None) -> Optional[LocalToolIndex]:
+    """
+    Embed the tools of an MCP server registry file into a local tool index, the same tools that are ingested into Azure Search.
+    Tools found in the ids_from index keep their ids. Others get the id derived from their server, toolset and name, as at ingest.
+    Args:
+        registry_path (str): The path to the mcp_servers.json registry.
+        ids_from (str): Optional local tool index JSON whose ids are kept, e.g. the one written at ingest time.
+    Returns:
+        LocalToolIndex: The index, or None if any tool could not be embedded.
+    """
+    from utils_azure_search import AzureSearchManager
+    existing_ids = None
+    if ids_from and os.path.exists(ids_from):
+        existing_index = LocalToolIndex.load_from_file(ids_from)
+        if existing_index is not None:
+            existing_ids = {key: existing_index.ids[row] for row, key in enumerate(zip(existing_index.servers, existing_index.toolsets, existing_index.names))}
+    azure_search_manager = AzureSearchManager()
+    documents = await azure_search_manager.build_tool_documents(registry_path, existing_ids=existing_ids)
+    missing = sum(1 for document in documents if not document.get("tool_vector"))
+    if missing:
+        logging.error(f"Could not embed {missing} of {len(documents)} tools from '{registry_path}'.")
+        return None
+    return LocalToolIndex(documents)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile the tool registry into a binary index snapshot")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--from-index", help="Local tool index JSON written by create_tools_from_file. Keeps Azure Search ids.")
+    source.add_argument("--registry", help="MCP server registry JSON. Every tool is re-embedded.")
+    parser.add_argument("--ids-from", default="python/src/server/data/local_tool_index.json", help="With --registry, keep the tool ids of this local tool index if it exists")
+    parser.add_argument("--output", required=True, help="Snapshot file to write")
+    parser.add_argument("--version", default="", help="Label stored in the snapshot, e.g. a release or registry revision")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.from_index:
+        local_index = LocalToolIndex.load_from_file(args.from_index)
+        source_path = args.from_index
+    else:
+        local_index = asyncio.run(build_snapshot_from_registry(args.registry, ids_from=args.ids_from))
+        source_path = args.registry
+    if local_index is None:
+        sys.exit(f"Could not load '{source_path}'.")
+
+    snapshot_info = write_snapshot(local_index, args.output, info={"source": os.path.abspath(source_path), "version": args.version})
+    print(json.dumps(snapshot_info, indent=4))